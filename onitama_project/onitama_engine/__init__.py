@@ -1,2 +1,4 @@
 from .constants import Color
 from .onitama import Onitama
+from .state import GameState
+from .symmetry import canonical
@@ -1,5 +1,38 @@
+import argparse
+
+from onitama_engine.book import OpeningBook
+from onitama_engine.constants import Color
+from onitama_engine.mcts import MCTSPlayer
 from onitama_engine.onitama import Onitama
+from onitama_engine.search import SearchPlayer
 
 if __name__ == "__main__":
-    game = Onitama()
+    parser = argparse.ArgumentParser(prog="onitama_engine")
+    parser.add_argument(
+        "--ai",
+        choices=["red", "blue", "both"],
+        help="let the engine play one or both sides",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["search", "mcts"],
+        default="search",
+        help="alpha-beta search or Monte Carlo tree search",
+    )
+    parser.add_argument(
+        "--time", type=float, default=1.0, help="seconds the engine may think per move"
+    )
+    parser.add_argument("--seed", type=int, help="seed of the card deal")
+    parser.add_argument("--book", help="opening book for the search engine")
+    args = parser.parse_args()
+
+    def engine_player(color: Color):
+        if args.engine == "mcts":
+            return MCTSPlayer(color, args.time)
+        book = OpeningBook(args.book) if args.book else None
+        return SearchPlayer(color, args.time, book=book)
+
+    red_player = engine_player(Color.RED) if args.ai in ("red", "both") else None
+    blue_player = engine_player(Color.BLUE) if args.ai in ("blue", "both") else None
+    game = Onitama(red_player, blue_player, args.seed)
     game.play()
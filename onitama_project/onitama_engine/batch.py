@@ -0,0 +1,213 @@
+import random
+from typing import Optional, Sequence
+
+import numpy as np
+
+from .bitboard import BLUE, DESTINATIONS, GOAL_ROWS, NUM_SQUARES, RED, Bitboard
+from .card import CARD_DEFINITIONS
+
+EMPTY = 0
+STUDENT = 1
+MASTER = 2
+# Red pieces are positive and blue pieces negative
+COLOR_SIGNS = np.array([1, -1], dtype=np.int8)
+
+# An action is hand slot * 625 + from square * 25 + to square, followed by one
+# pass action per hand slot
+MOVES_PER_SLOT = NUM_SQUARES * NUM_SQUARES
+PASS_ACTION = 2 * MOVES_PER_SLOT
+NUM_ACTIONS = PASS_ACTION + 2
+
+NO_WINNER = -1
+
+# CARD_TARGETS[card * 2 + color, square] is the mask of squares the card reaches
+CARD_TARGETS = np.array(DESTINATIONS, dtype=np.int32).reshape(-1, NUM_SQUARES)
+SQUARE_BITS = (1 << np.arange(NUM_SQUARES)).astype(np.int32)
+GOAL_MASKS = np.array(GOAL_ROWS, dtype=np.int32)
+# A slot and square never have more destinations than the card has offsets
+MAX_CARD_MOVES = max(len(offsets) for _, offsets in CARD_DEFINITIONS)
+
+
+_BYTE_COUNTS = np.array([bin(byte).count("1") for byte in range(256)])
+
+
+def _bit_count_by_bytes(masks: np.ndarray) -> np.ndarray:
+    # NumPy before 2.0 has no bitwise_count, so bits are counted a byte at
+    # a time
+    masks = np.ascontiguousarray(masks)
+    as_bytes = masks.view(np.uint8).reshape(*masks.shape, masks.itemsize)
+    return _BYTE_COUNTS[as_bytes].sum(axis=-1)
+
+
+# Counts the set bits of non-negative masks
+if hasattr(np, "bitwise_count"):
+
+    def bit_count(masks: np.ndarray) -> np.ndarray:
+        return np.bitwise_count(masks).astype(np.int64)
+
+else:
+    bit_count = _bit_count_by_bytes
+
+
+class BatchOnitama:
+    def __init__(
+        self, boards: np.ndarray, cards: np.ndarray, turns: np.ndarray
+    ) -> None:
+        # boards is (B, 25) int8, cards is (B, 5) int8 holding red's two
+        # cards, blue's two and the neutral card, turns is (B,) int8
+        self.boards = boards
+        self.cards = cards
+        self.turns = turns
+        self.winners = np.full(len(boards), NO_WINNER, dtype=np.int8)
+        self.plies = np.zeros(len(boards), dtype=np.int32)
+        self._games = np.arange(len(boards))
+
+    @classmethod
+    def from_bitboards(cls, bitboards: Sequence[Bitboard]) -> "BatchOnitama":
+        count = len(bitboards)
+        boards = np.zeros((count, NUM_SQUARES), dtype=np.int8)
+        cards = np.zeros((count, 5), dtype=np.int8)
+        turns = np.zeros(count, dtype=np.int8)
+        for game, bitboard in enumerate(bitboards):
+            for sq in range(NUM_SQUARES):
+                occupant = bitboard.piece_at(sq)
+                if occupant is not None:
+                    color, is_master = occupant
+                    rank = MASTER if is_master else STUDENT
+                    boards[game, sq] = rank * COLOR_SIGNS[color]
+            cards[game] = (
+                bitboard.hands[RED] + bitboard.hands[BLUE] + [bitboard.neutral_card]
+            )
+            turns[game] = bitboard.turn
+
+        batch = cls(boards, cards, turns)
+        for game, bitboard in enumerate(bitboards):
+            winner = bitboard.check_victory()
+            if winner is not None:
+                batch.winners[game] = winner
+        return batch
+
+    @classmethod
+    def from_seeds(cls, seeds: Sequence[int]) -> "BatchOnitama":
+        return cls.from_bitboards(
+            [Bitboard.deal(random.Random(seed)) for seed in seeds]
+        )
+
+    def __len__(self) -> int:
+        return len(self.boards)
+
+    @property
+    def done(self) -> np.ndarray:
+        return self.winners != NO_WINNER
+
+    def legal_targets(self, games: Optional[np.ndarray] = None) -> np.ndarray:
+        """Returns (G, 2, 25) masks of the squares each hand slot and square
+        can move to. Squares without a piece of the side to move get 0."""
+        if games is None:
+            games = self._games
+        turns = self.turns[games].astype(np.intp)
+
+        own_squares = self.boards[games] * COLOR_SIGNS[turns][:, None] > 0
+        # 25 flags pack into the low bits of a little-endian 32-bit word
+        own = np.packbits(own_squares, axis=1, bitorder="little").view("<i4")
+        hand = self.cards[games[:, None], 2 * turns[:, None] + np.arange(2)]
+        targets = CARD_TARGETS[hand.astype(np.intp) * 2 + turns[:, None]]
+        targets &= ~own[:, :, None]
+        targets *= own_squares[:, None, :]
+        return targets
+
+    def legal_mask(self, games: Optional[np.ndarray] = None) -> np.ndarray:
+        if games is None:
+            games = self._games
+        targets = self.legal_targets(games)
+
+        mask = np.zeros((len(games), NUM_ACTIONS), dtype=bool)
+        moves = (targets[..., None] & SQUARE_BITS) != 0
+        mask[:, :PASS_ACTION] = moves.reshape(len(games), PASS_ACTION)
+        # A side without a piece move must still exchange a card
+        mask[:, PASS_ACTION:] = ~targets.any(axis=(1, 2))[:, None]
+        mask[self.done[games]] = False
+        return mask
+
+    def random_actions(
+        self, rng: np.random.Generator, games: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        if games is None:
+            games = self._games
+        targets = self.legal_targets(games).reshape(len(games), -1)
+
+        counts = np.cumsum(bit_count(targets), axis=1, dtype=np.int32)
+        totals = counts[:, -1]
+        no_moves = totals == 0
+        # Pick the n-th legal move, then its n-th destination bit
+        picks = (rng.random(len(games)) * np.maximum(totals, 1)).astype(np.int32)
+        entries = np.argmax(counts > picks[:, None], axis=1)
+        rows = np.arange(len(games))
+        remaining = targets[rows, entries]
+        rank = picks - counts[rows, entries] + bit_count(remaining)
+        for _ in range(MAX_CARD_MOVES - 1):
+            # Clear the lowest set bit of every mask that still has rank > 0
+            clear = rank > 0
+            remaining = np.where(clear, remaining & (remaining - 1), remaining)
+            rank -= clear
+        to_squares = bit_count((remaining & -remaining) - 1).astype(np.int32)
+
+        actions = entries * NUM_SQUARES + to_squares
+        actions[no_moves] = PASS_ACTION + (rng.random(no_moves.sum()) < 0.5)
+        return actions
+
+    def step(
+        self, actions: np.ndarray, games: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """Applies one action per game and returns the games that just ended.
+
+        Games that are already over are left untouched, whatever their action.
+        """
+        if games is None:
+            games = self._games
+        actions = np.asarray(actions)
+        still_playing = ~self.done[games]
+        active = games[still_playing]
+        actions = actions[still_playing]
+        turns = self.turns[active].astype(np.intp)
+
+        passes = actions >= PASS_ACTION
+        slots = np.where(passes, actions - PASS_ACTION, actions // MOVES_PER_SLOT)
+        hand_columns = 2 * turns + slots
+        played = self.cards[active, hand_columns]
+        self.cards[active, hand_columns] = self.cards[active, 4]
+        self.cards[active, 4] = played
+
+        movers = active[~passes]
+        mover_turns = turns[~passes]
+        remainder = actions[~passes] % MOVES_PER_SLOT
+        from_squares = remainder // NUM_SQUARES
+        to_squares = remainder % NUM_SQUARES
+
+        pieces = self.boards[movers, from_squares]
+        captured = self.boards[movers, to_squares]
+        self.boards[movers, to_squares] = pieces
+        self.boards[movers, from_squares] = EMPTY
+
+        wins = (np.abs(captured) == MASTER) | (
+            (np.abs(pieces) == MASTER)
+            & (SQUARE_BITS[to_squares] & GOAL_MASKS[mover_turns] != 0)
+        )
+        self.winners[movers[wins]] = mover_turns[wins]
+
+        self.turns[active] ^= 1
+        self.plies[active] += 1
+        return movers[wins]
+
+    def rollout(
+        self, rng: np.random.Generator, max_plies: Optional[int] = 200
+    ) -> np.ndarray:
+        games = np.flatnonzero(~self.done)
+        while len(games):
+            if max_plies is not None:
+                games = games[self.plies[games] < max_plies]
+                if not len(games):
+                    break
+            self.step(self.random_actions(rng, games), games)
+            games = games[~self.done[games]]
+        return self.winners
@@ -0,0 +1,387 @@
+import random
+from typing import List, Optional, Sequence, Tuple
+
+from .card import CARD_IDS, CARDS
+from .zobrist import CARD_KEYS, MASTER_KEYS, NEUTRAL, STUDENT_KEYS, TURN_KEY
+
+RED = 0
+BLUE = 1
+
+BOARD_SIZE = 5
+NUM_SQUARES = BOARD_SIZE * BOARD_SIZE
+FULL_BOARD = (1 << NUM_SQUARES) - 1
+
+# A master wins by reaching the opponent's back row, indexed by colour.
+GOAL_ROWS = (0b11111 << 20, 0b11111)
+
+
+def square(x: int, y: int) -> int:
+    return y * BOARD_SIZE + x
+
+
+def square_coords(sq: int) -> Tuple[int, int]:
+    return sq % BOARD_SIZE, sq // BOARD_SIZE
+
+
+# Moves are packed as from | to << 5 | card << 10. A move whose from and to
+# squares match is a pass: the card is exchanged without moving a piece,
+# which is only legal when the side to move has no other move.
+MOVE_CARD_SHIFT = 10
+# History entries keep the move in their low bits
+MOVE_MASK = 0x3FFF
+NO_CAPTURE = 0
+STUDENT_CAPTURE = 1
+MASTER_CAPTURE = 2
+# Set on the history entry of the move that ended the game
+GAME_OVER_FLAG = 1 << 17
+# Master square of a captured master
+NO_SQUARE = -1
+
+
+def encode_move(card: int, sq: int, to_sq: int) -> int:
+    return sq | to_sq << 5 | card << MOVE_CARD_SHIFT
+
+
+def decode_move(move: int) -> Tuple[int, int, int]:
+    return move >> MOVE_CARD_SHIFT, move & 31, move >> 5 & 31
+
+
+def is_pass(move: int) -> bool:
+    return move & 31 == move >> 5 & 31
+
+
+def _oriented(
+    offsets: Sequence[Tuple[int, int]], color: int
+) -> Tuple[Tuple[int, int], ...]:
+    # Card offsets are written from blue's side of the board
+    if color == RED:
+        return tuple((-dx, -dy) for dx, dy in offsets)
+    return tuple(offsets)
+
+
+def _targets(offsets: Sequence[Tuple[int, int]], sq: int) -> Tuple[int, ...]:
+    x, y = square_coords(sq)
+    # In square order, so moves come out as they would from the masks
+    return tuple(
+        sorted(
+            square(x + dx, y + dy)
+            for dx, dy in offsets
+            if 0 <= x + dx < BOARD_SIZE and 0 <= y + dy < BOARD_SIZE
+        )
+    )
+
+
+# The card tables are compiled once, indexed by card id, then colour, then
+# square. OFFSETS[card][color] are the card's offsets turned to face the
+# colour's opponent.
+OFFSETS = tuple(
+    (_oriented(card.offsets, RED), _oriented(card.offsets, BLUE)) for card in CARDS
+)
+# TARGETS[card][color][square] are the squares the card reaches, on the board
+TARGETS = tuple(
+    tuple(
+        tuple(_targets(offsets, sq) for sq in range(NUM_SQUARES))
+        for offsets in card_offsets
+    )
+    for card_offsets in OFFSETS
+)
+# DESTINATIONS[card][color][square] is the mask of those squares
+DESTINATIONS = tuple(
+    tuple(
+        tuple(sum(1 << to_sq for to_sq in targets) for targets in square_targets)
+        for square_targets in color_targets
+    )
+    for color_targets in TARGETS
+)
+# MOVE_TABLES[card][color][square] pairs each target's bit with the packed
+# move, so generating moves only has to drop those onto the mover's pieces
+MOVE_TABLES = tuple(
+    tuple(
+        tuple(
+            tuple((1 << to_sq, encode_move(card, sq, to_sq)) for to_sq in targets)
+            for sq, targets in enumerate(square_targets)
+        )
+        for square_targets in color_targets
+    )
+    for card, color_targets in enumerate(TARGETS)
+)
+
+
+START_STUDENTS = (0b11011, 0b11011 << 20)
+START_MASTERS = (1 << square(2, 0), 1 << square(2, 4))
+
+
+class Bitboard:
+    def __init__(self, cards: Sequence[int], turn: int):
+        # cards holds five card ids: red's two, blue's two and the neutral card
+        self.students = list(START_STUDENTS)
+        self.masters = list(START_MASTERS)
+        self.hands = [[cards[0], cards[1]], [cards[2], cards[3]]]
+        self.neutral_card = cards[4]
+        self.turn = turn
+        # Each entry is the move plus the hand slot, the captured piece kind
+        # and whether the move ended the game
+        self.history: List[int] = []
+        self.hash = self.compute_hash()
+        self.hash_history: List[int] = []
+        # Kept up to date by push and pop
+        self.master_squares = [0, 0]
+        self.piece_counts = [0, 0]
+        self.winner: Optional[int] = None
+        self.sync()
+
+    @classmethod
+    def deal(cls, rng: random.Random) -> "Bitboard":
+        # Draws in the same order as Onitama.__init__, so a seeded generator
+        # deals the same cards and starting side in both
+        cards = rng.sample(range(len(CARDS)), 5)
+        turn = RED if rng.random() < 0.5 else BLUE
+        return cls(cards, turn)
+
+    def compute_hash(self) -> int:
+        key = TURN_KEY if self.turn == BLUE else 0
+        for color in (RED, BLUE):
+            for sq in range(NUM_SQUARES):
+                if self.students[color] >> sq & 1:
+                    key ^= STUDENT_KEYS[color][sq]
+                elif self.masters[color] >> sq & 1:
+                    key ^= MASTER_KEYS[color][sq]
+            for card in self.hands[color]:
+                key ^= CARD_KEYS[color][card]
+        return key ^ CARD_KEYS[NEUTRAL][self.neutral_card]
+
+    def sync(self) -> None:
+        """Recomputes the tracked master squares, piece counts and winner
+        after the piece masks were set directly."""
+        for color in (RED, BLUE):
+            self.master_squares[color] = self.masters[color].bit_length() - 1
+            self.piece_counts[color] = (
+                self.students[color] | self.masters[color]
+            ).bit_count()
+
+        red_master, blue_master = self.masters
+        if not red_master:
+            self.winner = BLUE
+        elif not blue_master:
+            self.winner = RED
+        elif red_master & GOAL_ROWS[RED]:
+            self.winner = RED
+        elif blue_master & GOAL_ROWS[BLUE]:
+            self.winner = BLUE
+        else:
+            self.winner = None
+
+    @property
+    def last_capture(self) -> int:
+        return self.history[-1] >> 15 & 3 if self.history else NO_CAPTURE
+
+    def pieces(self, color: int) -> int:
+        return self.students[color] | self.masters[color]
+
+    def piece_at(self, sq: int) -> Optional[Tuple[int, bool]]:
+        bit = 1 << sq
+        for color in (RED, BLUE):
+            if self.masters[color] & bit:
+                return color, True
+            if self.students[color] & bit:
+                return color, False
+        return None
+
+    def destinations(self, sq: int, card: int) -> int:
+        turn = self.turn
+        own = self.students[turn] | self.masters[turn]
+        return DESTINATIONS[card][turn][sq] & ~own
+
+    def get_valid_moves(self, sq: int) -> List[Tuple[int, int]]:
+        turn = self.turn
+        own = self.students[turn] | self.masters[turn]
+        if not own >> sq & 1:
+            return []
+
+        return [
+            (card, to_sq)
+            for card in self.hands[turn]
+            for to_sq in TARGETS[card][turn][sq]
+            if not own >> to_sq & 1
+        ]
+
+    def get_move_masks(self) -> List[Tuple[int, int, int]]:
+        turn = self.turn
+        own = self.students[turn] | self.masters[turn]
+        first, second = self.hands[turn]
+        first_targets = DESTINATIONS[first][turn]
+        second_targets = DESTINATIONS[second][turn]
+
+        masks = []
+        pieces = own
+        while pieces:
+            bit = pieces & -pieces
+            sq = bit.bit_length() - 1
+            pieces ^= bit
+            targets = first_targets[sq] & ~own
+            if targets:
+                masks.append((first, sq, targets))
+            targets = second_targets[sq] & ~own
+            if targets:
+                masks.append((second, sq, targets))
+        return masks
+
+    def count_moves(self) -> int:
+        turn = self.turn
+        own = self.students[turn] | self.masters[turn]
+        first, second = self.hands[turn]
+        first_targets = DESTINATIONS[first][turn]
+        second_targets = DESTINATIONS[second][turn]
+
+        count = 0
+        pieces = own
+        while pieces:
+            bit = pieces & -pieces
+            sq = bit.bit_length() - 1
+            pieces ^= bit
+            count += (first_targets[sq] & ~own).bit_count()
+            count += (second_targets[sq] & ~own).bit_count()
+        return count
+
+    def move_piece(self, sq: int, to_sq: int) -> None:
+        bit = 1 << sq
+        to_bit = 1 << to_sq
+        color = RED if (self.students[RED] | self.masters[RED]) & bit else BLUE
+        enemy = 1 - color
+
+        key = self.hash
+        if self.students[enemy] & to_bit:
+            self.students[enemy] ^= to_bit
+            key ^= STUDENT_KEYS[enemy][to_sq]
+        elif self.masters[enemy] & to_bit:
+            self.masters[enemy] ^= to_bit
+            key ^= MASTER_KEYS[enemy][to_sq]
+
+        if self.masters[color] & bit:
+            self.masters[color] ^= bit | to_bit
+            key ^= MASTER_KEYS[color][sq] ^ MASTER_KEYS[color][to_sq]
+        else:
+            self.students[color] ^= bit | to_bit
+            key ^= STUDENT_KEYS[color][sq] ^ STUDENT_KEYS[color][to_sq]
+        self.hash = key
+        self.sync()
+
+    def legal_moves(self) -> List[int]:
+        turn = self.turn
+        own = self.students[turn] | self.masters[turn]
+        first, second = self.hands[turn]
+        first_moves = MOVE_TABLES[first][turn]
+        second_moves = MOVE_TABLES[second][turn]
+
+        moves = []
+        pieces = own
+        while pieces:
+            bit = pieces & -pieces
+            sq = bit.bit_length() - 1
+            pieces ^= bit
+            moves += [move for to_bit, move in first_moves[sq] if not own & to_bit]
+            moves += [move for to_bit, move in second_moves[sq] if not own & to_bit]
+
+        if not moves:
+            return [first << MOVE_CARD_SHIFT, second << MOVE_CARD_SHIFT]
+        return moves
+
+    def push(self, move: int) -> None:
+        """Plays a move without checking it, for search. The move must come
+        from legal_moves(); make_move() checks a move made by hand."""
+        turn = self.turn
+        hand = self.hands[turn]
+        card = move >> MOVE_CARD_SHIFT
+        slot = 0 if hand[0] == card else 1
+        neutral_card = self.neutral_card
+        hand[slot] = neutral_card
+        self.neutral_card = card
+
+        key = self.hash
+        self.hash_history.append(key)
+        owned = CARD_KEYS[turn]
+        neutral = CARD_KEYS[NEUTRAL]
+        key ^= owned[card] ^ neutral[card] ^ neutral[neutral_card] ^ owned[neutral_card]
+        key ^= TURN_KEY
+
+        sq = move & 31
+        to_sq = move >> 5 & 31
+        entry = move | slot << 14
+        if sq != to_sq:
+            bit = 1 << sq
+            to_bit = 1 << to_sq
+            enemy = 1 - turn
+            if self.students[enemy] & to_bit:
+                self.students[enemy] ^= to_bit
+                key ^= STUDENT_KEYS[enemy][to_sq]
+                self.piece_counts[enemy] -= 1
+                entry |= STUDENT_CAPTURE << 15
+            elif self.masters[enemy] & to_bit:
+                self.masters[enemy] ^= to_bit
+                key ^= MASTER_KEYS[enemy][to_sq]
+                self.piece_counts[enemy] -= 1
+                self.master_squares[enemy] = NO_SQUARE
+                entry |= MASTER_CAPTURE << 15
+                if self.winner is None:
+                    self.winner = turn
+                    entry |= GAME_OVER_FLAG
+
+            if self.masters[turn] & bit:
+                self.masters[turn] ^= bit | to_bit
+                key ^= MASTER_KEYS[turn][sq] ^ MASTER_KEYS[turn][to_sq]
+                self.master_squares[turn] = to_sq
+                if self.winner is None and to_bit & GOAL_ROWS[turn]:
+                    self.winner = turn
+                    entry |= GAME_OVER_FLAG
+            else:
+                self.students[turn] ^= bit | to_bit
+                key ^= STUDENT_KEYS[turn][sq] ^ STUDENT_KEYS[turn][to_sq]
+
+        self.hash = key
+        self.history.append(entry)
+        self.turn = 1 - turn
+
+    def pop(self) -> int:
+        entry = self.history.pop()
+        move = entry & MOVE_MASK
+        turn = self.turn = 1 - self.turn
+        self.hash = self.hash_history.pop()
+        hand = self.hands[turn]
+        slot = entry >> 14 & 1
+        hand[slot], self.neutral_card = self.neutral_card, hand[slot]
+
+        sq = move & 31
+        to_sq = move >> 5 & 31
+        if sq != to_sq:
+            bit = 1 << sq
+            to_bit = 1 << to_sq
+            if self.masters[turn] & to_bit:
+                self.masters[turn] ^= bit | to_bit
+                self.master_squares[turn] = sq
+            else:
+                self.students[turn] ^= bit | to_bit
+
+            captured = entry >> 15 & 3
+            if captured == STUDENT_CAPTURE:
+                self.students[1 - turn] |= to_bit
+                self.piece_counts[1 - turn] += 1
+            elif captured == MASTER_CAPTURE:
+                self.masters[1 - turn] |= to_bit
+                self.piece_counts[1 - turn] += 1
+                self.master_squares[1 - turn] = to_sq
+            if entry & GAME_OVER_FLAG:
+                self.winner = None
+        return move
+
+    def make_move(self, card: int, sq: int, to_sq: int) -> Optional[int]:
+        """Plays a move and returns the winner it produced, if any."""
+        if card not in self.hands[self.turn]:
+            raise ValueError(f"Card {card} is not held by the side to move")
+        if (card, to_sq) not in self.get_valid_moves(sq):
+            raise ValueError(f"Card {card} can't move a piece from {sq} to {to_sq}")
+
+        self.push(encode_move(card, sq, to_sq))
+        return self.winner
+
+    def check_victory(self) -> Optional[int]:
+        return self.winner
@@ -0,0 +1,263 @@
+import argparse
+import bisect
+import mmap
+import multiprocessing
+import random
+import struct
+import sys
+import time
+from itertools import combinations
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from .bitboard import BLUE, CARD_IDS, RED, Bitboard
+from .card import CARD_DEFINITIONS
+from .search import Searcher
+from .state import GameState
+from .symmetry import canonical, transform_move
+from .transposition import TranspositionTable
+
+MAGIC = b"ONIBK\x00\x00\x02"
+HEADER = struct.Struct("<8sI4x")
+# Deal key, first record and record count
+INDEX_ENTRY = struct.Struct("<III")
+# Position hash, move, score and search depth
+RECORD = struct.Struct("<QHiBx")
+
+BookEntry = Tuple[int, int, int]
+Record = Tuple[int, int, int, int]
+
+
+def deal_key(cards: Sequence[int]) -> int:
+    """Packs a set of five card ids, which stays the same all game long."""
+    key = 0
+    for card in sorted(cards):
+        key = key << 4 | card
+    return key
+
+
+def board_deal_key(board: Union[Bitboard, GameState]) -> int:
+    return deal_key((*board.hands[RED], *board.hands[BLUE], board.neutral_card))
+
+
+def canonical_deal(cards: Sequence[int], turn: int) -> Tuple[Tuple[int, ...], int]:
+    """Returns the deal whose opening is the canonical form of this one's."""
+    state, _ = canonical(Bitboard(cards, turn))
+    return (*state.hands[RED], *state.hands[BLUE], state.neutral_card), state.turn
+
+
+def starting_positions(cards: Sequence[int]) -> Iterator[Tuple[List[int], int]]:
+    """Yields every way to hand out five cards, with either side starting."""
+    for red in combinations(cards, 2):
+        rest = [card for card in cards if card not in red]
+        for blue in combinations(rest, 2):
+            (neutral,) = set(rest) - set(blue)
+            for turn in (RED, BLUE):
+                yield list(red) + list(blue) + [neutral], turn
+
+
+def opening_positions(board: Bitboard, plies: int) -> Iterator[Bitboard]:
+    """Walks every line of up to plies moves, yielding each position once."""
+    seen = set()
+
+    def walk(remaining: int) -> Iterator[Bitboard]:
+        if board.hash in seen or board.check_victory() is not None:
+            return
+        seen.add(board.hash)
+        yield board
+        if remaining:
+            for move in board.legal_moves():
+                board.push(move)
+                yield from walk(remaining - 1)
+                board.pop()
+
+    return walk(plies)
+
+
+def build_deal(task: Tuple[Sequence[int], int, int, int, int]) -> List[Record]:
+    cards, turn, plies, depth, table_size = task
+    searcher = Searcher(TranspositionTable(table_size))
+    records = []
+    seen = set()
+    for board in opening_positions(Bitboard(cards, turn), plies):
+        # Positions are stored in canonical form, so mirror images and
+        # colour swaps of one another are searched once
+        state, transform = canonical(board)
+        if state.hash in seen:
+            continue
+        seen.add(state.hash)
+        result = searcher.search(board, float("inf"), depth)
+        records.append(
+            (
+                state.hash,
+                transform_move(result.move, transform),
+                result.score,
+                result.depth,
+            )
+        )
+    return records
+
+
+def write(path: str, records: Dict[int, Dict[int, Record]]) -> None:
+    keys = sorted(records)
+    with open(path, "wb") as book_file:
+        book_file.write(HEADER.pack(MAGIC, len(keys)))
+        first = 0
+        for key in keys:
+            book_file.write(INDEX_ENTRY.pack(key, first, len(records[key])))
+            first += len(records[key])
+        for key in keys:
+            for position in sorted(records[key]):
+                book_file.write(RECORD.pack(*records[key][position]))
+
+
+class OpeningBook:
+    """Best replies for opening positions, grouped by the five cards in play.
+
+    Positions are stored in their canonical form, which holds one of the
+    up to four symmetric versions of every position and is always red to
+    move. Only the header is read up front. The first probe for a deal finds its
+    group in the sorted index and loads that group alone, so a process
+    playing one game never touches the rest of the book.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as book_file:
+            self._map = mmap.mmap(book_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.deal_count = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an Onitama opening book")
+        self._records_start = HEADER.size + self.deal_count * INDEX_ENTRY.size
+        self._deals: Dict[int, Dict[int, BookEntry]] = {}
+
+    def close(self) -> None:
+        self._map.close()
+
+    def _index_entry(self, position: int) -> Tuple[int, int, int]:
+        return INDEX_ENTRY.unpack_from(
+            self._map, HEADER.size + position * INDEX_ENTRY.size
+        )
+
+    def _load(self, key: int) -> Dict[int, BookEntry]:
+        entries: Dict[int, BookEntry] = {}
+        keys = _IndexKeys(self)
+        position = bisect.bisect_left(keys, key)
+        if position < len(keys) and keys[position] == key:
+            _, first, count = self._index_entry(position)
+            offset = self._records_start + first * RECORD.size
+            for position_hash, move, score, depth in RECORD.iter_unpack(
+                self._map[offset : offset + count * RECORD.size]
+            ):
+                entries[position_hash] = move, score, depth
+        self._deals[key] = entries
+        return entries
+
+    def probe(self, board: Bitboard) -> Optional[BookEntry]:
+        """Returns (move, score, depth) for the position, or None."""
+        state, transform = canonical(board)
+        key = board_deal_key(state)
+        entries = self._deals.get(key)
+        if entries is None:
+            entries = self._load(key)
+        entry = entries.get(state.hash)
+        if entry is None:
+            return None
+        move, score, depth = entry
+        return transform_move(move, transform), score, depth
+
+    def move(self, board: Bitboard) -> Optional[int]:
+        entry = self.probe(board)
+        # A hash collision must never play an illegal move
+        if entry is None or entry[0] not in board.legal_moves():
+            return None
+        return entry[0]
+
+
+class _IndexKeys(Sequence[int]):
+    # Lets bisect search the deal keys in place
+    def __init__(self, book: OpeningBook):
+        self.book = book
+
+    def __len__(self) -> int:
+        return self.book.deal_count
+
+    def __getitem__(self, position: int) -> int:
+        return self.book._index_entry(position)[0]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m onitama_engine.book")
+    parser.add_argument("output", help="file to write the book to")
+    parser.add_argument(
+        "--seeds",
+        type=int,
+        default=0,
+        help="include the deals of this many seeds, starting at --first-seed",
+    )
+    parser.add_argument("--first-seed", type=int, default=0)
+    parser.add_argument(
+        "--cards",
+        action="append",
+        default=[],
+        help="include every deal of these five comma separated cards",
+    )
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="include every possible deal, which takes days",
+    )
+    parser.add_argument(
+        "--plies", type=int, default=2, help="book positions up to this many moves in"
+    )
+    parser.add_argument("--depth", type=int, default=6, help="search depth")
+    parser.add_argument("--table-size", type=int, default=1 << 18)
+    parser.add_argument(
+        "--workers", type=int, default=multiprocessing.cpu_count(), help="processes"
+    )
+    args = parser.parse_args(argv)
+
+    deals = set()
+    for seed in range(args.first_seed, args.first_seed + args.seeds):
+        board = Bitboard.deal(random.Random(seed))
+        cards = board.hands[RED] + board.hands[BLUE] + [board.neutral_card]
+        deals.add(canonical_deal(cards, board.turn))
+    card_sets = [names.split(",") for names in args.cards]
+    for names in card_sets:
+        if len(set(names)) != 5 or any(name not in CARD_IDS for name in names):
+            parser.error(f"expected five different cards out of {sorted(CARD_IDS)}")
+    card_ids = [[CARD_IDS[name] for name in names] for names in card_sets]
+    if args.all:
+        card_ids = combinations(range(len(CARD_DEFINITIONS)), 5)
+    for cards in card_ids:
+        for dealt, turn in starting_positions(cards):
+            deals.add(canonical_deal(dealt, turn))
+    if not deals:
+        parser.error("choose deals with --seeds, --cards or --all")
+
+    tasks = [
+        (cards, turn, args.plies, args.depth, args.table_size)
+        for cards, turn in sorted(deals)
+    ]
+    records: Dict[int, Dict[int, Record]] = {}
+    start = time.perf_counter()
+    with multiprocessing.Pool(args.workers) as pool:
+        for (cards, _, _, _, _), deal_records in zip(
+            tasks, pool.imap(build_deal, tasks, chunksize=4)
+        ):
+            group = records.setdefault(deal_key(cards), {})
+            for record in deal_records:
+                # Keep the deeper search when two openings transpose
+                if record[0] not in group or group[record[0]][3] < record[3]:
+                    group[record[0]] = record
+
+    write(args.output, records)
+    positions = sum(len(group) for group in records.values())
+    print(
+        f"{len(tasks)} deals, {positions} positions written to {args.output} "
+        f"in {time.perf_counter() - start:.1f}s",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
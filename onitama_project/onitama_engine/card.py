@@ -1,13 +1,37 @@
-from typing import List, Tuple
+from typing import Dict, List, NamedTuple, Tuple
 
-from .move import Move
+CARD_DEFINITIONS: List[Tuple[str, List[Tuple[int, int]]]] = [
+    ("Tiger", [(0, -2), (0, 1)]),
+    ("Dragon", [(-2, -1), (-1, 1), (2, -1), (1, 1)]),
+    ("Frog", [(-2, 0), (-1, -1), (1, 1)]),
+    ("Rabbit", [(1, -1), (2, 0), (-1, 1)]),
+    ("Crab", [(0, -1), (-2, 0), (2, 0)]),
+    ("Elephant", [(1, 0), (-1, -1), (1, -1), (-1, 0)]),
+    ("Goose", [(-1, 0), (-1, -1), (1, 0), (1, 1)]),
+    ("Rooster", [(1, 0), (1, -1), (-1, 0), (-1, 1)]),
+    ("Monkey", [(-1, -1), (1, -1), (-1, 1), (1, 1)]),
+    ("Mantis", [(-1, -1), (1, -1), (0, 1)]),
+    ("Horse", [(0, -1), (-1, 0), (0, 1)]),
+    ("Ox", [(0, -1), (1, 0), (0, 1)]),
+    ("Crane", [(0, -1), (1, 1), (-1, 1)]),
+    ("Boar", [(0, -1), (1, 0), (-1, 0)]),
+    ("Eel", [(1, 0), (-1, -1), (-1, 1)]),
+    ("Cobra", [(-1, 0), (1, -1), (1, 1)]),
+]
 
 
-class Card:
-    def __init__(self, name: str, moves: List[Move]):
-        self.name = name
-        self.moves = moves
+class Card(NamedTuple):
+    id: int
+    name: str
+    # As printed on the card, from blue's side of the board
+    offsets: Tuple[Tuple[int, int], ...]
 
-    @classmethod
-    def from_tuple(cls, card_tuple: Tuple[str, List[Tuple[int, int]]]):
-        return cls(card_tuple[0], [Move(x, y) for x, y in card_tuple[1]])
+
+# Built once at import and shared by every game; the engine itself only ever
+# sees card ids, and names are looked up at the edges
+CARDS: Tuple[Card, ...] = tuple(
+    Card(card, name, tuple(offsets))
+    for card, (name, offsets) in enumerate(CARD_DEFINITIONS)
+)
+CARD_NAMES: Tuple[str, ...] = tuple(card.name for card in CARDS)
+CARD_IDS: Dict[str, int] = {card.name: card.id for card in CARDS}
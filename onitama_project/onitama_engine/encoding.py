@@ -0,0 +1,141 @@
+from typing import List
+
+from .bitboard import BLUE, BOARD_SIZE, CARD_IDS, NUM_SQUARES, RED, Bitboard
+from .card import CARD_NAMES
+
+# Text positions look like "SSMSS/5/5/5/ssmss r Tiger,Ox Crab,Monkey Eel":
+# rows from y = 0 to 4 with red pieces in upper case, blue in lower case and
+# runs of empty squares as digits, then the side to move, red's cards, blue's
+# cards and the neutral card.
+PIECE_LETTERS = {
+    (RED, False): "S",
+    (RED, True): "M",
+    (BLUE, False): "s",
+    (BLUE, True): "m",
+}
+LETTER_PIECES = {letter: piece for piece, letter in PIECE_LETTERS.items()}
+TURN_LETTERS = ("r", "b")
+
+# Binary positions pack into one little-endian integer: both 25-bit student
+# masks, both 5-bit master squares (31 once captured), the five 4-bit card
+# ids in red, blue, neutral order and the side to move
+BINARY_SIZE = 11
+# Both decoders only accept positions of a game in progress: one master and
+# at most this many students a side
+MAX_STUDENTS = 4
+_NO_MASTER = 31
+_MASK = (1 << NUM_SQUARES) - 1
+
+
+def encode_text(board: Bitboard) -> str:
+    rows = []
+    for y in range(BOARD_SIZE):
+        row = ""
+        empty = 0
+        for x in range(BOARD_SIZE):
+            occupant = board.piece_at(y * BOARD_SIZE + x)
+            if occupant is None:
+                empty += 1
+                continue
+            if empty:
+                row += str(empty)
+                empty = 0
+            row += PIECE_LETTERS[occupant]
+        if empty:
+            row += str(empty)
+        rows.append(row)
+
+    return " ".join(
+        [
+            "/".join(rows),
+            TURN_LETTERS[board.turn],
+            ",".join(CARD_NAMES[card] for card in board.hands[RED]),
+            ",".join(CARD_NAMES[card] for card in board.hands[BLUE]),
+            CARD_NAMES[board.neutral_card],
+        ]
+    )
+
+
+def decode_text(text: str) -> Bitboard:
+    try:
+        placement, turn, red_cards, blue_cards, neutral = text.split()
+        cards = red_cards.split(",") + blue_cards.split(",") + [neutral]
+        card_ids = [CARD_IDS[name] for name in cards]
+        board = Bitboard(card_ids, TURN_LETTERS.index(turn))
+    except (KeyError, ValueError):
+        raise ValueError(f"Invalid position: {text!r}") from None
+    if len(card_ids) != 5 or len(set(card_ids)) != 5:
+        raise ValueError(f"Invalid position: {text!r}")
+
+    students = [0, 0]
+    masters = [0, 0]
+    rows = placement.split("/")
+    if len(rows) != BOARD_SIZE:
+        raise ValueError(f"Invalid position: {text!r}")
+    for y, row in enumerate(rows):
+        x = 0
+        for letter in row:
+            if letter.isdigit():
+                x += int(letter)
+                continue
+            if letter not in LETTER_PIECES or x >= BOARD_SIZE:
+                raise ValueError(f"Invalid position: {text!r}")
+            color, is_master = LETTER_PIECES[letter]
+            bit = 1 << y * BOARD_SIZE + x
+            if is_master:
+                masters[color] |= bit
+            else:
+                students[color] |= bit
+            x += 1
+        if x != BOARD_SIZE:
+            raise ValueError(f"Invalid position: {text!r}")
+    return _place(board, students, masters)
+
+
+def encode_binary(board: Bitboard) -> bytes:
+    red_master, blue_master = board.master_squares
+    value = board.students[RED] | board.students[BLUE] << 25
+    value |= (red_master if red_master >= 0 else _NO_MASTER) << 50
+    value |= (blue_master if blue_master >= 0 else _NO_MASTER) << 55
+    shift = 60
+    for card in (*board.hands[RED], *board.hands[BLUE], board.neutral_card):
+        value |= card << shift
+        shift += 4
+    value |= board.turn << shift
+    return value.to_bytes(BINARY_SIZE, "little")
+
+
+def decode_binary(data: bytes) -> Bitboard:
+    if len(data) != BINARY_SIZE:
+        raise ValueError(f"Expected {BINARY_SIZE} bytes, got {len(data)}")
+    value = int.from_bytes(data, "little")
+    cards = [value >> shift & 15 for shift in range(60, 80, 4)]
+    if len(set(cards)) != 5 or value >> 81:
+        raise ValueError(f"Invalid position: {data.hex()}")
+    board = Bitboard(cards, value >> 80 & 1)
+
+    students = [value & _MASK, value >> 25 & _MASK]
+    masters = [0, 0]
+    for color, shift in ((RED, 50), (BLUE, 55)):
+        master = value >> shift & 31
+        if master != _NO_MASTER:
+            if master >= NUM_SQUARES:
+                raise ValueError(f"Invalid position: {data.hex()}")
+            masters[color] = 1 << master
+    return _place(board, students, masters)
+
+
+def _place(board: Bitboard, students: List[int], masters: List[int]) -> Bitboard:
+    pieces = [students[RED], students[BLUE], masters[RED], masters[BLUE]]
+    occupied = pieces[0] | pieces[1] | pieces[2] | pieces[3]
+    if sum(mask.bit_count() for mask in pieces) != occupied.bit_count():
+        raise ValueError("Two pieces share a square")
+    if any(mask.bit_count() != 1 for mask in masters):
+        raise ValueError("Each side must have exactly one master")
+    if any(mask.bit_count() > MAX_STUDENTS for mask in students):
+        raise ValueError(f"A side has more than {MAX_STUDENTS} students")
+    board.students = students
+    board.masters = masters
+    board.hash = board.compute_hash()
+    board.sync()
+    return board
@@ -0,0 +1,368 @@
+import argparse
+import json
+import random
+import sys
+from typing import Dict, Iterator, List, Sequence, Tuple, Union
+
+import numpy as np
+
+from .batch import bit_count
+from .bitboard import BLUE, DESTINATIONS, NUM_SQUARES, RED, Bitboard
+from .encoding import BINARY_SIZE, encode_binary
+from .search import WIN
+
+# A position is scored as a linear function of these features, each red's
+# value minus blue's, so weights fitted to self-play results drop straight in.
+# Piece-square tables are written from red's side; blue's square sq reads
+# entry 24 - sq, the same square with the board turned around.
+FEATURES = (
+    ("students", 1),  # students on the board
+    ("student_table", NUM_SQUARES),  # students on each square
+    ("master_table", NUM_SQUARES),  # the master on each square
+    ("goal_distance", 1),  # rows between the master and the goal row
+    ("master_attacks", 1),  # enemy moves that would capture the master
+    ("mobility", 1),  # moves with the two cards in hand
+)
+NUM_FEATURES = sum(size for _, size in FEATURES)
+
+DEFAULT_WEIGHTS: Dict[str, Union[float, List[float]]] = {
+    "students": 100,
+    "student_table": [0] * NUM_SQUARES,
+    "master_table": [0] * NUM_SQUARES,
+    "goal_distance": -10,
+    "master_attacks": -30,
+    "mobility": 2,
+}
+
+# MIRROR[sq] is the square red's tables describe for blue's square sq
+MIRROR = tuple(NUM_SQUARES - 1 - sq for sq in range(NUM_SQUARES))
+_NO_MASTER = 31
+
+
+def weight_vector(weights: Dict[str, Union[float, List[float]]]) -> np.ndarray:
+    vector = []
+    for name, size in FEATURES:
+        value = weights.get(name, DEFAULT_WEIGHTS[name])
+        values = list(value) if size > 1 else [value]
+        if len(values) != size:
+            raise ValueError(f"{name} takes {size} weights, got {len(values)}")
+        vector.extend(values)
+    return np.array(vector, dtype=np.float64)
+
+
+def load_weights(path: str) -> Dict[str, Union[float, List[float]]]:
+    with open(path) as weights_file:
+        weights = json.load(weights_file)
+    unknown = set(weights) - set(DEFAULT_WEIGHTS)
+    if unknown:
+        raise ValueError(f"Unknown weights: {sorted(unknown)}")
+    return {**DEFAULT_WEIGHTS, **weights}
+
+
+def save_weights(path: str, weights: Dict[str, Union[float, List[float]]]):
+    with open(path, "w") as weights_file:
+        json.dump(weights, weights_file, indent=2)
+
+
+def _attacks(board: Bitboard, color: int) -> int:
+    """Counts the moves the other side's cards have onto color's master."""
+    master_square = board.master_squares[color]
+    enemy = 1 - color
+    # A card's sources for a square are its destinations turned around
+    return sum(
+        (board.pieces(enemy) & DESTINATIONS[card][color][master_square]).bit_count()
+        for card in board.hands[enemy]
+    )
+
+
+def _mobility(board: Bitboard, color: int) -> int:
+    own = board.pieces(color)
+    count = 0
+    for card in board.hands[color]:
+        targets = DESTINATIONS[card][color]
+        pieces = own
+        while pieces:
+            bit = pieces & -pieces
+            pieces ^= bit
+            count += (targets[bit.bit_length() - 1] & ~own).bit_count()
+    return count
+
+
+class Evaluator:
+    """Scores positions for the side to move with a set of weights.
+
+    Material and the masters' squares come from the counts and squares
+    Bitboard keeps up to date as moves are pushed and popped, and the student
+    table is read a bit plane at a time, so only the attack and mobility
+    terms walk the pieces. Use an instance as Searcher's evaluate.
+    """
+
+    def __init__(self, weights: Dict[str, Union[float, List[float]]] = DEFAULT_WEIGHTS):
+        self.weights = {**DEFAULT_WEIGHTS, **weights}
+        self.vector = weight_vector(self.weights)
+        # The tables are rounded to whole points for the search
+        self.student = round(self.weights["students"])
+        student_table = [round(value) for value in self.weights["student_table"]]
+        master_table = [round(value) for value in self.weights["master_table"]]
+        goal_distance = self.weights["goal_distance"]
+        self.master_attacks = round(self.weights["master_attacks"])
+        self.mobility = round(self.weights["mobility"])
+
+        # The master's table and its distance from the goal row, per square
+        self.master_tables = (
+            tuple(
+                master_table[sq] + round(goal_distance * (4 - sq // 5))
+                for sq in range(NUM_SQUARES)
+            ),
+            tuple(
+                master_table[MIRROR[sq]] + round(goal_distance * (sq // 5))
+                for sq in range(NUM_SQUARES)
+            ),
+        )
+        # The student table as bit planes: each square's value is the sum of
+        # the planes it belongs to, shifted, plus the table's minimum
+        self.student_base = min(student_table)
+        self.student_planes = tuple(
+            self._planes([value - self.student_base for value in table])
+            for table in (student_table, [student_table[sq] for sq in MIRROR])
+        )
+
+    @staticmethod
+    def _planes(values: Sequence[int]) -> tuple:
+        planes = []
+        for shift in range(max(values).bit_length()):
+            mask = sum(1 << sq for sq, value in enumerate(values) if value >> shift & 1)
+            if mask:
+                planes.append((shift, mask))
+        return tuple(planes)
+
+    @classmethod
+    def load(cls, path: str) -> "Evaluator":
+        return cls(load_weights(path))
+
+    def __call__(self, board: Bitboard) -> int:
+        winner = board.winner
+        if winner is not None:
+            return WIN if winner == board.turn else -WIN
+
+        score = 0
+        for color, sign in ((RED, 1), (BLUE, -1)):
+            students = board.students[color]
+            count = board.piece_counts[color] - 1
+            value = (self.student + self.student_base) * count
+            for shift, mask in self.student_planes[color]:
+                value += (students & mask).bit_count() << shift
+            value += self.master_tables[color][board.master_squares[color]]
+            value += self.master_attacks * _attacks(board, color)
+            value += self.mobility * _mobility(board, color)
+            score += sign * value
+        return score if board.turn == RED else -score
+
+
+def features(board: Bitboard) -> np.ndarray:
+    """Returns the feature vector of a position, red's values minus blue's."""
+    vector = np.zeros(NUM_FEATURES, dtype=np.float64)
+    student_table = 1
+    master_table = student_table + NUM_SQUARES
+    goal_distance = master_table + NUM_SQUARES
+    for color, sign in ((RED, 1), (BLUE, -1)):
+        students = board.students[color]
+        vector[0] += sign * students.bit_count()
+        for sq in range(NUM_SQUARES):
+            if students >> sq & 1:
+                vector[student_table + (sq if color == RED else MIRROR[sq])] += sign
+        master_square = board.master_squares[color]
+        if master_square < 0:
+            continue
+        vector[
+            master_table + (master_square if color == RED else MIRROR[master_square])
+        ] += sign
+        row = master_square // 5
+        vector[goal_distance] += sign * (4 - row if color == RED else row)
+        vector[goal_distance + 1] += sign * _attacks(board, color)
+        vector[goal_distance + 2] += sign * _mobility(board, color)
+    return vector
+
+
+# DESTINATIONS as an array, [card, color, square]
+_DESTINATION_MASKS = np.array(DESTINATIONS, dtype=np.int64)
+_MIRROR_INDEX = np.array(MIRROR)
+_SQUARES = np.arange(NUM_SQUARES, dtype=np.int64)
+_MASK = (1 << NUM_SQUARES) - 1
+
+
+def _unpack(positions: np.ndarray) -> dict:
+    """Splits binary positions into arrays of masks, squares and cards."""
+    positions = np.asarray(positions, dtype=np.uint8).reshape(-1, BINARY_SIZE)
+    padded = np.zeros((len(positions), 16), dtype=np.uint8)
+    padded[:, :BINARY_SIZE] = positions
+    words = padded.view("<u8")
+    # Bits 0 to 59 as a signed integer, the top four hold the first card
+    low = (words[:, 0] & np.uint64((1 << 60) - 1)).astype(np.int64)
+    high = (words[:, 0] >> np.uint64(60)).astype(np.int64) | (
+        words[:, 1].astype(np.int64) << 4
+    )
+    cards = [high >> shift & 15 for shift in (0, 4, 8, 12, 16)]
+    students = [low & _MASK, low >> 25 & _MASK]
+    masters = [low >> 50 & 31, low >> 55 & 31]
+    return {
+        "students": students,
+        "masters": masters,
+        "hands": [cards[0:2], cards[2:4]],
+        "turn": high >> 20 & 1,
+    }
+
+
+def batch_features(positions: np.ndarray) -> np.ndarray:
+    """Returns the feature vectors of positions in the binary encoding, one
+    row of BINARY_SIZE bytes each, as a (count, NUM_FEATURES) array."""
+    unpacked = _unpack(positions)
+    students = unpacked["students"]
+    masters = unpacked["masters"]
+    hands = unpacked["hands"]
+    count = len(students[0])
+    rows = np.arange(count)
+
+    alive = [squares != _NO_MASTER for squares in masters]
+    on_board = [np.where(alive[color], masters[color], 0) for color in (RED, BLUE)]
+    pieces = [
+        students[color] | np.where(alive[color], 1 << on_board[color], 0)
+        for color in (RED, BLUE)
+    ]
+
+    vector = np.zeros((count, NUM_FEATURES), dtype=np.float64)
+    student_table = 1
+    master_table = student_table + NUM_SQUARES
+    goal_distance = master_table + NUM_SQUARES
+    for color, sign in ((RED, 1), (BLUE, -1)):
+        enemy = 1 - color
+        student_bits = students[color][:, None] >> _SQUARES & 1
+        if color == BLUE:
+            student_bits = student_bits[:, _MIRROR_INDEX]
+        vector[:, 0] += sign * bit_count(students[color])
+        vector[:, student_table:master_table] += sign * student_bits
+
+        square = on_board[color] if color == RED else _MIRROR_INDEX[on_board[color]]
+        vector[rows, master_table + square] += sign * alive[color]
+        row = on_board[color] // 5
+        distance = 4 - row if color == RED else row
+        vector[:, goal_distance] += sign * alive[color] * distance
+
+        own = pieces[color]
+        own_bits = own[:, None] >> _SQUARES & 1
+        attacks = np.zeros(count, dtype=np.int64)
+        mobility = np.zeros(count, dtype=np.int64)
+        for slot in (0, 1):
+            sources = _DESTINATION_MASKS[hands[enemy][slot], color, on_board[color]]
+            attacks += bit_count(sources & pieces[enemy])
+            targets = _DESTINATION_MASKS[hands[color][slot], color] & ~own[:, None]
+            mobility += (bit_count(targets) * own_bits).sum(axis=1)
+        vector[:, goal_distance + 1] += sign * alive[color] * attacks
+        vector[:, goal_distance + 2] += sign * alive[color] * mobility
+    return vector
+
+
+def evaluate_batch(
+    positions: np.ndarray,
+    weights: Dict[str, Union[float, List[float]]] = DEFAULT_WEIGHTS,
+) -> np.ndarray:
+    """Scores positions in the binary encoding for their side to move.
+
+    Matches Evaluator's scores, including WIN and -WIN for finished games,
+    up to Evaluator's rounding of fractional weights.
+    """
+    scores = batch_features(positions) @ weight_vector({**DEFAULT_WEIGHTS, **weights})
+
+    unpacked = _unpack(positions)
+    red_master, blue_master = unpacked["masters"]
+    red_wins = (blue_master == _NO_MASTER) | (
+        (red_master != _NO_MASTER) & (red_master >= 20)
+    )
+    blue_wins = (red_master == _NO_MASTER) | (blue_master < 5)
+    scores = np.where(red_wins, WIN, np.where(blue_wins, -WIN, scores))
+    return np.where(unpacked["turn"] == BLUE, -scores, scores)
+
+
+def weights_from_vector(vector: np.ndarray) -> Dict[str, Union[float, List[float]]]:
+    weights = {}
+    start = 0
+    for name, size in FEATURES:
+        values = [round(float(value), 3) for value in vector[start : start + size]]
+        weights[name] = values if size > 1 else values[0]
+        start += size
+    return weights
+
+
+def game_positions(path: str) -> Iterator[Tuple[bytes, int]]:
+    """Yields every position before the end of each decided game in a
+    selfplay JSON-lines file, with 1 if red went on to win and 0 if not."""
+    with open(path) as games:
+        for line in games:
+            game = json.loads(line)
+            if game["winner"] is None:
+                continue
+            outcome = 1 if game["winner"] == "red" else 0
+            board = Bitboard.deal(random.Random(game["seed"]))
+            for move in game["moves"]:
+                yield encode_binary(board), outcome
+                board.push(move)
+
+
+def fit(
+    positions: np.ndarray,
+    outcomes: np.ndarray,
+    weights: Dict[str, Union[float, List[float]]] = DEFAULT_WEIGHTS,
+    scale: float = 400.0,
+    steps: int = 2000,
+    learning_rate: float = 1.0,
+    regularization: float = 1e-4,
+) -> Dict[str, Union[float, List[float]]]:
+    """Fits the weights so that sigmoid(score / scale) predicts red's wins.
+
+    Starts from weights and runs Adam on the log loss over all positions at
+    once, with a little L2 regularisation to keep unused table entries at 0.
+    """
+    matrix = batch_features(positions) / scale
+    outcomes = np.asarray(outcomes, dtype=np.float64)
+    vector = weight_vector({**DEFAULT_WEIGHTS, **weights})
+    first = np.zeros_like(vector)
+    second = np.zeros_like(vector)
+    for step in range(1, steps + 1):
+        predictions = 1 / (1 + np.exp(-(matrix @ vector)))
+        gradient = matrix.T @ (predictions - outcomes) / len(outcomes)
+        gradient += regularization * vector
+        first = 0.9 * first + 0.1 * gradient
+        second = 0.999 * second + 0.001 * gradient**2
+        corrected = first / (1 - 0.9**step)
+        vector -= (
+            learning_rate * corrected / (np.sqrt(second / (1 - 0.999**step)) + 1e-8)
+        )
+    return weights_from_vector(vector)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m onitama_engine.evaluation")
+    parser.add_argument("games", help="JSON-lines output of onitama_engine.selfplay")
+    parser.add_argument("--output", required=True, help="weights file to write")
+    parser.add_argument("--weights", help="weights to start from")
+    parser.add_argument("--steps", type=int, default=2000)
+    parser.add_argument("--learning-rate", type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    pairs = list(game_positions(args.games))
+    if not pairs:
+        print("No decided games to fit to", file=sys.stderr)
+        return 1
+    positions = np.frombuffer(b"".join(data for data, _ in pairs), dtype=np.uint8)
+    outcomes = np.array([outcome for _, outcome in pairs])
+    weights = load_weights(args.weights) if args.weights else DEFAULT_WEIGHTS
+    fitted = fit(
+        positions, outcomes, weights, steps=args.steps, learning_rate=args.learning_rate
+    )
+    save_weights(args.output, fitted)
+    print(f"Fitted {NUM_FEATURES} weights to {len(pairs)} positions", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,284 @@
+import math
+import random
+import time
+from array import array
+from typing import List, Optional, Tuple
+
+from .bitboard import GOAL_ROWS, MOVE_MASK, Bitboard
+from .constants import Color
+from .player import Player
+from .search import move_to_input
+
+NO_NODE = -1
+DRAW = 0.5
+# Five pieces with two cards of at most four moves each
+MAX_MOVES = 40
+
+
+def _check_budget(iterations: Optional[int], time_limit: Optional[float]) -> None:
+    if not (
+        (iterations is not None and iterations > 0)
+        or (time_limit is not None and time_limit > 0)
+    ):
+        raise ValueError("MCTS needs a positive iteration count or time limit")
+
+
+class MCTS:
+    """UCT search whose node statistics live in flat arrays.
+
+    The children of a node occupy a contiguous block, so a node only records
+    where its block starts and how long it is. Rerooting copies the kept
+    subtree into fresh arrays, which drops every other branch and keeps the
+    tree within max_nodes however long the game runs.
+    """
+
+    def __init__(
+        self,
+        exploration: float = 1.4,
+        max_nodes: int = 1_000_000,
+        playout_limit: int = 100,
+        heavy_playouts: bool = False,
+        rng: Optional[random.Random] = None,
+    ):
+        self.exploration = exploration
+        self.max_nodes = max_nodes
+        self.playout_limit = playout_limit
+        self.heavy_playouts = heavy_playouts
+        self.rng = rng or random.Random()
+        self.root_hash: Optional[int] = None
+        self._reset()
+
+    def _reset(self) -> None:
+        self.parents = array("i")
+        self.moves = array("H")
+        self.visits = array("I")
+        # Reward from the point of view of the side that played the move
+        self.rewards = array("d")
+        self.first_child = array("i")
+        self.child_counts = array("H")
+        self.terminal = array("B")
+        self._add_nodes(NO_NODE, [0], [False])
+
+    def __len__(self) -> int:
+        return len(self.parents)
+
+    def _add_nodes(self, parent: int, moves: List[int], terminal: List[bool]) -> int:
+        first = len(self.parents)
+        count = len(moves)
+        self.parents.extend([parent] * count)
+        self.moves.extend(moves)
+        self.visits.extend([0] * count)
+        self.rewards.extend([0.0] * count)
+        self.first_child.extend([NO_NODE] * count)
+        self.child_counts.extend([0] * count)
+        self.terminal.extend(terminal)
+        return first
+
+    def _expand(self, board: Bitboard, node: int) -> None:
+        moves = board.legal_moves()
+        terminal = []
+        for move in moves:
+            board.push(move)
+            terminal.append(board.check_victory() is not None)
+            board.pop()
+        self.first_child[node] = self._add_nodes(node, moves, terminal)
+        self.child_counts[node] = len(moves)
+
+    def _select_child(self, node: int) -> int:
+        first = self.first_child[node]
+        visits = self.visits
+        rewards = self.rewards
+        log_visits = math.log(visits[node] or 1)
+        exploration = self.exploration
+
+        best_child = first
+        best_score = -1.0
+        for child in range(first, first + self.child_counts[node]):
+            child_visits = visits[child]
+            if not child_visits:
+                return child
+            score = rewards[child] / child_visits + exploration * math.sqrt(
+                log_visits / child_visits
+            )
+            if score > best_score:
+                best_score = score
+                best_child = child
+        return best_child
+
+    def _playout(self, board: Bitboard) -> Optional[int]:
+        rng = self.rng
+        played = 0
+        winner = board.check_victory()
+        while winner is None and played < self.playout_limit:
+            moves = board.legal_moves()
+            move = self._winning_move(board, moves) if self.heavy_playouts else None
+            board.push(move if move is not None else rng.choice(moves))
+            played += 1
+            winner = board.check_victory()
+
+        for _ in range(played):
+            board.pop()
+        return winner
+
+    @staticmethod
+    def _winning_move(board: Bitboard, moves: List[int]) -> Optional[int]:
+        turn = board.turn
+        enemy_master = board.masters[1 - turn]
+        own_master = board.masters[turn]
+        goal_row = GOAL_ROWS[turn]
+        for move in moves:
+            to_bit = 1 << (move >> 5 & 31)
+            if to_bit & enemy_master or (
+                own_master >> (move & 31) & 1 and to_bit & goal_row
+            ):
+                return move
+        return None
+
+    def _iterate(self, board: Bitboard) -> None:
+        node = 0
+        path = [0]
+        movers = [1 - board.turn]
+
+        # Selection, stopping at a terminal node or one without children
+        while self.child_counts[node] and not self.terminal[node]:
+            node = self._select_child(node)
+            movers.append(board.turn)
+            board.push(self.moves[node])
+            path.append(node)
+
+        if (
+            not self.terminal[node]
+            and self.visits[node]
+            and len(self.parents) + MAX_MOVES <= self.max_nodes
+        ):
+            self._expand(board, node)
+            node = self._select_child(node)
+            movers.append(board.turn)
+            board.push(self.moves[node])
+            path.append(node)
+
+        winner = self._playout(board)
+
+        for index in range(len(path) - 1, -1, -1):
+            node = path[index]
+            self.visits[node] += 1
+            if winner is None:
+                self.rewards[node] += DRAW
+            elif winner == movers[index]:
+                self.rewards[node] += 1.0
+            if index:
+                board.pop()
+
+    def search(
+        self,
+        board: Bitboard,
+        iterations: Optional[int] = None,
+        time_limit: Optional[float] = None,
+    ) -> int:
+        _check_budget(iterations, time_limit)
+        if self.root_hash != board.hash:
+            self._reset()
+            self.root_hash = board.hash
+        if not self.child_counts[0]:
+            self._expand(board, 0)
+
+        deadline = time.perf_counter() + time_limit if time_limit is not None else None
+        done = 0
+        while iterations is None or done < iterations:
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+            self._iterate(board)
+            done += 1
+        return self.best_move()
+
+    def best_move(self) -> int:
+        if not self.child_counts[0]:
+            raise ValueError("The root has not been expanded yet")
+        first = self.first_child[0]
+        children = range(first, first + self.child_counts[0])
+        return self.moves[max(children, key=self.visits.__getitem__)]
+
+    def root_statistics(self) -> List[Tuple[int, int, float]]:
+        first = self.first_child[0]
+        return [
+            (self.moves[child], self.visits[child], self.rewards[child])
+            for child in range(first, first + self.child_counts[0])
+        ]
+
+    def advance(self, move: int) -> bool:
+        """Keeps the subtree under move as the new tree. Returns False and
+        starts over when the move was never expanded."""
+        first = self.first_child[0]
+        for child in range(first, first + self.child_counts[0]):
+            if self.moves[child] == move:
+                self._reroot(child)
+                return True
+
+        self._reset()
+        self.root_hash = None
+        return False
+
+    def follow(self, board: Bitboard, history_length: int) -> None:
+        """Advances through the moves board played after its history had
+        history_length entries, keeping whatever subtree survives."""
+        kept = self.root_hash is not None
+        for entry in board.history[history_length:]:
+            kept = kept and self.advance(entry & MOVE_MASK)
+        self.root_hash = board.hash if kept else None
+
+    def _reroot(self, root: int) -> None:
+        old = (
+            self.moves,
+            self.visits,
+            self.rewards,
+            self.first_child,
+            self.child_counts,
+            self.terminal,
+        )
+        old_moves, old_visits, old_rewards, old_first, old_counts, old_terminal = old
+        self._reset()
+        self.visits[0] = old_visits[root]
+        self.rewards[0] = old_rewards[root]
+
+        # Breadth-first copy, so every block of children stays contiguous
+        queue = [(root, 0)]
+        for old_node, new_node in queue:
+            count = old_counts[old_node]
+            if not count:
+                continue
+            start = old_first[old_node]
+            children = range(start, start + count)
+            first = self._add_nodes(
+                new_node,
+                [old_moves[child] for child in children],
+                [old_terminal[child] for child in children],
+            )
+            for offset, child in enumerate(children):
+                self.visits[first + offset] = old_visits[child]
+                self.rewards[first + offset] = old_rewards[child]
+                queue.append((child, first + offset))
+            self.first_child[new_node] = first
+            self.child_counts[new_node] = count
+
+
+class MCTSPlayer(Player):
+    def __init__(
+        self,
+        color: Color,
+        time_limit: Optional[float] = 1.0,
+        iterations: Optional[int] = None,
+        heavy_playouts: bool = True,
+    ):
+        super().__init__(color)
+        _check_budget(iterations, time_limit)
+        self.time_limit = time_limit
+        self.iterations = iterations
+        self.tree = MCTS(heavy_playouts=heavy_playouts)
+        self._history_length = 0
+
+    def choose_move(self, game) -> Tuple[str, int, int, int, int]:
+        board = game.engine
+        self.tree.follow(board, self._history_length)
+        move = self.tree.search(board, self.iterations, self.time_limit)
+        self._history_length = len(board.history)
+        return move_to_input(move)
@@ -1,60 +1,90 @@
 import random
 from typing import List, Optional, Tuple
 
-from .card import Card
+from .bitboard import (
+    BLUE,
+    CARD_IDS,
+    NUM_SQUARES,
+    RED,
+    Bitboard,
+    square,
+    square_coords,
+)
+from .card import CARDS, Card
 from .constants import Color
+from .encoding import encode_text
 from .piece import Piece, Rank
 from .player import Player
+from .state import GameState
 
 
 class Onitama:
-    def __init__(self):
-        self.board = [[None] * 5 for _ in range(5)]
+    def __init__(
+        self,
+        red_player: Optional[Player] = None,
+        blue_player: Optional[Player] = None,
+        seed: Optional[int] = None,
+    ):
+        # Every game gets its own generator, so a game is reproducible from
+        # its seed and games in different threads or processes don't interfere
+        self.seed = seed if seed is not None else random.randrange(2**32)
+        self.rng = random.Random(self.seed)
+
         self.cards = self.generate_cards()
-        self.current_cards = random.sample(self.cards, 5)
-        self.red_cards = self.current_cards[:2]
-        self.blue_cards = self.current_cards[2:4]
-        self.neutral_card = self.current_cards[4]
-
-        self.red_player = Player(Color.RED)
-        self.blue_player = Player(Color.BLUE)
-
-        starting_player_color = Color.RED if random.random() < 0.5 else Color.BLUE
-        self.current_player = (
-            self.red_player if starting_player_color == Color.RED else self.blue_player
-        )
-
-        self.setup_board()
-
-    def generate_cards(self) -> List[Card]:
-        card_tuples = [
-            ("Tiger", [(0, -2), (0, 1)]),
-            ("Dragon", [(-2, -1), (-1, 1), (2, -1), (1, 1)]),
-            ("Frog", [(-2, 0), (-1, -1), (1, 1)]),
-            ("Rabbit", [(1, -1), (2, 0), (-1, 1)]),
-            ("Crab", [(0, -1), (-2, 0), (2, 0)]),
-            ("Elephant", [(1, 0), (-1, -1), (1, -1), (-1, 0)]),
-            ("Goose", [(-1, 0), (-1, -1), (1, 0), (1, 1)]),
-            ("Rooster", [(1, 0), (1, -1), (-1, 0), (-1, 1)]),
-            ("Monkey", [(-1, -1), (1, -1), (-1, 1), (1, 1)]),
-            ("Mantis", [(-1, -1), (1, -1), (0, 1)]),
-            ("Horse", [(0, -1), (-1, 0), (0, 1)]),
-            ("Ox", [(0, -1), (1, 0), (0, 1)]),
-            ("Crane", [(0, -1), (1, 1), (-1, 1)]),
-            ("Boar", [(0, -1), (1, 0), (-1, 0)]),
-            ("Eel", [(1, 0), (-1, -1), (-1, 1)]),
-            ("Cobra", [(-1, 0), (1, -1), (1, 1)]),
+        self.engine = Bitboard.deal(self.rng)
+        self.current_cards = [
+            self.cards[card]
+            for card in self.engine.hands[RED]
+            + self.engine.hands[BLUE]
+            + [self.engine.neutral_card]
         ]
-        return [Card.from_tuple(card_tuple) for card_tuple in card_tuples]
 
-    def setup_board(self):
-        for i in range(5):
-            if i == 2:
-                self.board[0][i] = Piece(Color.RED, Rank.MASTER, i, 0)
-                self.board[4][i] = Piece(Color.BLUE, Rank.MASTER, i, 4)
-            else:
-                self.board[0][i] = Piece(Color.RED, Rank.STUDENT, i, 0)
-                self.board[4][i] = Piece(Color.BLUE, Rank.STUDENT, i, 4)
+        self.red_player = red_player or Player(Color.RED)
+        self.blue_player = blue_player or Player(Color.BLUE)
+
+    def generate_cards(self) -> Tuple[Card, ...]:
+        # The cards are built once for every game
+        return CARDS
+
+    @property
+    def board(self) -> List[List[Optional[Piece]]]:
+        board = [[None] * 5 for _ in range(5)]
+        for sq in range(NUM_SQUARES):
+            occupant = self.engine.piece_at(sq)
+            if occupant is not None:
+                color, is_master = occupant
+                x, y = square_coords(sq)
+                board[y][x] = Piece(
+                    Color.RED if color == RED else Color.BLUE,
+                    Rank.MASTER if is_master else Rank.STUDENT,
+                    x,
+                    y,
+                )
+        return board
+
+    @property
+    def current_player(self) -> Player:
+        return self.red_player if self.engine.turn == RED else self.blue_player
+
+    @property
+    def red_cards(self) -> List[Card]:
+        return [self.cards[card] for card in self.engine.hands[RED]]
+
+    @property
+    def blue_cards(self) -> List[Card]:
+        return [self.cards[card] for card in self.engine.hands[BLUE]]
+
+    @property
+    def neutral_card(self) -> Card:
+        return self.cards[self.engine.neutral_card]
+
+    @property
+    def position_hash(self) -> int:
+        return self.engine.hash
+
+    def snapshot(self) -> GameState:
+        """Returns the current position as an immutable GameState."""
+        return GameState.from_board(self.engine)
 
     def display_board(self):
         print("  0  1  2  3  4")
@@ -72,92 +102,46 @@ class Onitama:
         print("  0  1  2  3  4")
 
     def get_valid_moves(self, x: int, y: int) -> List[Tuple[Card, int, int]]:
-        piece = self.board[y][x]
-        if piece is None:
-            return []
-
-        if piece.color != self.current_player.color:
-            return []
-
-        card_list = (
-            self.red_cards
-            if self.current_player.color == Color.RED
-            else self.blue_cards
-        )
-        moves = []
-        for card in card_list:
-            for move in card.moves:
-                # Invert the moves for the red player
-                if piece.color == Color.RED:
-                    move = move.invert()
-
-                nx, ny = x + move.x, y + move.y
-                if (
-                    0 <= nx < 5
-                    and 0 <= ny < 5
-                    and (
-                        self.board[ny][nx] is None
-                        or self.board[ny][nx].color != piece.color
-                    )
-                ):
-                    moves.append((card, nx, ny))
-        return moves
+        cards = self.cards
+        return [
+            (cards[card], to_sq % 5, to_sq // 5)
+            for card, to_sq in self.engine.get_valid_moves(square(x, y))
+        ]
 
     def move_piece(self, x: int, y: int, nx: int, ny: int) -> None:
-        moving_piece = self.board[y][x]
-        moving_piece.x = nx
-        moving_piece.y = ny
-        self.board[ny][nx] = moving_piece
-        self.board[y][x] = None
+        self.engine.move_piece(square(x, y), square(nx, ny))
 
     def make_move(
         self, card_name: str, x: int, y: int, nx: int, ny: int
     ) -> Optional[Player]:
-        color = self.current_player.color
-        if color == Color.RED:
-            card_index = [card.name for card in self.red_cards].index(card_name)
-            self.neutral_card, self.red_cards[card_index] = (
-                self.red_cards[card_index],
-                self.neutral_card,
-            )
-        else:
-            card_index = [card.name for card in self.blue_cards].index(card_name)
-            self.neutral_card, self.blue_cards[card_index] = (
-                self.blue_cards[card_index],
-                self.neutral_card,
+        card = CARD_IDS.get(card_name)
+        if card not in self.engine.hands[self.engine.turn]:
+            raise ValueError(f"{card_name!r} is not a card of the current player")
+        sq, to_sq = square(x, y), square(nx, ny)
+        if (card, to_sq) not in self.engine.get_valid_moves(sq):
+            raise ValueError(
+                f"{card_name} can't move a piece of the current player "
+                f"from ({x}, {y}) to ({nx}, {ny})"
             )
+        winner = self.engine.make_move(card, sq, to_sq)
+        return self._player(winner)
+
+    def legal_moves(self) -> List[int]:
+        return self.engine.legal_moves()
 
-        self.move_piece(x, y, nx, ny)
-        self.current_player = (
-            self.blue_player
-            if self.current_player == self.red_player
-            else self.red_player
-        )
-        return self.check_victory()
-
-    def check_victory(self):
-        red_master = None
-        blue_master = None
-
-        for y in range(5):
-            for x in range(5):
-                piece = self.board[y][x]
-                if piece and piece.color == Color.RED and piece.rank == Rank.MASTER:
-                    red_master = piece
-                elif piece and piece.color == Color.BLUE and piece.rank == Rank.MASTER:
-                    blue_master = piece
-
-        if red_master is None:
-            return self.blue_player
-        if blue_master is None:
-            return self.red_player
-
-        if red_master.y == 4:
-            return self.red_player
-        if blue_master.y == 0:
-            return self.blue_player
-
-        return None
+    def push(self, move: int) -> None:
+        self.engine.push(move)
+
+    def pop(self) -> int:
+        return self.engine.pop()
+
+    def check_victory(self) -> Optional[Player]:
+        return self._player(self.engine.check_victory())
+
+    def _player(self, color: Optional[int]) -> Optional[Player]:
+        if color is None:
+            return None
+        return self.red_player if color == RED else self.blue_player
 
     def validate_input(self, move_input: str) -> Tuple[bool, str]:
         parts = move_input.split()
@@ -184,26 +168,21 @@ class Onitama:
                 "Invalid coordinates. All coordinates must be between 0 and 4.",
             )
 
-        current_player_cards = (
-            [card.name for card in self.red_cards]
-            if self.current_player.color == Color.RED
-            else [card.name for card in self.blue_cards]
-        )
-
-        if card_name not in current_player_cards:
+        hand = self.engine.hands[self.engine.turn]
+        if CARD_IDS.get(card_name) not in hand:
             return (
                 False,
-                f"Invalid card name. Available cards for current player: {current_player_cards}",
+                f"Invalid card name. Available cards for current player: {[self.cards[card].name for card in hand]}",
             )
 
-        piece = self.board[y][x]
-        if piece is None:
+        occupant = self.engine.piece_at(square(x, y))
+        if occupant is None:
             return (
                 False,
                 "No piece at the given coordinates. Please choose a piece to move.",
             )
 
-        if piece.color != self.current_player.color:
+        if occupant[0] != self.engine.turn:
             return (
                 False,
                 "The selected piece does not belong to the current player. Please choose a piece of your own color.",
@@ -225,21 +204,25 @@ class Onitama:
             card_name, x, y, nx, ny = move_input.split()
             x, y, nx, ny = int(x), int(y), int(nx), int(ny)
 
-            moves = self.get_valid_moves(x, y)
-            valid_move = any(
-                move[0].name == card_name and move[1] == nx and move[2] == ny
-                for move in moves
-            )
+            valid_move = (
+                CARD_IDS[card_name],
+                square(nx, ny),
+            ) in self.engine.get_valid_moves(square(x, y))
 
             if valid_move:
                 return card_name, x, y, nx, ny
             else:
                 print("Invalid move. Please try again.")
 
-    def get_game_state(self):
+    def get_game_state(self) -> dict:
+        """Returns the position as plain JSON-compatible values."""
         return {
-            "board": self.board,
-            "current_player": self.current_player,
+            "position": encode_text(self.engine),
+            "board": [
+                [piece.to_dict() if piece is not None else None for piece in row]
+                for row in self.board
+            ],
+            "current_player": self.current_player.color.value,
             "red_cards": [card.name for card in self.red_cards],
             "blue_cards": [card.name for card in self.blue_cards],
             "neutral_card": self.neutral_card.name,
@@ -253,7 +236,7 @@ class Onitama:
             print(f"Blue cards: {[card.name for card in self.blue_cards]}")
             print(f"Neutral card: '{self.neutral_card.name}'")
 
-            card_name, x, y, nx, ny = self.prompt_move()
+            card_name, x, y, nx, ny = self.current_player.choose_move(self)
             winner = self.make_move(card_name, x, y, nx, ny)
             if winner is not None:
                 print(f"{repr(winner)} wins!")
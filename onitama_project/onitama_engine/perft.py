@@ -0,0 +1,232 @@
+import argparse
+import copy
+import importlib.util
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from .bitboard import BLUE, RED, Bitboard, decode_move, is_pass, square_coords
+from .card import CARD_NAMES
+
+# Leaf counts for depths 1 to 5 from the position dealt by
+# Bitboard.deal(random.Random(seed)). A position where the game is over has
+# no moves, so it only counts as a leaf at the requested depth.
+REFERENCE_COUNTS: Dict[int, List[int]] = {
+    0: [9, 81, 1107, 11908, 162680],
+    1: [13, 130, 1590, 22260, 294864],
+    2: [12, 120, 1560, 20700, 261227],
+    3: [12, 144, 2460, 36009, 566347],
+    4: [9, 99, 1298, 15606, 226994],
+    5: [13, 169, 2067, 28740, 410619],
+    6: [8, 80, 880, 10040, 135278],
+    7: [9, 72, 752, 9001, 121009],
+}
+
+
+def perft(board: Bitboard, depth: int) -> int:
+    if depth == 0:
+        return 1
+
+    moves = board.legal_moves()
+    if depth == 1:
+        return len(moves)
+
+    nodes = 0
+    for move in moves:
+        board.push(move)
+        if board.check_victory() is None:
+            nodes += perft(board, depth - 1)
+        board.pop()
+    return nodes
+
+
+def divide(board: Bitboard, depth: int) -> Dict[int, int]:
+    counts = {}
+    for move in board.legal_moves():
+        board.push(move)
+        if depth == 1:
+            counts[move] = 1
+        elif board.check_victory() is None:
+            counts[move] = perft(board, depth - 1)
+        else:
+            counts[move] = 0
+        board.pop()
+    return counts
+
+
+def format_move(move: int) -> str:
+    card, sq, to_sq = decode_move(move)
+    name = CARD_NAMES[card]
+    if is_pass(move):
+        return f"{name} pass"
+    x, y = square_coords(sq)
+    nx, ny = square_coords(to_sq)
+    return f"{name} {x} {y} {nx} {ny}"
+
+
+def _load_legacy_engine():
+    # The tuple-based engine lives in a module whose name is not importable
+    path = Path(__file__).with_name("gpt4-impl.py")
+    spec = importlib.util.spec_from_file_location("onitama_engine_legacy", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def legacy_game(board: Bitboard):
+    legacy = _load_legacy_engine()
+    game = legacy.Onitama.__new__(legacy.Onitama)
+    cards = game.generate_cards()
+    colors = {RED: "red", BLUE: "blue"}
+
+    game.board = [[None] * 5 for _ in range(5)]
+    for sq in range(25):
+        occupant = board.piece_at(sq)
+        if occupant is not None:
+            color, is_master = occupant
+            x, y = square_coords(sq)
+            game.board[y][x] = (colors[color], "master" if is_master else "student")
+    game.red_cards = [cards[card] for card in board.hands[RED]]
+    game.blue_cards = [cards[card] for card in board.hands[BLUE]]
+    game.neutral_card = cards[board.neutral_card]
+    game.current_player = colors[board.turn]
+    return game
+
+
+def legacy_perft(game, depth: int) -> int:
+    """Counts leaves with the legacy engine, deep-copying for every move."""
+    if depth == 0:
+        return 1
+
+    moves = [
+        (card_name, x, y, nx, ny)
+        for y in range(5)
+        for x in range(5)
+        for card_name, nx, ny in game.get_valid_moves(x, y)
+    ]
+    if not moves:
+        # The legacy engine has no pass move, so exchange cards by hand
+        hand = game.red_cards if game.current_player == "red" else game.blue_cards
+        nodes = 0
+        for index in range(len(hand)):
+            child = copy.deepcopy(game)
+            child_hand = (
+                child.red_cards if child.current_player == "red" else child.blue_cards
+            )
+            child.neutral_card, child_hand[index] = (
+                child_hand[index],
+                child.neutral_card,
+            )
+            child.current_player = "blue" if child.current_player == "red" else "red"
+            nodes += legacy_perft(child, depth - 1)
+        return nodes
+
+    nodes = 0
+    for move in moves:
+        child = copy.deepcopy(game)
+        winner = child.make_move(*move)
+        if depth == 1:
+            nodes += 1
+        elif winner is None:
+            nodes += legacy_perft(child, depth - 1)
+    return nodes
+
+
+def check_reference_counts(
+    max_depth: int, oracle_depth: int = 0, min_nodes_per_second: float = 0.0
+) -> bool:
+    passed = True
+    total_nodes = 0
+    total_time = 0.0
+
+    for seed, counts in REFERENCE_COUNTS.items():
+        board = Bitboard.deal(random.Random(seed))
+        for depth, expected in enumerate(counts[:max_depth], start=1):
+            start = time.perf_counter()
+            nodes = perft(board, depth)
+            total_time += time.perf_counter() - start
+            total_nodes += nodes
+
+            status = "ok" if nodes == expected else f"MISMATCH (expected {expected})"
+            print(f"seed {seed} depth {depth}: {nodes} {status}")
+            passed &= nodes == expected
+
+            if depth <= oracle_depth:
+                oracle_nodes = legacy_perft(legacy_game(board), depth)
+                if oracle_nodes != nodes:
+                    print(
+                        f"seed {seed} depth {depth}: legacy engine counts {oracle_nodes}"
+                    )
+                    passed = False
+
+    nodes_per_second = total_nodes / total_time if total_time else 0.0
+    print(f"{total_nodes} nodes in {total_time:.2f}s ({nodes_per_second:.0f} nodes/s)")
+    if nodes_per_second < min_nodes_per_second:
+        print(f"throughput below {min_nodes_per_second:.0f} nodes/s")
+        passed = False
+    return passed
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m onitama_engine.perft")
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0, help="seed of the card deal")
+    parser.add_argument(
+        "--divide", action="store_true", help="break the count down by root move"
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="verify the stored reference counts up to --depth",
+    )
+    parser.add_argument(
+        "--oracle-depth",
+        type=int,
+        default=0,
+        help="also compare against the legacy engine up to this depth",
+    )
+    parser.add_argument(
+        "--min-nps",
+        type=float,
+        default=0.0,
+        help="fail when throughput drops below this many nodes per second",
+    )
+    args = parser.parse_args(argv)
+
+    if args.check:
+        passed = check_reference_counts(args.depth, args.oracle_depth, args.min_nps)
+        return 0 if passed else 1
+
+    board = Bitboard.deal(random.Random(args.seed))
+    start = time.perf_counter()
+    if args.divide:
+        counts = divide(board, args.depth)
+        for move, count in sorted(
+            counts.items(), key=lambda item: format_move(item[0])
+        ):
+            print(f"{format_move(move)}: {count}")
+        nodes = sum(counts.values())
+    else:
+        nodes = perft(board, args.depth)
+    elapsed = time.perf_counter() - start
+    nodes_per_second = nodes / elapsed if elapsed else 0.0
+    print(
+        f"perft({args.depth}) = {nodes} in {elapsed:.2f}s ({nodes_per_second:.0f} nodes/s)"
+    )
+
+    if args.depth <= args.oracle_depth:
+        oracle_nodes = legacy_perft(legacy_game(board), args.depth)
+        print(f"legacy engine: {oracle_nodes}")
+        if oracle_nodes != nodes:
+            return 1
+
+    if nodes_per_second < args.min_nps:
+        print(f"throughput below {args.min_nps:.0f} nodes/s")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,6 @@
 from enum import Enum, auto
 
 from .constants import Color
-from .move import Move
 
 
 class Rank(Enum):
@@ -16,10 +15,6 @@ class Piece:
         self.x = x
         self.y = y
 
-    def apply_move(self, move: Move):
-        self.x += move.x
-        self.y += move.y
-
     def to_dict(self):
         return {
             "color": self.color.value,
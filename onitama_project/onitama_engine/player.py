@@ -5,5 +5,8 @@ class Player:
     def __init__(self, color: Color):
         self.color = color
 
+    def choose_move(self, game):
+        return game.prompt_move()
+
     def __repr__(self):
         return f"{self.color.name.capitalize()} Player"
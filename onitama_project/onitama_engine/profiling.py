@@ -0,0 +1,64 @@
+import functools
+import time
+from typing import Callable, Dict, Iterable
+
+from .bitboard import Bitboard
+
+# Bitboard methods that can be profiled
+PROFILED = ("get_valid_moves", "legal_moves", "make_move", "push", "pop")
+
+
+class FunctionStats:
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+
+
+# Kept through disable(), so profiling can be paused and resumed
+stats: Dict[str, FunctionStats] = {name: FunctionStats() for name in PROFILED}
+_originals: Dict[str, Callable] = {}
+
+
+def _wrap(function: Callable, function_stats: FunctionStats) -> Callable:
+    clock = time.perf_counter
+
+    @functools.wraps(function)
+    def profiled(*args, **kwargs):
+        start = clock()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            function_stats.calls += 1
+            function_stats.seconds += clock() - start
+
+    return profiled
+
+
+def enable(names: Iterable[str] = PROFILED):
+    """Counts calls to and time spent in the named Bitboard methods.
+
+    The methods are swapped for timing wrappers on the class itself, and
+    disable() puts the originals back, so while profiling is off the engine
+    runs exactly the code it would without this module.
+    """
+    for name in names:
+        if name in _originals:
+            continue
+        _originals[name] = getattr(Bitboard, name)
+        setattr(Bitboard, name, _wrap(_originals[name], stats[name]))
+
+
+def disable():
+    for name, function in _originals.items():
+        setattr(Bitboard, name, function)
+    _originals.clear()
+
+
+def is_enabled() -> bool:
+    return bool(_originals)
+
+
+def reset():
+    for function_stats in stats.values():
+        function_stats.calls = 0
+        function_stats.seconds = 0.0
@@ -0,0 +1,380 @@
+import argparse
+import json
+import random
+import sqlite3
+import struct
+import sys
+import threading
+import time
+from array import array
+from typing import (
+    BinaryIO,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from .bitboard import BLUE, CARD_IDS, MOVE_MASK, RED, Bitboard
+from .book import deal_key
+from .encoding import decode_text
+
+MAGIC = b"ONIGR\x00\x00\x01"
+# Five dealt cards, the starting side, the winner (-1 for none), the seed
+# (-1 for none) and the number of moves that follow as little-endian uint16s
+RECORD_HEADER = struct.Struct("<5BBbqH")
+COLOR_IDS = {"red": RED, "blue": BLUE}
+
+
+class GameRecord(NamedTuple):
+    """A finished game: the deal, the moves played from it and the result.
+
+    cards are red's two, blue's two and the neutral card as dealt, turn is
+    the side that moved first and winner is None for a game cut short.
+    """
+
+    cards: Tuple[int, ...]
+    turn: int
+    moves: Tuple[int, ...]
+    winner: Optional[int]
+    seed: Optional[int] = None
+
+    @classmethod
+    def from_game(cls, game) -> "GameRecord":
+        """Records an Onitama game, whose deal follows from its seed."""
+        start = Bitboard.deal(random.Random(game.seed))
+        engine = game.engine
+        return cls(
+            tuple(start.hands[RED] + start.hands[BLUE] + [start.neutral_card]),
+            start.turn,
+            tuple(entry & MOVE_MASK for entry in engine.history),
+            engine.winner,
+            game.seed,
+        )
+
+    @classmethod
+    def from_selfplay(cls, result: dict) -> "GameRecord":
+        """Converts a line of selfplay output."""
+        winner = result["winner"]
+        return cls(
+            tuple(CARD_IDS[name] for name in result["cards"]),
+            COLOR_IDS[result["first_player"]],
+            tuple(result["moves"]),
+            COLOR_IDS[winner] if winner is not None else None,
+            result.get("seed"),
+        )
+
+    def start(self) -> Bitboard:
+        return Bitboard(self.cards, self.turn)
+
+    def positions(self) -> Iterator[Tuple[Bitboard, Optional[int]]]:
+        """Yields the board before each move with the move played from it,
+        then the final board with None. The same board is yielded each time,
+        moved on between steps."""
+        board = self.start()
+        for move in self.moves:
+            yield board, move
+            board.push(move)
+        yield board, None
+
+    def encode(self) -> bytes:
+        header = RECORD_HEADER.pack(
+            *self.cards,
+            self.turn,
+            -1 if self.winner is None else self.winner,
+            -1 if self.seed is None else self.seed,
+            len(self.moves),
+        )
+        moves = array("H", self.moves)
+        if sys.byteorder == "big":
+            moves.byteswap()
+        return header + moves.tobytes()
+
+    @classmethod
+    def decode(cls, data: bytes) -> "GameRecord":
+        *cards, turn, winner, seed, count = RECORD_HEADER.unpack_from(data)
+        moves = array("H")
+        moves.frombytes(data[RECORD_HEADER.size : RECORD_HEADER.size + 2 * count])
+        if sys.byteorder == "big":
+            moves.byteswap()
+        return cls(
+            tuple(cards),
+            turn,
+            tuple(moves),
+            None if winner < 0 else winner,
+            None if seed < 0 else seed,
+        )
+
+
+def write_records(stream: BinaryIO, records: Iterable[GameRecord]) -> int:
+    """Appends records to a binary stream, starting it with the format's
+    magic if it is empty, and returns how many were written."""
+    if stream.tell() == 0:
+        stream.write(MAGIC)
+    count = 0
+    for record in records:
+        stream.write(record.encode())
+        count += 1
+    return count
+
+
+def read_records(stream: BinaryIO) -> Iterator[GameRecord]:
+    """Reads records one at a time, stopping at a record cut short by an
+    interrupted write."""
+    if stream.read(len(MAGIC)) != MAGIC:
+        raise ValueError("not an Onitama game record stream")
+    while True:
+        header = stream.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return
+        count = RECORD_HEADER.unpack(header)[-1]
+        moves = stream.read(2 * count)
+        if len(moves) < 2 * count:
+            return
+        yield GameRecord.decode(header + moves)
+
+
+def load_records(path: str) -> Iterator[GameRecord]:
+    """Reads a record stream file or selfplay JSON lines."""
+    with open(path, "rb") as records_file:
+        if records_file.read(len(MAGIC)) == MAGIC:
+            records_file.seek(0)
+            yield from read_records(records_file)
+            return
+    with open(path) as lines:
+        for line in lines:
+            if line.strip():
+                yield GameRecord.from_selfplay(json.loads(line))
+
+
+class ReplyStats(NamedTuple):
+    move: int
+    games: int
+    # From the point of view of the side playing the move
+    wins: int
+    losses: int
+
+
+def _signed(key: int) -> int:
+    # SQLite integers are signed 64 bit
+    return key - (1 << 64) if key >= 1 << 63 else key
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    deal INTEGER NOT NULL,
+    seed INTEGER,
+    winner INTEGER,
+    plies INTEGER NOT NULL,
+    record BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS games_deal ON games (deal);
+CREATE TABLE IF NOT EXISTS positions (
+    hash INTEGER NOT NULL,
+    game INTEGER NOT NULL,
+    ply INTEGER NOT NULL,
+    move INTEGER,
+    PRIMARY KEY (hash, game, ply)
+) WITHOUT ROWID;
+"""
+
+
+class GameStore:
+    """Game records in an SQLite file, indexed by position and by deal.
+
+    Every position of every game is a row keyed by its Zobrist hash, stored
+    clustered by hash, so the games through a position and the results of
+    each reply from it are read off one range of the index however many
+    games the store holds. Games are also indexed by the set of five cards
+    in play, the same key the opening book groups by.
+
+    The store can be shared between threads; calls run one at a time.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.execute("PRAGMA synchronous = NORMAL")
+        self._connection.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self) -> "GameStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM games").fetchone()[0]
+
+    def add(self, records: Iterable[GameRecord]) -> List[int]:
+        """Stores records in one transaction and returns their ids."""
+        ids = []
+        with self._lock, self._connection:
+            for record in records:
+                cursor = self._connection.execute(
+                    "INSERT INTO games (deal, seed, winner, plies, record) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (
+                        deal_key(record.cards),
+                        record.seed,
+                        record.winner,
+                        len(record.moves),
+                        record.encode(),
+                    ),
+                )
+                game = cursor.lastrowid
+                # A position repeated within a game keeps its first move
+                rows = {}
+                for ply, (board, move) in enumerate(record.positions()):
+                    rows.setdefault(board.hash, (ply, move))
+                self._connection.executemany(
+                    "INSERT INTO positions (hash, game, ply, move) VALUES (?, ?, ?, ?)",
+                    [
+                        (_signed(key), game, ply, move)
+                        for key, (ply, move) in rows.items()
+                    ],
+                )
+                ids.append(game)
+        return ids
+
+    def get(self, game: int) -> GameRecord:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT record FROM games WHERE id = ?", (game,)
+            ).fetchone()
+        if row is None:
+            raise KeyError(game)
+        return GameRecord.decode(row[0])
+
+    def games_reaching(self, board: Bitboard, limit: int = 100) -> List[int]:
+        """Ids of games that passed through the position."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT game FROM positions WHERE hash = ? LIMIT ?",
+                (_signed(board.hash), limit),
+            ).fetchall()
+        return [game for (game,) in rows]
+
+    def count_reaching(self, board: Bitboard) -> int:
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM positions WHERE hash = ?", (_signed(board.hash),)
+            ).fetchone()[0]
+
+    def replies(self, board: Bitboard) -> List[ReplyStats]:
+        """How often each move was played from the position and how the
+        games went for the side that played it, most played first."""
+        turn = board.turn
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT positions.move, COUNT(*), "
+                "SUM(games.winner = ?), SUM(games.winner = ?) "
+                "FROM positions JOIN games ON games.id = positions.game "
+                "WHERE positions.hash = ? AND positions.move IS NOT NULL "
+                "GROUP BY positions.move ORDER BY COUNT(*) DESC, positions.move",
+                (turn, 1 - turn, _signed(board.hash)),
+            ).fetchall()
+        return [ReplyStats(*row) for row in rows]
+
+    def games_with_cards(self, cards: Sequence[int], limit: int = 100) -> List[int]:
+        """Ids of games played with these five cards, however they were
+        dealt."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id FROM games WHERE deal = ? LIMIT ?", (deal_key(cards), limit)
+            ).fetchall()
+        return [game for (game,) in rows]
+
+    def games_like(self, board: Bitboard, limit: int = 100) -> List[int]:
+        return self.games_with_cards(
+            board.hands[RED] + board.hands[BLUE] + [board.neutral_card], limit
+        )
+
+    def records(self, batch_size: int = 1000) -> Iterator[GameRecord]:
+        """Every record, in the order they were added, read a batch at a
+        time."""
+        last = 0
+        while True:
+            with self._lock:
+                rows = self._connection.execute(
+                    "SELECT id, record FROM games WHERE id > ? ORDER BY id LIMIT ?",
+                    (last, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            for _, data in rows:
+                yield GameRecord.decode(data)
+            last = rows[-1][0]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m onitama_engine.records")
+    parser.add_argument("store", help="SQLite file to add to or query")
+    parser.add_argument(
+        "--add",
+        action="append",
+        default=[],
+        help="record stream or selfplay JSON-lines file to add",
+    )
+    parser.add_argument(
+        "--position", help="show the replies played from this text position"
+    )
+    parser.add_argument(
+        "--export", help="write every stored game to this record stream file"
+    )
+    args = parser.parse_args(argv)
+
+    with GameStore(args.store) as store:
+        for path in args.add:
+            start = time.perf_counter()
+            added = 0
+            batch: List[GameRecord] = []
+            for record in load_records(path):
+                batch.append(record)
+                if len(batch) == 1000:
+                    added += len(store.add(batch))
+                    batch = []
+            added += len(store.add(batch))
+            print(
+                f"{added} games from {path} added in "
+                f"{time.perf_counter() - start:.1f}s",
+                file=sys.stderr,
+            )
+
+        if args.export:
+            with open(args.export, "ab") as output:
+                exported = write_records(output, store.records())
+            print(f"{exported} games written to {args.export}", file=sys.stderr)
+
+        if args.position:
+            board = decode_text(args.position)
+            start = time.perf_counter()
+            replies = store.replies(board)
+            reached = store.count_reaching(board)
+            print(
+                json.dumps(
+                    {
+                        "position": args.position,
+                        "games": reached,
+                        "replies": [reply._asdict() for reply in replies],
+                        "seconds": round(time.perf_counter() - start, 4),
+                    },
+                    indent=2,
+                )
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
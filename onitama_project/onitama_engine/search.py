@@ -0,0 +1,340 @@
+import time
+from typing import Callable, List, Optional, Tuple
+
+from .bitboard import BLUE, GOAL_ROWS, RED, Bitboard, decode_move, square_coords
+from .card import CARD_NAMES
+from .constants import Color
+from .player import Player
+from .tablebase import LOSS as TABLEBASE_LOSS
+from .tablebase import WIN as TABLEBASE_WIN
+from .tablebase import Tablebase
+from .transposition import EXACT, LOWER_BOUND, NO_MOVE, UPPER_BOUND, TranspositionTable
+
+WIN = 100_000
+MAX_DEPTH = 64
+INFINITY = WIN + 1
+# Scores beyond this are forced wins or losses and carry a distance
+WIN_THRESHOLD = WIN - 2 * MAX_DEPTH
+
+STUDENT_VALUE = 100
+MASTER_ADVANCE_VALUE = 10
+
+# The clock is checked once per this many nodes
+CLOCK_INTERVAL = 256
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+def evaluate(board: Bitboard) -> int:
+    turn = board.turn
+    enemy = 1 - turn
+    score = STUDENT_VALUE * (
+        board.students[turn].bit_count() - board.students[enemy].bit_count()
+    )
+
+    red_row = board.master_squares[RED] // 5
+    blue_row = board.master_squares[BLUE] // 5
+    red_distance, blue_distance = 4 - red_row, blue_row
+    advance = blue_distance - red_distance
+    score += MASTER_ADVANCE_VALUE * (advance if turn == RED else -advance)
+    return score
+
+
+class SearchResult:
+    def __init__(
+        self,
+        move: int,
+        score: int,
+        depth: int,
+        pv: List[int],
+        nodes: int,
+        elapsed: float,
+    ):
+        self.move = move
+        self.score = score
+        self.depth = depth
+        self.pv = pv
+        self.nodes = nodes
+        self.elapsed = elapsed
+
+    @property
+    def nodes_per_second(self) -> float:
+        return self.nodes / self.elapsed if self.elapsed else 0.0
+
+    def __repr__(self):
+        return (
+            f"SearchResult(move={self.move}, score={self.score}, "
+            f"depth={self.depth}, pv={self.pv}, nodes={self.nodes})"
+        )
+
+
+class Searcher:
+    def __init__(
+        self,
+        table: Optional[TranspositionTable] = None,
+        evaluate: Callable[[Bitboard], int] = evaluate,
+        tablebase: Optional[Tablebase] = None,
+    ):
+        self.table = table if table is not None else TranspositionTable()
+        self.evaluate = evaluate
+        self.tablebase = tablebase
+        self.board: Optional[Bitboard] = None
+        self.nodes = 0
+        self.deadline = 0.0
+
+    def search(
+        self, board: Bitboard, time_limit: float, max_depth: int = MAX_DEPTH
+    ) -> SearchResult:
+        start = time.perf_counter()
+        self.board = board
+        self.nodes = 0
+        self.deadline = start + time_limit
+        self.table.new_search()
+
+        history_length = len(board.history)
+        moves = self.order_moves(board.legal_moves(), NO_MOVE)
+        result = SearchResult(moves[0], 0, 0, [moves[0]], 0, 0.0)
+
+        for depth in range(1, max_depth + 1):
+            try:
+                score, pv = self._search_root(moves, depth)
+            except SearchTimeout:
+                while len(board.history) > history_length:
+                    board.pop()
+                break
+
+            elapsed = time.perf_counter() - start
+            result = SearchResult(pv[0], score, depth, pv, self.nodes, elapsed)
+            # Search the previous best line first on the next iteration
+            moves.remove(pv[0])
+            moves.insert(0, pv[0])
+
+            if abs(score) > WIN_THRESHOLD:
+                break
+            # An iteration takes several times longer than the last one, so
+            # starting another past half the budget would only be thrown away
+            if elapsed > time_limit / 2:
+                break
+
+        result.nodes = self.nodes
+        result.elapsed = time.perf_counter() - start
+        return result
+
+    def analyze(
+        self, board: Bitboard, time_limit: float, max_depth: int = MAX_DEPTH
+    ) -> List[SearchResult]:
+        """Scores every legal move with its own line, best first.
+
+        Unlike search() no move is cut off for being worse than the best one,
+        so each score is exact to the depth reached."""
+        start = time.perf_counter()
+        self.board = board
+        self.nodes = 0
+        self.deadline = start + time_limit
+        self.table.new_search()
+
+        history_length = len(board.history)
+        moves = self.order_moves(board.legal_moves(), NO_MOVE)
+        results = [SearchResult(move, 0, 0, [move], 0, 0.0) for move in moves]
+
+        for depth in range(1, max_depth + 1):
+            scored = []
+            try:
+                for move in moves:
+                    board.push(move)
+                    if board.check_victory() is not None:
+                        score, child_pv = WIN - 1, []
+                    else:
+                        score, child_pv = self._negamax(
+                            depth - 1, -INFINITY, INFINITY, 1
+                        )
+                        score = -score
+                    board.pop()
+                    scored.append((score, [move] + child_pv))
+            except SearchTimeout:
+                while len(board.history) > history_length:
+                    board.pop()
+                break
+
+            elapsed = time.perf_counter() - start
+            scored.sort(key=lambda entry: entry[0], reverse=True)
+            results = [
+                SearchResult(pv[0], score, depth, pv, self.nodes, elapsed)
+                for score, pv in scored
+            ]
+            moves = [result.move for result in results]
+
+            if all(abs(result.score) > WIN_THRESHOLD for result in results):
+                break
+            if elapsed > time_limit / 2:
+                break
+
+        return results
+
+    def order_moves(self, moves: List[int], table_move: int) -> List[int]:
+        board = self.board
+        turn = board.turn
+        enemy = 1 - turn
+        enemy_master = board.masters[enemy]
+        enemy_students = board.students[enemy]
+        own_master = board.masters[turn]
+        goal_row = GOAL_ROWS[turn]
+
+        def priority(move: int) -> int:
+            if move == table_move:
+                return 5
+            from_bit = 1 << (move & 31)
+            to_bit = 1 << (move >> 5 & 31)
+            if to_bit & enemy_master:
+                return 4
+            if own_master & from_bit and to_bit & goal_row:
+                return 4
+            if to_bit & enemy_students:
+                return 3
+            if own_master & from_bit:
+                return 2
+            return 0
+
+        moves.sort(key=priority, reverse=True)
+        return moves
+
+    def _search_root(self, moves: List[int], depth: int) -> Tuple[int, List[int]]:
+        board = self.board
+        alpha = -INFINITY
+        best_pv = [moves[0]]
+
+        for move in moves:
+            board.push(move)
+            if board.check_victory() is not None:
+                score, child_pv = WIN - 1, []
+            else:
+                score, child_pv = self._negamax(depth - 1, -INFINITY, -alpha, 1)
+                score = -score
+            board.pop()
+
+            if score > alpha:
+                alpha = score
+                best_pv = [move] + child_pv
+
+        self.table.store(board.hash, depth, alpha, EXACT, best_pv[0])
+        return alpha, best_pv
+
+    def _negamax(
+        self, depth: int, alpha: int, beta: int, ply: int
+    ) -> Tuple[int, List[int]]:
+        self.nodes += 1
+        if not self.nodes % CLOCK_INTERVAL and time.perf_counter() > self.deadline:
+            raise SearchTimeout
+
+        board = self.board
+        if self.tablebase is not None:
+            entry = self.tablebase.probe(board)
+            if entry is not None:
+                outcome, distance = entry
+                if outcome == TABLEBASE_WIN:
+                    return WIN - ply - distance, []
+                if outcome == TABLEBASE_LOSS:
+                    return -(WIN - ply - distance), []
+                return 0, []
+
+        if depth <= 0:
+            return self.evaluate(board), []
+
+        table = self.table
+        key = board.hash
+        table_move = NO_MOVE
+        entry = table.probe(key)
+        if entry is not None:
+            entry_depth, score, flag, table_move = entry
+            if entry_depth >= depth:
+                score = _score_from_table(score, ply)
+                if (
+                    flag == EXACT
+                    or (flag == LOWER_BOUND and score >= beta)
+                    or (flag == UPPER_BOUND and score <= alpha)
+                ):
+                    return score, [table_move] if table_move != NO_MOVE else []
+
+        original_alpha = alpha
+        best_score = -INFINITY
+        best_move = NO_MOVE
+        best_pv: List[int] = []
+
+        for move in self.order_moves(board.legal_moves(), table_move):
+            board.push(move)
+            if board.check_victory() is not None:
+                score, child_pv = WIN - ply - 1, []
+            else:
+                score, child_pv = self._negamax(depth - 1, -beta, -alpha, ply + 1)
+                score = -score
+            board.pop()
+
+            if score > best_score:
+                best_score = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    best_pv = [move] + child_pv
+                    if alpha >= beta:
+                        break
+
+        if best_score <= original_alpha:
+            flag = UPPER_BOUND
+        elif best_score >= beta:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        table.store(key, depth, _score_to_table(best_score, ply), flag, best_move)
+        return best_score, best_pv
+
+
+def _score_to_table(score: int, ply: int) -> int:
+    # Forced results are stored relative to the node rather than the root
+    if score > WIN_THRESHOLD:
+        return score + ply
+    if score < -WIN_THRESHOLD:
+        return score - ply
+    return score
+
+
+def _score_from_table(score: int, ply: int) -> int:
+    if score > WIN_THRESHOLD:
+        return score - ply
+    if score < -WIN_THRESHOLD:
+        return score + ply
+    return score
+
+
+def move_to_input(move: int) -> Tuple[str, int, int, int, int]:
+    card, sq, to_sq = decode_move(move)
+    x, y = square_coords(sq)
+    nx, ny = square_coords(to_sq)
+    return CARD_NAMES[card], x, y, nx, ny
+
+
+class SearchPlayer(Player):
+    def __init__(
+        self,
+        color: Color,
+        time_limit: float = 1.0,
+        tablebase: Optional[Tablebase] = None,
+        book=None,
+    ):
+        super().__init__(color)
+        self.time_limit = time_limit
+        self.searcher = Searcher(tablebase=tablebase)
+        # An OpeningBook; its module imports this one
+        self.book = book
+        self.last_result: Optional[SearchResult] = None
+
+    def choose_move(self, game) -> Tuple[str, int, int, int, int]:
+        entry = self.book.probe(game.engine) if self.book is not None else None
+        if entry is not None and entry[0] in game.engine.legal_moves():
+            move, score, depth = entry
+            self.last_result = SearchResult(move, score, depth, [move], 0, 0.0)
+            return move_to_input(move)
+
+        self.last_result = self.searcher.search(game.engine, self.time_limit)
+        return move_to_input(self.last_result.move)
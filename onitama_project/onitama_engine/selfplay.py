@@ -0,0 +1,198 @@
+import argparse
+import json
+import multiprocessing
+import random
+import sys
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from .bitboard import BLUE, RED, Bitboard
+from .book import OpeningBook
+from .card import CARD_NAMES
+from .mcts import MCTS
+from .search import WIN, Searcher, evaluate
+from .transposition import TranspositionTable
+
+Agent = Callable[[Bitboard], int]
+
+COLOR_NAMES = {RED: "red", BLUE: "blue"}
+
+
+def random_agent(rng: random.Random, options: dict) -> Agent:
+    def choose(board: Bitboard) -> int:
+        return rng.choice(board.legal_moves())
+
+    return choose
+
+
+def greedy_agent(rng: random.Random, options: dict) -> Agent:
+    def choose(board: Bitboard) -> int:
+        best_score = None
+        best_moves = []
+        for move in board.legal_moves():
+            board.push(move)
+            if board.check_victory() is not None:
+                score = WIN
+            else:
+                score = -evaluate(board)
+            board.pop()
+
+            if best_score is None or score > best_score:
+                best_score = score
+                best_moves = [move]
+            elif score == best_score:
+                best_moves.append(move)
+        return rng.choice(best_moves)
+
+    return choose
+
+
+def search_agent(rng: random.Random, options: dict) -> Agent:
+    evaluator = evaluate
+    if options["weights"]:
+        # Only the weighted evaluator needs NumPy
+        from .evaluation import Evaluator
+
+        evaluator = Evaluator.load(options["weights"])
+    searcher = Searcher(TranspositionTable(options["table_size"]), evaluator)
+    time_limit = options["time"] if options["time"] else float("inf")
+    book = OpeningBook(options["book"]) if options["book"] else None
+
+    def choose(board: Bitboard) -> int:
+        move = book.move(board) if book is not None else None
+        if move is not None:
+            return move
+        return searcher.search(board, time_limit, options["depth"]).move
+
+    return choose
+
+
+def mcts_agent(rng: random.Random, options: dict) -> Agent:
+    tree = MCTS(heavy_playouts=True, rng=rng)
+    time_limit = options["time"] or None
+    history_length = 0
+
+    def choose(board: Bitboard) -> int:
+        nonlocal history_length
+        tree.follow(board, history_length)
+        move = tree.search(board, options["iterations"], time_limit)
+        history_length = len(board.history)
+        return move
+
+    return choose
+
+
+AGENTS: Dict[str, Callable[[random.Random, dict], Agent]] = {
+    "random": random_agent,
+    "greedy": greedy_agent,
+    "search": search_agent,
+    "mcts": mcts_agent,
+}
+
+
+def play_game(task: Tuple[int, int, str, str, dict]) -> dict:
+    game_number, seed, red_agent, blue_agent, options = task
+    # The deal and every agent decision come from the game's own generator
+    rng = random.Random(seed)
+    board = Bitboard.deal(rng)
+    cards = [
+        CARD_NAMES[card]
+        for card in board.hands[RED] + board.hands[BLUE] + [board.neutral_card]
+    ]
+    first_player = COLOR_NAMES[board.turn]
+    agents = (AGENTS[red_agent](rng, options), AGENTS[blue_agent](rng, options))
+
+    start = time.perf_counter()
+    winner: Optional[int] = None
+    moves = []
+    while winner is None and len(moves) < options["max_plies"]:
+        move = agents[board.turn](board)
+        moves.append(move)
+        board.push(move)
+        winner = board.check_victory()
+
+    return {
+        "game": game_number,
+        "seed": seed,
+        "red": red_agent,
+        "blue": blue_agent,
+        "cards": cards,
+        "first_player": first_player,
+        "winner": COLOR_NAMES[winner] if winner is not None else None,
+        "plies": len(moves),
+        "moves": moves,
+        "seconds": round(time.perf_counter() - start, 4),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m onitama_engine.selfplay")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--red", choices=sorted(AGENTS), default="random")
+    parser.add_argument("--blue", choices=sorted(AGENTS), default="random")
+    parser.add_argument(
+        "--seed", type=int, default=0, help="game i is played with seed + i"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=multiprocessing.cpu_count(), help="processes"
+    )
+    parser.add_argument(
+        "--output", default="-", help="JSON-lines file to append to, - for stdout"
+    )
+    parser.add_argument("--max-plies", type=int, default=200)
+    parser.add_argument("--depth", type=int, default=3, help="search agent depth")
+    parser.add_argument(
+        "--time",
+        type=float,
+        default=0.0,
+        help="search and mcts agent seconds per move; games are only "
+        "reproducible without it",
+    )
+    parser.add_argument("--table-size", type=int, default=1 << 16)
+    parser.add_argument("--book", help="opening book for the search agent")
+    parser.add_argument(
+        "--weights", help="evaluation weights file for the search agent"
+    )
+    parser.add_argument(
+        "--iterations", type=int, default=1000, help="mcts agent iterations per move"
+    )
+    args = parser.parse_args(argv)
+
+    options = {
+        "max_plies": args.max_plies,
+        "depth": args.depth,
+        "time": args.time,
+        "table_size": args.table_size,
+        "iterations": args.iterations,
+        "book": args.book,
+        "weights": args.weights,
+    }
+    tasks = [
+        (game, args.seed + game, args.red, args.blue, options)
+        for game in range(args.games)
+    ]
+
+    output = sys.stdout if args.output == "-" else open(args.output, "a")
+    wins = {"red": 0, "blue": 0, None: 0}
+    start = time.perf_counter()
+    try:
+        with multiprocessing.Pool(args.workers) as pool:
+            for result in pool.imap_unordered(play_game, tasks):
+                output.write(json.dumps(result) + "\n")
+                output.flush()
+                wins[result["winner"]] += 1
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"{args.games} games in {elapsed:.1f}s: red {wins['red']}, "
+        f"blue {wins['blue']}, unfinished {wins[None]}",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+from typing import Optional, Tuple
+
+from .bitboard import (
+    BLUE,
+    GOAL_ROWS,
+    MOVE_CARD_SHIFT,
+    NO_SQUARE,
+    RED,
+    Bitboard,
+)
+from .encoding import encode_text
+from .zobrist import CARD_KEYS, MASTER_KEYS, NEUTRAL, STUDENT_KEYS, TURN_KEY
+
+
+class GameState:
+    """An immutable position, for branching off a game without copying it.
+
+    apply() returns a new state and leaves this one alone, sharing every
+    field the move didn't touch, so a variation costs a handful of small
+    tuples per move. Since a state never changes, fork() is the state
+    itself. States hash by their Zobrist key, so they can key dictionaries,
+    and pickle as a few integers.
+
+    The fields mirror Bitboard's, so the Bitboard move generators run on
+    states unchanged.
+    """
+
+    __slots__ = (
+        "students",
+        "masters",
+        "hands",
+        "neutral_card",
+        "turn",
+        "hash",
+        "winner",
+    )
+
+    def __init__(
+        self,
+        students: Tuple[int, int],
+        masters: Tuple[int, int],
+        hands: Tuple[Tuple[int, int], Tuple[int, int]],
+        neutral_card: int,
+        turn: int,
+        key: Optional[int] = None,
+        winner: Optional[int] = None,
+    ):
+        setter = object.__setattr__
+        setter(self, "students", students)
+        setter(self, "masters", masters)
+        setter(self, "hands", hands)
+        setter(self, "neutral_card", neutral_card)
+        setter(self, "turn", turn)
+        setter(self, "hash", self.compute_hash() if key is None else key)
+        setter(self, "winner", winner)
+
+    @classmethod
+    def from_board(cls, board: Bitboard) -> "GameState":
+        return cls(
+            tuple(board.students),
+            tuple(board.masters),
+            (tuple(board.hands[RED]), tuple(board.hands[BLUE])),
+            board.neutral_card,
+            board.turn,
+            board.hash,
+            board.winner,
+        )
+
+    def to_board(self) -> Bitboard:
+        """Returns a Bitboard at this position, without history."""
+        board = Bitboard(
+            list(self.hands[RED] + self.hands[BLUE]) + [self.neutral_card], self.turn
+        )
+        board.students = list(self.students)
+        board.masters = list(self.masters)
+        board.hash = self.hash
+        board.sync()
+        return board
+
+    def fork(self) -> "GameState":
+        return self
+
+    def apply(self, move: int) -> "GameState":
+        """Returns the state after a legal move."""
+        turn = self.turn
+        enemy = 1 - turn
+        hand = self.hands[turn]
+        card = move >> MOVE_CARD_SHIFT
+        neutral_card = self.neutral_card
+        if hand[0] == card:
+            new_hand = (neutral_card, hand[1])
+        else:
+            new_hand = (hand[0], neutral_card)
+        hands = (new_hand, self.hands[1]) if turn == RED else (self.hands[0], new_hand)
+
+        owned = CARD_KEYS[turn]
+        neutral = CARD_KEYS[NEUTRAL]
+        key = self.hash ^ TURN_KEY
+        key ^= owned[card] ^ neutral[card] ^ neutral[neutral_card] ^ owned[neutral_card]
+
+        students = self.students
+        masters = self.masters
+        winner = self.winner
+        sq = move & 31
+        to_sq = move >> 5 & 31
+        if sq != to_sq:
+            bit = 1 << sq
+            to_bit = 1 << to_sq
+            own_students = students[turn]
+            own_master = masters[turn]
+            enemy_students = students[enemy]
+            enemy_master = masters[enemy]
+            if enemy_students & to_bit:
+                enemy_students ^= to_bit
+                key ^= STUDENT_KEYS[enemy][to_sq]
+            elif enemy_master & to_bit:
+                enemy_master = 0
+                key ^= MASTER_KEYS[enemy][to_sq]
+                if winner is None:
+                    winner = turn
+
+            if own_master & bit:
+                own_master ^= bit | to_bit
+                key ^= MASTER_KEYS[turn][sq] ^ MASTER_KEYS[turn][to_sq]
+                if winner is None and to_bit & GOAL_ROWS[turn]:
+                    winner = turn
+            else:
+                own_students ^= bit | to_bit
+                key ^= STUDENT_KEYS[turn][sq] ^ STUDENT_KEYS[turn][to_sq]
+
+            if turn == RED:
+                students = (own_students, enemy_students)
+                masters = (own_master, enemy_master)
+            else:
+                students = (enemy_students, own_students)
+                masters = (enemy_master, own_master)
+
+        return GameState(students, masters, hands, card, enemy, key, winner)
+
+    def check_victory(self) -> Optional[int]:
+        return self.winner
+
+    @property
+    def master_squares(self) -> Tuple[int, int]:
+        red_master, blue_master = self.masters
+        return (
+            red_master.bit_length() - 1 if red_master else NO_SQUARE,
+            blue_master.bit_length() - 1 if blue_master else NO_SQUARE,
+        )
+
+    @property
+    def piece_counts(self) -> Tuple[int, int]:
+        return (
+            (self.students[RED] | self.masters[RED]).bit_count(),
+            (self.students[BLUE] | self.masters[BLUE]).bit_count(),
+        )
+
+    # The read-only parts of Bitboard only look at the fields above
+    compute_hash = Bitboard.compute_hash
+    piece_at = Bitboard.piece_at
+    pieces = Bitboard.pieces
+    destinations = Bitboard.destinations
+    get_valid_moves = Bitboard.get_valid_moves
+    get_move_masks = Bitboard.get_move_masks
+    count_moves = Bitboard.count_moves
+    legal_moves = Bitboard.legal_moves
+
+    def __setattr__(self, name, value):
+        raise AttributeError("GameState is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("GameState is immutable")
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, GameState):
+            return NotImplemented
+        return (
+            self.hash == other.hash
+            and self.turn == other.turn
+            and self.students == other.students
+            and self.masters == other.masters
+            and self.neutral_card == other.neutral_card
+            # The order of a hand doesn't matter
+            and set(self.hands[RED]) == set(other.hands[RED])
+            and set(self.hands[BLUE]) == set(other.hands[BLUE])
+        )
+
+    def __hash__(self) -> int:
+        return self.hash
+
+    def __reduce__(self):
+        return (
+            GameState,
+            (
+                self.students,
+                self.masters,
+                self.hands,
+                self.neutral_card,
+                self.turn,
+                self.hash,
+                self.winner,
+            ),
+        )
+
+    def __repr__(self) -> str:
+        return f"GameState({encode_text(self)!r})"
@@ -0,0 +1,142 @@
+from typing import Optional, Tuple, Union
+
+from .bitboard import (
+    BLUE,
+    MOVE_CARD_SHIFT,
+    NUM_SQUARES,
+    RED,
+    Bitboard,
+    encode_move,
+    is_pass,
+    square,
+    square_coords,
+)
+from .card import CARDS
+from .state import GameState
+
+Position = Union[Bitboard, GameState]
+
+# Transforms are bit sets, so combining two is xor. MIRROR reflects the
+# board left to right, which swaps every card for its mirror image. SWAP
+# turns the board around and exchanges the colours, leaving the cards alone.
+# Each transform is its own inverse.
+IDENTITY = 0
+MIRROR = 1
+SWAP = 2
+TRANSFORMS = (IDENTITY, MIRROR, SWAP, MIRROR | SWAP)
+
+
+def _mirror_card(card: int) -> int:
+    offsets = {(-dx, dy) for dx, dy in CARDS[card].offsets}
+    return next(other.id for other in CARDS if set(other.offsets) == offsets)
+
+
+MIRROR_CARDS: Tuple[int, ...] = tuple(_mirror_card(card.id) for card in CARDS)
+
+
+def _transform_square(sq: int, transform: int) -> int:
+    x, y = square_coords(sq)
+    # Turning the board around also reverses each row
+    if bool(transform & MIRROR) != bool(transform & SWAP):
+        x = 4 - x
+    if transform & SWAP:
+        y = 4 - y
+    return square(x, y)
+
+
+# SQUARES[transform][sq]
+SQUARES: Tuple[Tuple[int, ...], ...] = tuple(
+    tuple(_transform_square(sq, transform) for sq in range(NUM_SQUARES))
+    for transform in TRANSFORMS
+)
+_REVERSED_ROWS = tuple(int(f"{row:05b}"[::-1], 2) for row in range(32))
+
+
+def transform_mask(mask: int, transform: int) -> int:
+    reverse_rows = bool(transform & MIRROR) != bool(transform & SWAP)
+    result = 0
+    for y in range(5):
+        row = mask >> 5 * y & 31
+        if reverse_rows:
+            row = _REVERSED_ROWS[row]
+        result |= row << 5 * (4 - y if transform & SWAP else y)
+    return result
+
+
+def transform_card(card: int, transform: int) -> int:
+    return MIRROR_CARDS[card] if transform & MIRROR else card
+
+
+def transform_color(color: Optional[int], transform: int) -> Optional[int]:
+    if color is None or not transform & SWAP:
+        return color
+    return 1 - color
+
+
+def transform_move(move: int, transform: int) -> int:
+    """Maps a move of a position to the same move in the transformed one,
+    or back again, since transforms are their own inverses."""
+    card = transform_card(move >> MOVE_CARD_SHIFT, transform)
+    if is_pass(move):
+        # Passes are generated with both squares zero
+        return encode_move(card, 0, 0)
+    squares = SQUARES[transform]
+    return encode_move(card, squares[move & 31], squares[move >> 5 & 31])
+
+
+def transform_position(board: Position, transform: int) -> GameState:
+    hands = tuple(
+        tuple(transform_card(card, transform) for card in board.hands[color])
+        for color in (RED, BLUE)
+    )
+    students = tuple(transform_mask(mask, transform) for mask in board.students)
+    masters = tuple(transform_mask(mask, transform) for mask in board.masters)
+    if transform & SWAP:
+        hands = hands[::-1]
+        students = students[::-1]
+        masters = masters[::-1]
+    return GameState(
+        students,
+        masters,
+        hands,
+        transform_card(board.neutral_card, transform),
+        transform_color(board.turn, transform),
+        winner=transform_color(board.winner, transform),
+    )
+
+
+def _order_key(board: Position, transform: int) -> tuple:
+    students = [transform_mask(mask, transform) for mask in board.students]
+    masters = [transform_mask(mask, transform) for mask in board.masters]
+    hands = [
+        sorted(transform_card(card, transform) for card in board.hands[color])
+        for color in (RED, BLUE)
+    ]
+    if transform & SWAP:
+        students.reverse()
+        masters.reverse()
+        hands.reverse()
+    return students, masters, hands
+
+
+def canonical(board: Position) -> Tuple[GameState, int]:
+    """Returns the representative of a position's symmetry class and the
+    transform that maps the position onto it.
+
+    The representative always has red to move. Of the two candidates left,
+    the one whose five cards sort first is chosen, so every position of a
+    game shares one set of cards; when the set is its own mirror image the
+    pieces decide. Results stored for the representative apply to the
+    original through the same transform: transform_move() maps moves,
+    scores for the side to move are unchanged and colours go through
+    transform_color().
+    """
+    transform = SWAP if board.turn == BLUE else IDENTITY
+    cards = sorted((*board.hands[RED], *board.hands[BLUE], board.neutral_card))
+    mirrored = sorted(MIRROR_CARDS[card] for card in cards)
+    if mirrored < cards or (
+        mirrored == cards
+        and _order_key(board, transform | MIRROR) < _order_key(board, transform)
+    ):
+        transform |= MIRROR
+    return transform_position(board, transform), transform
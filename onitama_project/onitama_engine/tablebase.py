@@ -0,0 +1,469 @@
+import argparse
+import mmap
+import struct
+import sys
+import time
+from array import array
+from itertools import combinations
+from math import comb
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
+
+from .bitboard import (
+    BLUE,
+    CARD_IDS,
+    DESTINATIONS,
+    GOAL_ROWS,
+    NUM_SQUARES,
+    RED,
+    Bitboard,
+)
+from .state import GameState
+from .symmetry import (
+    IDENTITY,
+    MIRROR,
+    MIRROR_CARDS,
+    SWAP,
+    transform_card,
+    transform_color,
+    transform_mask,
+)
+
+MAGIC = b"ONITB\x00\x00\x02"
+HEADER = struct.Struct("<8sB5B2x")
+VALUE = struct.Struct("<H")
+
+WIN = 1
+DRAW = 0
+LOSS = -1
+
+# Stored values are 0 for a draw (or a position that cannot occur) and
+# otherwise the distance to the end of the game in plies plus one. An odd
+# distance is a win for the side to move and an even one a loss.
+UNKNOWN = 0
+
+# Every way to split a deal into red's pair, blue's pair and the neutral card,
+# as indices into the sorted deal
+ARRANGEMENTS: List[Tuple[Tuple[int, int], Tuple[int, int], int]] = []
+_ARRANGEMENT_INDEX = {}
+for _red in combinations(range(5), 2):
+    for _blue in combinations([card for card in range(5) if card not in _red], 2):
+        (_neutral,) = set(range(5)) - set(_red) - set(_blue)
+        _key = (1 << _red[0] | 1 << _red[1]) << 5 | 1 << _blue[0] | 1 << _blue[1]
+        _ARRANGEMENT_INDEX[_key] = len(ARRANGEMENTS)
+        ARRANGEMENTS.append((_red, _blue, _neutral))
+
+# Students are coded as color * 25 + square
+STUDENT_CODES = 2 * NUM_SQUARES
+
+
+def _student_offsets(max_students: int) -> List[int]:
+    offsets = [0]
+    for count in range(max_students + 1):
+        offsets.append(offsets[-1] + comb(STUDENT_CODES, count))
+    return offsets
+
+
+class TableLayout:
+    """Maps positions of one deal with both masters and up to max_students
+    students to dense indices.
+
+    An index is laid out as side to move, card arrangement, red master
+    square, blue master square and the rank of the sorted student codes in
+    the combinatorial number system. Generation needs both sides to move,
+    but a position with blue to move is the colour swap of one with red to
+    move, so only the first half, red to move, is stored. The same half
+    also answers for the mirrored deal.
+    """
+
+    def __init__(self, cards: Sequence[int], max_students: int):
+        self.cards = tuple(sorted(cards))
+        self.positions = {card: position for position, card in enumerate(self.cards)}
+        self.max_students = max_students
+        self.offsets = _student_offsets(max_students)
+        self.student_configurations = self.offsets[-1]
+        self.size = 2 * len(ARRANGEMENTS) * NUM_SQUARES**2 * self.student_configurations
+        self.stored_size = self.size // 2
+
+    def transform(self, board: Union[Bitboard, GameState]) -> Optional[int]:
+        """Returns the transform that takes a covered position to one with
+        red to move and this deal, or None if the table doesn't cover it."""
+        if (board.students[RED] | board.students[BLUE]).bit_count() > self.max_students:
+            return None
+        if not (board.masters[RED] and board.masters[BLUE]):
+            return None
+        transform = SWAP if board.turn == BLUE else IDENTITY
+        deal = sorted((*board.hands[RED], *board.hands[BLUE], board.neutral_card))
+        if tuple(deal) != self.cards:
+            if tuple(sorted(MIRROR_CARDS[card] for card in deal)) != self.cards:
+                return None
+            transform |= MIRROR
+        return transform
+
+    def covers(self, board: Union[Bitboard, GameState]) -> bool:
+        return self.transform(board) is not None
+
+    def arrangement(self, red_hand: Sequence[int], blue_hand: Sequence[int]) -> int:
+        positions = self.positions
+        red = 1 << positions[red_hand[0]] | 1 << positions[red_hand[1]]
+        blue = 1 << positions[blue_hand[0]] | 1 << positions[blue_hand[1]]
+        return _ARRANGEMENT_INDEX[red << 5 | blue]
+
+    def student_rank(self, red_students: int, blue_students: int) -> int:
+        rank = 0
+        count = 0
+        for students, base in ((red_students, 0), (blue_students, NUM_SQUARES)):
+            while students:
+                bit = students & -students
+                students ^= bit
+                count += 1
+                rank += comb(base + bit.bit_length() - 1, count)
+        return self.offsets[count] + rank
+
+    def index(
+        self,
+        turn: int,
+        arrangement: int,
+        red_master: int,
+        blue_master: int,
+        red_students: int,
+        blue_students: int,
+    ) -> int:
+        index = (turn * len(ARRANGEMENTS) + arrangement) * NUM_SQUARES + red_master
+        index = index * NUM_SQUARES + blue_master
+        return index * self.student_configurations + self.student_rank(
+            red_students, blue_students
+        )
+
+    def board_index(
+        self, board: Union[Bitboard, GameState], transform: int = IDENTITY
+    ) -> int:
+        """Returns the index of the position the transform maps board to."""
+        if transform == IDENTITY:
+            return self.index(
+                board.turn,
+                self.arrangement(board.hands[RED], board.hands[BLUE]),
+                board.masters[RED].bit_length() - 1,
+                board.masters[BLUE].bit_length() - 1,
+                board.students[RED],
+                board.students[BLUE],
+            )
+
+        hands = [
+            [transform_card(card, transform) for card in board.hands[color]]
+            for color in (RED, BLUE)
+        ]
+        masters = [transform_mask(mask, transform) for mask in board.masters]
+        students = [transform_mask(mask, transform) for mask in board.students]
+        if transform & SWAP:
+            hands.reverse()
+            masters.reverse()
+            students.reverse()
+        return self.index(
+            transform_color(board.turn, transform),
+            self.arrangement(hands[RED], hands[BLUE]),
+            masters[RED].bit_length() - 1,
+            masters[BLUE].bit_length() - 1,
+            students[RED],
+            students[BLUE],
+        )
+
+    def student_sets(self) -> Iterator[Tuple[int, int]]:
+        for count in range(self.max_students + 1):
+            for codes in combinations(range(STUDENT_CODES), count):
+                red = blue = 0
+                for code in codes:
+                    if code < NUM_SQUARES:
+                        red |= 1 << code
+                    else:
+                        blue |= 1 << code - NUM_SQUARES
+                if not red & blue:
+                    yield red, blue
+
+
+def _has_piece_move(own: int, pieces: int, hand: Sequence[int], turn: int) -> bool:
+    for card in hand:
+        targets = DESTINATIONS[card][turn]
+        remaining = pieces
+        while remaining:
+            bit = remaining & -remaining
+            remaining ^= bit
+            if targets[bit.bit_length() - 1] & ~own:
+                return True
+    return False
+
+
+def generate(cards: Sequence[int], max_students: int) -> Tuple[TableLayout, array]:
+    layout = TableLayout(cards, max_students)
+    values = array("H", bytes(2 * layout.size))
+    remaining = bytearray(layout.size)
+    board = Bitboard(layout.cards, RED)
+    frontier: List[int] = []
+    wins_in_one: List[int] = []
+
+    # Seed the search with finished games and immediate master captures, and
+    # count the moves of every other position
+    for turn in (RED, BLUE):
+        board.turn = turn
+        enemy = 1 - turn
+        for arrangement, (red, blue, neutral) in enumerate(ARRANGEMENTS):
+            board.hands = [
+                [layout.cards[red[0]], layout.cards[red[1]]],
+                [layout.cards[blue[0]], layout.cards[blue[1]]],
+            ]
+            board.neutral_card = layout.cards[neutral]
+            for red_students, blue_students in layout.student_sets():
+                students = red_students | blue_students
+                board.students = [red_students, blue_students]
+                for red_master in range(NUM_SQUARES):
+                    red_bit = 1 << red_master
+                    if students & red_bit:
+                        continue
+                    for blue_master in range(NUM_SQUARES):
+                        blue_bit = 1 << blue_master
+                        if (students | red_bit) & blue_bit:
+                            continue
+                        board.masters = [red_bit, blue_bit]
+                        board.sync()
+                        index = layout.index(
+                            turn,
+                            arrangement,
+                            red_master,
+                            blue_master,
+                            red_students,
+                            blue_students,
+                        )
+
+                        winner = board.check_victory()
+                        if winner is not None:
+                            # Only the side that just moved can have won
+                            if winner == enemy:
+                                values[index] = 1
+                                frontier.append(index)
+                            continue
+
+                        moves = board.legal_moves()
+                        enemy_master = board.masters[enemy]
+                        if any(enemy_master >> (move >> 5 & 31) & 1 for move in moves):
+                            values[index] = 2
+                            wins_in_one.append(index)
+                        else:
+                            remaining[index] = len(moves)
+
+    distance = 0
+    while frontier:
+        next_frontier = wins_in_one if distance == 0 else []
+        won = distance % 2 == 0
+        for index in frontier:
+            for predecessor in _predecessors(layout, index):
+                if values[predecessor] != UNKNOWN:
+                    continue
+                if won:
+                    # The position is lost for its side to move, so moving
+                    # into it wins
+                    values[predecessor] = distance + 2
+                    next_frontier.append(predecessor)
+                else:
+                    remaining[predecessor] -= 1
+                    if not remaining[predecessor]:
+                        values[predecessor] = distance + 2
+                        next_frontier.append(predecessor)
+        frontier = next_frontier
+        distance += 1
+    return layout, values
+
+
+def _decode(layout: TableLayout, index: int) -> Tuple[int, int, int, int, int, int]:
+    index, rank = divmod(index, layout.student_configurations)
+    index, blue_master = divmod(index, NUM_SQUARES)
+    index, red_master = divmod(index, NUM_SQUARES)
+    turn, arrangement = divmod(index, len(ARRANGEMENTS))
+
+    count = 0
+    while layout.offsets[count + 1] <= rank:
+        count += 1
+    rank -= layout.offsets[count]
+    red_students = blue_students = 0
+    # Largest code first, as in the combinatorial number system
+    code = STUDENT_CODES
+    for place in range(count, 0, -1):
+        code -= 1
+        while comb(code, place) > rank:
+            code -= 1
+        rank -= comb(code, place)
+        if code < NUM_SQUARES:
+            red_students |= 1 << code
+        else:
+            blue_students |= 1 << code - NUM_SQUARES
+    return turn, arrangement, red_master, blue_master, red_students, blue_students
+
+
+def _predecessors(layout: TableLayout, index: int) -> Iterator[int]:
+    turn, arrangement, red_master, blue_master, red_students, blue_students = _decode(
+        layout, index
+    )
+    cards = layout.cards
+    red, blue, neutral = ARRANGEMENTS[arrangement]
+    hands = [[cards[red[0]], cards[red[1]]], [cards[blue[0]], cards[blue[1]]]]
+    played = cards[neutral]
+
+    # The side that just moved played the neutral card and took one of the
+    # cards it now holds
+    mover = 1 - turn
+    students = [red_students, blue_students]
+    masters = [1 << red_master, 1 << blue_master]
+    occupied = students[RED] | students[BLUE] | masters[RED] | masters[BLUE]
+    student_count = (students[RED] | students[BLUE]).bit_count()
+    # Moving a piece back from where a card sent it uses the other colour's
+    # table, whose offsets are negated
+    sources = DESTINATIONS[played][turn]
+
+    for taken in hands[mover]:
+        previous_hands = [list(hands[RED]), list(hands[BLUE])]
+        previous_hands[mover] = [
+            played if card == taken else card for card in hands[mover]
+        ]
+        previous_arrangement = layout.arrangement(
+            previous_hands[RED], previous_hands[BLUE]
+        )
+        previous_mover_hand = previous_hands[mover]
+
+        for is_master, pieces in ((True, masters[mover]), (False, students[mover])):
+            while pieces:
+                to_bit = pieces & -pieces
+                pieces ^= to_bit
+                to_sq = to_bit.bit_length() - 1
+                origins = sources[to_sq] & ~occupied
+                while origins:
+                    from_bit = origins & -origins
+                    origins ^= from_bit
+
+                    moved = [list(masters), list(students)]
+                    if is_master:
+                        moved[0][mover] ^= to_bit | from_bit
+                    else:
+                        moved[1][mover] ^= to_bit | from_bit
+                    previous_masters, previous_students = moved
+
+                    if (
+                        previous_masters[RED] & GOAL_ROWS[RED]
+                        or previous_masters[BLUE] & GOAL_ROWS[BLUE]
+                    ):
+                        continue
+
+                    yield layout.index(
+                        mover,
+                        previous_arrangement,
+                        previous_masters[RED].bit_length() - 1,
+                        previous_masters[BLUE].bit_length() - 1,
+                        previous_students[RED],
+                        previous_students[BLUE],
+                    )
+                    if student_count < layout.max_students:
+                        # The move may also have captured a student
+                        previous_students[turn] |= to_bit
+                        yield layout.index(
+                            mover,
+                            previous_arrangement,
+                            previous_masters[RED].bit_length() - 1,
+                            previous_masters[BLUE].bit_length() - 1,
+                            previous_students[RED],
+                            previous_students[BLUE],
+                        )
+
+        # A pass only happens when the mover had no piece move at all
+        if (
+            not masters[RED] & GOAL_ROWS[RED]
+            and not masters[BLUE] & GOAL_ROWS[BLUE]
+            and not _has_piece_move(
+                students[mover] | masters[mover],
+                students[mover] | masters[mover],
+                previous_mover_hand,
+                mover,
+            )
+        ):
+            yield layout.index(
+                mover,
+                previous_arrangement,
+                red_master,
+                blue_master,
+                red_students,
+                blue_students,
+            )
+
+
+def write(path: str, layout: TableLayout, values: array) -> None:
+    values = values[: layout.stored_size]
+    if sys.byteorder == "big":
+        values.byteswap()
+    with open(path, "wb") as table_file:
+        table_file.write(HEADER.pack(MAGIC, layout.max_students, *layout.cards))
+        values.tofile(table_file)
+
+
+class Tablebase:
+    """Read-only view of a generated table through mmap.
+
+    Lookups read two bytes at a computed offset, so any number of processes
+    can share one copy of the table through the page cache.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as table_file:
+            self._map = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, max_students, *cards = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an Onitama tablebase")
+        self.layout = TableLayout(cards, max_students)
+        if len(self._map) != HEADER.size + 2 * self.layout.stored_size:
+            raise ValueError(f"{path} is truncated")
+
+    def close(self) -> None:
+        self._map.close()
+
+    def value(self, index: int) -> int:
+        return VALUE.unpack_from(self._map, HEADER.size + 2 * index)[0]
+
+    def probe(self, board: Bitboard) -> Optional[Tuple[int, int]]:
+        """Returns (WIN, LOSS or DRAW, plies to the end of the game) for the
+        side to move, or None when the table doesn't cover the position."""
+        transform = self.layout.transform(board)
+        if transform is None:
+            return None
+        value = self.value(self.layout.board_index(board, transform))
+        if value == UNKNOWN:
+            return DRAW, 0
+        distance = value - 1
+        return (WIN if distance % 2 else LOSS), distance
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m onitama_engine.tablebase")
+    parser.add_argument(
+        "cards", help="the five cards of the deal, comma separated, e.g. Tiger,Ox,..."
+    )
+    parser.add_argument("output", help="file to write the table to")
+    parser.add_argument(
+        "--students",
+        type=int,
+        default=1,
+        help="solve positions with up to this many students besides both masters",
+    )
+    args = parser.parse_args(argv)
+
+    names = args.cards.split(",")
+    if len(set(names)) != 5 or any(name not in CARD_IDS for name in names):
+        parser.error(f"expected five different cards out of {sorted(CARD_IDS)}")
+
+    start = time.perf_counter()
+    layout, values = generate([CARD_IDS[name] for name in names], args.students)
+    write(args.output, layout, values)
+    solved = sum(1 for value in values[: layout.stored_size] if value != UNKNOWN)
+    print(
+        f"{layout.stored_size} entries, {solved} decided, written to {args.output} "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+from array import array
+from typing import Optional, Tuple
+
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+NO_MOVE = 0xFFFF
+
+
+class TranspositionTable:
+    """Fixed-size table of two-slot buckets.
+
+    The first slot of a bucket is depth-preferred: it is only replaced by an
+    entry searched at least as deep, or once its entry is left over from an
+    earlier search. The second slot is always replaced, so recent positions
+    are kept even when the first slot holds a deeper result.
+    """
+
+    def __init__(self, size: int = 1 << 20):
+        buckets = 1
+        while buckets * 4 <= size:
+            buckets *= 2
+        self.size = buckets * 2
+        self.mask = buckets - 1
+
+        self.keys = array("Q", bytes(8 * self.size))
+        self.depths = array("b", bytes(self.size))
+        self.scores = array("i", bytes(4 * self.size))
+        self.flags = array("B", bytes(self.size))
+        self.moves = array("H", [NO_MOVE]) * self.size
+        self.generations = array("B", bytes(self.size))
+        self.generation = 1
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def new_search(self) -> None:
+        self.generation = self.generation % 255 + 1
+
+    def clear(self) -> None:
+        self.__init__(self.size)
+
+    def probe(self, key: int) -> Optional[Tuple[int, int, int, int]]:
+        slot = (key & self.mask) << 1
+        keys = self.keys
+        if keys[slot] != key or not self.generations[slot]:
+            slot += 1
+            if keys[slot] != key or not self.generations[slot]:
+                self.misses += 1
+                return None
+
+        self.hits += 1
+        return self.depths[slot], self.scores[slot], self.flags[slot], self.moves[slot]
+
+    def store(self, key: int, depth: int, score: int, flag: int, move: int) -> None:
+        slot = (key & self.mask) << 1
+        if not (
+            self.keys[slot] == key
+            or depth >= self.depths[slot]
+            or self.generations[slot] != self.generation
+        ):
+            slot += 1
+
+        self.keys[slot] = key
+        self.depths[slot] = depth
+        self.scores[slot] = score
+        self.flags[slot] = flag
+        self.moves[slot] = move
+        self.generations[slot] = self.generation
+        self.stores += 1
+
+    @property
+    def hit_rate(self) -> float:
+        probes = self.hits + self.misses
+        return self.hits / probes if probes else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "hit_rate": self.hit_rate,
+        }
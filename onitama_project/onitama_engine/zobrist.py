@@ -0,0 +1,23 @@
+import random
+
+from .card import CARD_DEFINITIONS
+
+NUM_SQUARES = 25
+NEUTRAL = 2
+
+# A fixed seed keeps hashes stable across processes and runs, so they can be
+# stored on disk and compared between workers.
+_rng = random.Random(0x0A17A3A)
+
+
+def _random_keys(count: int):
+    return tuple(_rng.getrandbits(64) for _ in range(count))
+
+
+# STUDENT_KEYS[color][square] and MASTER_KEYS[color][square]
+STUDENT_KEYS = (_random_keys(NUM_SQUARES), _random_keys(NUM_SQUARES))
+MASTER_KEYS = (_random_keys(NUM_SQUARES), _random_keys(NUM_SQUARES))
+# CARD_KEYS[owner][card], owner being red, blue or NEUTRAL
+CARD_KEYS = tuple(_random_keys(len(CARD_DEFINITIONS)) for _ in range(3))
+# Mixed in while blue is to move
+TURN_KEY = _rng.getrandbits(64)
@@ -0,0 +1,186 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from onitama_engine.bitboard import Bitboard
+from onitama_engine.book import OpeningBook
+from onitama_engine.encoding import decode_binary, encode_binary
+from onitama_engine.search import Searcher
+
+# One searcher per worker process, so its transposition table carries over
+# from move to move
+_searcher: Optional[Searcher] = None
+_book: Optional[OpeningBook] = None
+
+
+def _init_worker(book_path: Optional[str]):
+    global _searcher, _book
+    _searcher = Searcher()
+    _book = OpeningBook(book_path) if book_path else None
+
+
+def search_move(position: bytes, time_limit: float) -> Tuple[int, int, float]:
+    """Returns the move with the nodes searched and the time it took."""
+    board = decode_binary(position)
+    if _book is not None:
+        move = _book.move(board)
+        if move is not None:
+            return move, 0, 0.0
+    result = _searcher.search(board, time_limit)
+    return result.move, result.nodes, result.elapsed
+
+
+def analyze_position(
+    position: bytes, time_limit: float
+) -> Tuple[List[Tuple[int, int, int, List[int]]], int, float]:
+    """Returns each move's score, depth and line with the nodes searched and
+    the time it took."""
+    board = decode_binary(position)
+    start = time.perf_counter()
+    results = _searcher.analyze(board, time_limit)
+    lines = [(result.move, result.score, result.depth, result.pv) for result in results]
+    return lines, _searcher.nodes, time.perf_counter() - start
+
+
+class AIService:
+    """Runs engine work in a process pool, sharing it fairly between games.
+
+    Each game has its own queue of jobs and the games take turns: once a
+    game's job is handed to the pool it goes to the back of the line, so a
+    game that asks for a lot of work can't starve the others. At most one
+    job per worker is in the pool at any time, everything else waits here.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        max_time: float = 5.0,
+        book_path: Optional[str] = None,
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_time = max_time
+        self.book_path = book_path
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.queues: (
+            "OrderedDict[Any, Deque[Tuple[Callable, tuple, asyncio.Future, float]]]"
+        ) = OrderedDict()
+        self.busy = 0
+        self.completed = 0
+        self.failed = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+        self.nodes = 0
+        self.search_seconds = 0.0
+
+    def start(self):
+        self.executor = ProcessPoolExecutor(
+            self.workers, initializer=_init_worker, initargs=(self.book_path,)
+        )
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    async def run(self, key: Any, function: Callable, *args) -> Any:
+        """Runs function(*args) in the pool as one of key's jobs."""
+        if self.executor is None:
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        self.queues.setdefault(key, deque()).append(
+            (function, args, future, time.perf_counter())
+        )
+        self._dispatch()
+        return await future
+
+    async def choose_move(self, key: Any, board: Bitboard, time_limit: float) -> int:
+        time_limit = min(time_limit, self.max_time)
+        move, nodes, seconds = await self.run(
+            key, search_move, encode_binary(board), time_limit
+        )
+        self.record_search(nodes, seconds)
+        return move
+
+    def record_search(self, nodes: int, seconds: float):
+        self.nodes += nodes
+        self.search_seconds += seconds
+
+    def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while self.busy < self.workers and self.queues:
+            key, queue = next(iter(self.queues.items()))
+            function, args, future, queued_at = queue.popleft()
+            if queue:
+                self.queues.move_to_end(key)
+            else:
+                del self.queues[key]
+            if future.cancelled():
+                continue
+
+            started_at = time.perf_counter()
+            self.wait_seconds += started_at - queued_at
+            self.busy += 1
+            try:
+                job = loop.run_in_executor(self.executor, function, *args)
+            except BrokenProcessPool as error:
+                job = loop.create_future()
+                job.set_exception(error)
+            job.add_done_callback(
+                partial(
+                    self._finished,
+                    future=future,
+                    started_at=started_at,
+                    executor=self.executor,
+                )
+            )
+
+    def _finished(
+        self,
+        job: asyncio.Future,
+        future: asyncio.Future,
+        started_at: float,
+        executor: ProcessPoolExecutor,
+    ):
+        self.busy -= 1
+        self.run_seconds += time.perf_counter() - started_at
+        if job.cancelled():
+            future.cancel()
+        elif job.exception() is not None:
+            self.failed += 1
+            # A worker that died leaves the pool unusable, so start a new one
+            # for the jobs still to come
+            if (
+                isinstance(job.exception(), BrokenProcessPool)
+                and executor is self.executor
+            ):
+                self.shutdown()
+                self.start()
+            if not future.done():
+                future.set_exception(job.exception())
+        else:
+            self.completed += 1
+            if not future.done():
+                future.set_result(job.result())
+        self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        finished = self.completed + self.failed
+        return {
+            "workers": self.workers,
+            "busy": self.busy,
+            "queued": sum(len(queue) for queue in self.queues.values()),
+            "games_waiting": len(self.queues),
+            "completed": self.completed,
+            "failed": self.failed,
+            "mean_wait_seconds": self.wait_seconds / finished if finished else 0.0,
+            "mean_run_seconds": self.run_seconds / finished if finished else 0.0,
+            "nodes": self.nodes,
+            "nodes_per_second": (
+                self.nodes / self.search_seconds if self.search_seconds else 0.0
+            ),
+        }
@@ -0,0 +1,107 @@
+import asyncio
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+from onitama_engine.bitboard import Bitboard, decode_move, is_pass, square_coords
+from onitama_engine.card import CARD_NAMES
+from onitama_engine.encoding import encode_binary, encode_text
+from onitama_engine.state import GameState
+from onitama_engine.symmetry import canonical, transform_move
+
+from .ai import AIService, analyze_position
+
+# Analyses share one place in the AI pool's rotation, so a flood of them
+# can't hold up the games' own searches
+QUEUE_KEY = "analysis"
+
+# (move, score, depth, principal variation) for each root move, best first
+Lines = List[Tuple[int, int, int, List[int]]]
+
+
+def move_to_json(move: int) -> Dict[str, Any]:
+    card, sq, to_sq = decode_move(move)
+    if is_pass(move):
+        return {"card_name": CARD_NAMES[card], "pass": True}
+    x, y = square_coords(sq)
+    nx, ny = square_coords(to_sq)
+    return {"card_name": CARD_NAMES[card], "x": x, "y": y, "nx": nx, "ny": ny}
+
+
+class Analyzer:
+    """Analyses positions in the AI pool and keeps the latest results.
+
+    Results are kept in an LRU cache keyed by the hash of the position's
+    canonical form, so the same position reached by any game, sent in any
+    encoding or seen mirrored or from the other side is searched once. A
+    request for a position whose analysis is already running waits for that
+    one instead of starting another.
+    """
+
+    def __init__(self, service: AIService, time_limit: float = 1.0, size: int = 4096):
+        self.service = service
+        self.time_limit = time_limit
+        self.size = size
+        self.cache: "OrderedDict[int, Lines]" = OrderedDict()
+        self.in_flight: Dict[int, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.merged = 0
+
+    def key(self, state: GameState) -> int:
+        return state.hash
+
+    async def analyze(self, board: Bitboard) -> Dict[str, Any]:
+        state, transform = canonical(board)
+        key = self.key(state)
+        results = self.cache.get(key)
+        if results is not None:
+            self.cache.move_to_end(key)
+            self.hits += 1
+        else:
+            in_flight = self.in_flight.get(key)
+            if in_flight is not None:
+                self.merged += 1
+            else:
+                self.misses += 1
+                in_flight = asyncio.ensure_future(self._compute(key, state))
+                self.in_flight[key] = in_flight
+                in_flight.add_done_callback(lambda _: self.in_flight.pop(key, None))
+            # Shielded so one client giving up doesn't cancel the others
+            results = await asyncio.shield(in_flight)
+
+        # Scores are for the side to move, so only the moves need mapping
+        # back from the canonical position
+        return {
+            "position": encode_text(board),
+            "depth": max((depth for _, _, depth, _ in results), default=0),
+            "moves": [
+                {
+                    "move": move_to_json(transform_move(move, transform)),
+                    "score": score,
+                    "line": [
+                        move_to_json(transform_move(line_move, transform))
+                        for line_move in pv
+                    ],
+                }
+                for move, score, _, pv in results
+            ],
+        }
+
+    async def _compute(self, key: int, state: GameState) -> Lines:
+        results, nodes, seconds = await self.service.run(
+            QUEUE_KEY, analyze_position, encode_binary(state), self.time_limit
+        )
+        self.service.record_search(nodes, seconds)
+        self.cache[key] = results
+        if len(self.cache) > self.size:
+            self.cache.popitem(last=False)
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self.cache),
+            "in_flight": len(self.in_flight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "merged": self.merged,
+        }
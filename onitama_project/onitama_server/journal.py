@@ -0,0 +1,153 @@
+import asyncio
+import json
+import os
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Tuple
+
+
+class Journal:
+    """Append-only log of game records with group commit and snapshots.
+
+    append() queues a record and returns a future that completes once the
+    record is on disk. A single flusher task writes whatever accumulated
+    while the previous fsync was running, so one fsync covers the moves of
+    every game in the batch. Every snapshot_every records the flusher asks
+    for a snapshot of the whole state instead, writes it next to the log and
+    starts the log afresh, so recovery reads one snapshot and a short tail.
+    """
+
+    SNAPSHOT = "snapshot.json"
+    LOG = "journal.jsonl"
+
+    def __init__(self, directory: str, snapshot_every: int = 10_000):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.snapshot_path = self.directory / self.SNAPSHOT
+        self.log_path = self.directory / self.LOG
+        self.snapshot_every = snapshot_every
+        self.take_snapshot: Optional[Callable[[], dict]] = None
+
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._wakeup = asyncio.Event()
+        self._log = None
+        # Records are numbered so a log that outlived its snapshot (a crash
+        # between the two writes) is not applied twice
+        self.sequence = 0
+        self.since_snapshot = 0
+        self.records = 0
+        self.batches = 0
+        self.snapshots = 0
+
+    def load(self) -> Tuple[Optional[dict], Iterator[dict]]:
+        """Returns the last snapshot and the records logged after it."""
+        snapshot = None
+        if self.snapshot_path.exists():
+            snapshot = json.loads(self.snapshot_path.read_text())
+            self.sequence = snapshot["sequence"]
+        return snapshot, self._read_log()
+
+    def _read_log(self) -> Iterator[dict]:
+        if not self.log_path.exists():
+            return
+        complete = 0
+        with open(self.log_path, "rb") as log:
+            for line in log:
+                if not line.endswith(b"\n"):
+                    # A write cut short by a crash, never acknowledged
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                complete += len(line)
+                if record["seq"] <= self.sequence:
+                    continue
+                self.sequence = record["seq"]
+                self.since_snapshot += 1
+                yield record
+        # Drop the torn tail, or the next append would be written onto it
+        if self.log_path.stat().st_size > complete:
+            os.truncate(self.log_path, complete)
+
+    def append(self, record: dict) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.sequence += 1
+        record["seq"] = self.sequence
+        self._pending.append((json.dumps(record, separators=(",", ":")), future))
+        self.records += 1
+        self._wakeup.set()
+        return future
+
+    async def run(self):
+        self._log = open(self.log_path, "a")
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                await self.flush()
+        finally:
+            await self.flush()
+            self._log.close()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        self.since_snapshot += len(batch)
+
+        if (
+            self.take_snapshot is not None
+            and self.since_snapshot >= self.snapshot_every
+        ):
+            # The in-memory state already includes every record of the batch
+            state = {"sequence": self.sequence, **self.take_snapshot()}
+            await asyncio.to_thread(self._write_snapshot, state)
+            self.since_snapshot = 0
+            self.snapshots += 1
+        else:
+            lines = "".join(line + "\n" for line, _ in batch)
+            await asyncio.to_thread(self._write, lines)
+
+        self.batches += 1
+        for _, future in batch:
+            if not future.done():
+                future.set_result(None)
+
+    def _write(self, lines: str):
+        self._log.write(lines)
+        self._log.flush()
+        os.fsync(self._log.fileno())
+
+    def _write_snapshot(self, state: dict):
+        temporary = self.snapshot_path.with_suffix(".tmp")
+        with open(temporary, "w") as snapshot:
+            json.dump(state, snapshot, separators=(",", ":"))
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+        os.replace(temporary, self.snapshot_path)
+        _fsync_directory(self.directory)
+
+        # Everything logged so far is in the snapshot
+        self._log.close()
+        self._log = open(self.log_path, "w")
+        os.fsync(self._log.fileno())
+
+    def stats(self) -> dict:
+        return {
+            "records": self.records,
+            "batches": self.batches,
+            "snapshots": self.snapshots,
+            "pending": len(self._pending),
+            "records_since_snapshot": self.since_snapshot,
+        }
+
+
+def _fsync_directory(directory: Path):
+    if os.name != "posix":
+        return
+    descriptor = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
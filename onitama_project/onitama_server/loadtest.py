@@ -0,0 +1,297 @@
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+import websockets
+
+# Add the parent directory to the Python path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from onitama_engine.bitboard import decode_move, is_pass, square_coords
+from onitama_engine.card import CARD_NAMES
+from onitama_engine.encoding import decode_text
+
+
+def percentiles(samples: List[float]) -> dict:
+    ordered = sorted(samples)
+
+    def percentile(fraction: float) -> float:
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    return {
+        "count": len(ordered),
+        "mean": sum(ordered) / len(ordered) if ordered else 0.0,
+        "p50": percentile(0.5),
+        "p95": percentile(0.95),
+        "p99": percentile(0.99),
+        "max": ordered[-1] if ordered else 0.0,
+    }
+
+
+class LoadTest:
+    """Plays games between random bots through the server's public API.
+
+    Every game is created, joined and started over HTTP, then both players
+    and the spectators connect to its websocket. A move's round trip runs
+    from sending it to receiving the state update it caused.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        games: int,
+        concurrency: int,
+        spectators: int,
+        move_delay: float,
+        max_plies: int,
+        timeout: float,
+        seed: int,
+    ):
+        self.url = url.rstrip("/")
+        self.ws_url = "ws" + self.url[len("http") :]
+        self.games = games
+        self.concurrency = concurrency
+        self.spectators = spectators
+        self.move_delay = move_delay
+        self.max_plies = max_plies
+        self.timeout = timeout
+        self.seed = seed
+
+        self.move_latency: List[float] = []
+        self.setup_latency: List[float] = []
+        self.errors: Counter = Counter()
+        self.results: Counter = Counter()
+        self.moves = 0
+        self.spectator_messages = 0
+
+    async def run(self) -> dict:
+        limits = httpx.Limits(max_connections=self.concurrency)
+        start = time.perf_counter()
+        async with httpx.AsyncClient(
+            base_url=self.url, limits=limits, timeout=self.timeout
+        ) as client:
+            numbers = iter(range(self.games))
+            await asyncio.gather(
+                *(self._worker(client, numbers) for _ in range(self.concurrency))
+            )
+        elapsed = time.perf_counter() - start
+
+        return {
+            "games": self.games,
+            "concurrency": self.concurrency,
+            "spectators_per_game": self.spectators,
+            "move_delay": self.move_delay,
+            "elapsed_seconds": elapsed,
+            "results": dict(self.results),
+            "moves": self.moves,
+            "moves_per_second": self.moves / elapsed if elapsed else 0.0,
+            "games_per_second": self.results["finished"] / elapsed if elapsed else 0.0,
+            "spectator_messages": self.spectator_messages,
+            "move_round_trip_seconds": percentiles(self.move_latency),
+            "setup_seconds": percentiles(self.setup_latency),
+            "errors": dict(self.errors),
+        }
+
+    async def _worker(self, client: httpx.AsyncClient, numbers):
+        for number in numbers:
+            try:
+                result = await self.play(client, random.Random(self.seed + number))
+            except httpx.HTTPError as error:
+                self.errors[f"http:{type(error).__name__}"] += 1
+                result = "failed"
+            except (OSError, websockets.exceptions.WebSocketException) as error:
+                self.errors[f"websocket:{type(error).__name__}"] += 1
+                result = "failed"
+            except asyncio.TimeoutError:
+                self.errors["timeout"] += 1
+                result = "failed"
+            self.results[result] += 1
+
+    async def play(self, client: httpx.AsyncClient, rng: random.Random) -> str:
+        start = time.perf_counter()
+        created = await self._post(client, "/create_game")
+        game_id = created["game_id"]
+        joined = await self._post(client, f"/join_game/{game_id}")
+        players = [created["player"], joined["player"]]
+
+        sockets = []
+        try:
+            for _ in range(len(players) + self.spectators):
+                sockets.append(
+                    await websockets.connect(
+                        f"{self.ws_url}/ws/{game_id}", open_timeout=self.timeout
+                    )
+                )
+            inboxes: List[asyncio.Queue] = [asyncio.Queue() for _ in players]
+            readers = [
+                asyncio.create_task(self._read(socket, inbox))
+                for socket, inbox in zip(sockets, inboxes)
+            ]
+            readers += [
+                asyncio.create_task(self._spectate(socket))
+                for socket in sockets[len(players) :]
+            ]
+
+            await self._post(
+                client,
+                f"/start_game/{game_id}",
+                params={"player_id": players[0]["id"]},
+            )
+            state = await self._get(client, f"/game_state/{game_id}")
+            self.setup_latency.append(time.perf_counter() - start)
+
+            try:
+                return await self._play_moves(state, players, sockets, inboxes, rng)
+            finally:
+                for reader in readers:
+                    reader.cancel()
+                await asyncio.gather(*readers, return_exceptions=True)
+        finally:
+            await asyncio.gather(
+                *(socket.close() for socket in sockets), return_exceptions=True
+            )
+
+    async def _play_moves(
+        self,
+        state: dict,
+        players: List[dict],
+        sockets: list,
+        inboxes: List[asyncio.Queue],
+        rng: random.Random,
+    ) -> str:
+        for _ in range(self.max_plies):
+            mover = next(
+                index
+                for index, player in enumerate(players)
+                if player["color"] == state["current_player"]
+            )
+            move_input = self._choose(state, rng)
+            if move_input is None:
+                # Only passes are left, which the websocket API can't send
+                return "stuck"
+            if self.move_delay:
+                await asyncio.sleep(self.move_delay)
+
+            inbox = inboxes[mover]
+            sent_at = time.perf_counter()
+            await sockets[mover].send(
+                json.dumps(
+                    {"player_id": players[mover]["id"], "move_input": move_input}
+                )
+            )
+            while True:
+                message = await asyncio.wait_for(inbox.get(), self.timeout)
+                if message is None:
+                    self.errors["websocket:closed_early"] += 1
+                    return "failed"
+                if message["type"] == "error":
+                    self.errors[f"rejected:{message['message']}"] += 1
+                    return "failed"
+                # The update for the opponent's last move may arrive after
+                # this one was sent
+                if message["type"] == "game_state_updated" and (
+                    message["current_player"] != players[mover]["color"]
+                    or message["winner"] is not None
+                ):
+                    break
+            self.move_latency.append(time.perf_counter() - sent_at)
+            self.moves += 1
+
+            state = message
+            if message["winner"] is not None:
+                return "finished"
+        return "unfinished"
+
+    def _choose(self, state: dict, rng: random.Random) -> Optional[Dict[str, object]]:
+        board = decode_text(state["position"])
+        moves = [move for move in board.legal_moves() if not is_pass(move)]
+        if not moves:
+            return None
+        card, sq, to_sq = decode_move(rng.choice(moves))
+        x, y = square_coords(sq)
+        nx, ny = square_coords(to_sq)
+        return {"card_name": CARD_NAMES[card], "x": x, "y": y, "nx": nx, "ny": ny}
+
+    async def _read(self, socket, inbox: asyncio.Queue):
+        try:
+            async for raw in socket:
+                inbox.put_nowait(json.loads(raw))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        inbox.put_nowait(None)
+
+    async def _spectate(self, socket):
+        try:
+            async for _ in socket:
+                self.spectator_messages += 1
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def _post(self, client: httpx.AsyncClient, path: str, **kwargs) -> dict:
+        response = await client.post(path, **kwargs)
+        if response.is_error:
+            self.errors[f"http:{response.status_code}"] += 1
+        response.raise_for_status()
+        return response.json()
+
+    async def _get(self, client: httpx.AsyncClient, path: str) -> dict:
+        response = await client.get(path)
+        if response.is_error:
+            self.errors[f"http:{response.status_code}"] += 1
+        response.raise_for_status()
+        return response.json()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python loadtest.py")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument(
+        "--concurrency", type=int, default=100, help="games played at once"
+    )
+    parser.add_argument("--spectators", type=int, default=0, help="per game")
+    parser.add_argument(
+        "--move-delay", type=float, default=0.0, help="seconds a bot waits per move"
+    )
+    parser.add_argument("--max-plies", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument(
+        "--seed", type=int, default=0, help="game i picks moves with seed + i"
+    )
+    parser.add_argument(
+        "--output", default="-", help="JSON file for the summary, - for stdout"
+    )
+    args = parser.parse_args(argv)
+
+    load_test = LoadTest(
+        args.url,
+        args.games,
+        args.concurrency,
+        args.spectators,
+        args.move_delay,
+        args.max_plies,
+        args.timeout,
+        args.seed,
+    )
+    summary = asyncio.run(load_test.run())
+
+    if args.output == "-":
+        json.dump(summary, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        with open(args.output, "w") as output:
+            json.dump(summary, output, indent=2)
+    return 0 if not summary["errors"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,255 @@
+import argparse
+import asyncio
+import itertools
+import os
+import re
+import signal
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+
+# Requests whose path names a game go to the worker that owns it
+GAME_PATH = re.compile(
+    rb"^/(?:join_game|game_state|start_game|ws)/([0-9a-fA-F-]{32,36})(?:[/?]|$)"
+)
+MAX_HEAD_SIZE = 64 * 1024
+SCRAPE_TIMEOUT = 5.0
+METRICS_PATH = re.compile(rb"^/metrics(?:\?|$)")
+METRICS_CONTENT_TYPE = b"text/plain; version=0.0.4; charset=utf-8"
+
+
+def shard_of(game_id: UUID, workers: int) -> int:
+    # uuid4 ids are random, so their integer value spreads games evenly
+    return game_id.int % workers
+
+
+class Router:
+    """Forwards each connection to the worker that owns its game.
+
+    Only the request head is parsed. Plain HTTP requests are forced to
+    Connection: close, so a client can't send its next request, which may be
+    for another game, down the same worker connection. WebSocket upgrades are
+    piped through untouched for as long as they stay open. Requests that
+    name no game go to the workers in turn, except /metrics, which the router
+    answers itself with every worker's metrics labelled by worker.
+    """
+
+    def __init__(self, worker_ports: List[int], worker_host: str = "127.0.0.1"):
+        self.worker_ports = worker_ports
+        self.worker_host = worker_host
+        self._next_worker = itertools.cycle(range(len(worker_ports)))
+
+    def worker_for(self, path: bytes) -> int:
+        match = GAME_PATH.match(path)
+        if match:
+            try:
+                return shard_of(UUID(match.group(1).decode()), len(self.worker_ports))
+            except ValueError:
+                pass
+        return next(self._next_worker)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            writer.close()
+            return
+
+        request_line, *headers = head[:-4].split(b"\r\n")
+        parts = request_line.split(b" ")
+        if len(parts) != 3:
+            writer.close()
+            return
+        if parts[0] == b"GET" and METRICS_PATH.match(parts[1]):
+            body = await self.collect_metrics()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: "
+                + METRICS_CONTENT_TYPE
+                + b"\r\nContent-Length: "
+                + str(len(body)).encode()
+                + b"\r\nConnection: close\r\n\r\n"
+                + body
+            )
+            await writer.drain()
+            writer.close()
+            return
+        upgrade = any(header.lower().startswith(b"upgrade:") for header in headers)
+        if not upgrade:
+            headers = [
+                header
+                for header in headers
+                if not header.lower().startswith(b"connection:")
+            ]
+            headers.append(b"Connection: close")
+        head = b"\r\n".join([request_line, *headers]) + b"\r\n\r\n"
+
+        port = self.worker_ports[self.worker_for(parts[1])]
+        try:
+            worker_reader, worker_writer = await asyncio.open_connection(
+                self.worker_host, port
+            )
+        except OSError:
+            writer.write(b"HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\n\r\n")
+            writer.close()
+            return
+
+        worker_writer.write(head)
+        await asyncio.gather(_pipe(reader, worker_writer), _pipe(worker_reader, writer))
+        worker_writer.close()
+        writer.close()
+
+    async def collect_metrics(self) -> bytes:
+        """Scrapes every worker and merges the results, adding a worker label
+        to each sample. A worker that doesn't answer is reported by
+        onitama_worker_up."""
+        scrapes = await asyncio.gather(
+            *(self._scrape(port) for port in self.worker_ports)
+        )
+        # Family name to its HELP and TYPE lines and every worker's samples
+        families: Dict[str, Tuple[Dict[str, str], List[str]]] = {}
+        up = []
+        for worker, text in enumerate(scrapes):
+            up.append(f'onitama_worker_up{{worker="{worker}"}} {int(text is not None)}')
+            for line in (text or "").splitlines():
+                if line.startswith("# "):
+                    _, kind, name, *_ = line.split(" ", 3)
+                    family = families.setdefault(name, ({}, []))
+                    family[0].setdefault(kind, line)
+                elif line:
+                    family[1].append(_label_sample(line, worker))
+        lines = [
+            "# HELP onitama_worker_up Whether the worker answered the scrape",
+            "# TYPE onitama_worker_up gauge",
+            *up,
+        ]
+        for comments, samples in families.values():
+            lines.extend(comments.values())
+            lines.extend(samples)
+        return ("\n".join(lines) + "\n").encode()
+
+    async def _scrape(self, port: int) -> Optional[str]:
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.worker_host, port), SCRAPE_TIMEOUT
+            )
+        except (OSError, asyncio.TimeoutError):
+            return None
+        try:
+            writer.write(
+                b"GET /metrics HTTP/1.1\r\nHost: "
+                + self.worker_host.encode()
+                + b"\r\nConnection: close\r\n\r\n"
+            )
+            response = await asyncio.wait_for(reader.read(), SCRAPE_TIMEOUT)
+        except (OSError, asyncio.TimeoutError):
+            return None
+        finally:
+            writer.close()
+        head, _, body = response.partition(b"\r\n\r\n")
+        if not head.startswith(b"HTTP/1.1 200"):
+            return None
+        return body.decode()
+
+
+def _label_sample(line: str, worker: int) -> str:
+    name, _, value = line.rpartition(" ")
+    metric, brace, labels = name.partition("{")
+    worker_label = f'worker="{worker}"'
+    if brace and labels != "}":
+        return f"{metric}{{{worker_label},{labels} {value}"
+    return f"{metric}{{{worker_label}}} {value}"
+
+
+async def _pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+        # Pass the half close on, the other direction may still be busy
+        if writer.can_write_eof():
+            writer.write_eof()
+    except (ConnectionError, OSError):
+        writer.close()
+
+
+def start_workers(
+    workers: int, worker_port: int, journal_directory: Optional[str]
+) -> List[subprocess.Popen]:
+    server = Path(__file__).resolve().with_name("server.py")
+    # Each worker runs its own AI pool, so the cores are shared out between them
+    ai_workers = os.environ.get(
+        "ONITAMA_AI_WORKERS", str(max(1, (os.cpu_count() or 1) // workers))
+    )
+    processes = []
+    for worker in range(workers):
+        env = dict(
+            os.environ,
+            ONITAMA_WORKER=str(worker),
+            ONITAMA_WORKERS=str(workers),
+            ONITAMA_AI_WORKERS=ai_workers,
+        )
+        if journal_directory:
+            env["ONITAMA_JOURNAL_DIR"] = str(
+                Path(journal_directory) / f"worker-{worker}"
+            )
+        processes.append(
+            subprocess.Popen(
+                [
+                    sys.executable,
+                    str(server),
+                    "--host",
+                    "127.0.0.1",
+                    "--port",
+                    str(worker_port + worker),
+                ],
+                env=env,
+            )
+        )
+    return processes
+
+
+async def serve(host: str, port: int, router: Router):
+    server = await asyncio.start_server(router.handle, host, port, limit=MAX_HEAD_SIZE)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python router.py")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument(
+        "--worker-port",
+        type=int,
+        default=8100,
+        help="worker i listens on this port + i",
+    )
+    parser.add_argument(
+        "--journal-dir",
+        default=os.environ.get("ONITAMA_JOURNAL_DIR"),
+        help="journal each worker's games to a subdirectory of this one",
+    )
+    args = parser.parse_args(argv)
+
+    processes = start_workers(args.workers, args.worker_port, args.journal_dir)
+    router = Router([args.worker_port + worker for worker in range(args.workers)])
+    try:
+        asyncio.run(serve(args.host, args.port, router))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.send_signal(signal.SIGINT)
+        for process in processes:
+            process.wait()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,92 @@
+import argparse
+import asyncio
+import json
+import os
 import random
 import sys
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
 from uuid import UUID, uuid4
 
 import uvicorn
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
 from pydantic import BaseModel
 
 # Add the parent directory to the Python path
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 
-from onitama_engine import Color, Onitama
-
-app = FastAPI()
+from onitama_engine import Color, Onitama, profiling
+from onitama_engine.bitboard import (
+    CARD_IDS,
+    MOVE_MASK,
+    Bitboard,
+    encode_move,
+    square,
+)
+from onitama_engine.encoding import decode_binary, decode_text, encode_text
+from onitama_engine.records import GameRecord, GameStore
+
+from onitama_server.ai import AIService
+from onitama_server.analysis import Analyzer, move_to_json
+from onitama_server.journal import Journal
+from onitama_server.metrics import CONTENT_TYPE, Registry
+from onitama_server.router import shard_of
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tasks = [asyncio.create_task(game_manager.sweep_forever())]
+    ai_service.start()
+    journal_directory = os.environ.get("ONITAMA_JOURNAL_DIR")
+    if journal_directory:
+        journal = Journal(
+            journal_directory, int(os.environ.get("ONITAMA_SNAPSHOT_EVERY", 10_000))
+        )
+        game_manager.restore(journal)
+        tasks.append(asyncio.create_task(journal.run()))
+        for game_id in list(game_manager.games):
+            schedule_ai_move(game_id)
+    store_path = os.environ.get("ONITAMA_GAME_STORE")
+    if store_path:
+        game_manager.store = GameStore(store_path)
+        tasks.append(asyncio.create_task(game_manager.store_forever()))
+    yield
+    for task in [*tasks, *ai_tasks]:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    if game_manager.store is not None:
+        await game_manager.flush_store()
+        game_manager.store.close()
+    ai_service.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
+
+registry = Registry()
+request_seconds = registry.histogram(
+    "onitama_http_request_duration_seconds", "Time to answer an HTTP request"
+)
+message_seconds = registry.histogram(
+    "onitama_websocket_message_duration_seconds",
+    "Time to handle a websocket message, by outcome",
+)
+broadcast_seconds = registry.histogram(
+    "onitama_broadcast_duration_seconds",
+    "Time to encode a game update and queue it for every socket of the game",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1),
+)
+delivery_seconds = registry.histogram(
+    "onitama_broadcast_delivery_seconds",
+    "Time from queueing a message to sending it on one socket",
+)
+
+if os.environ.get("ONITAMA_PROFILE"):
+    profiling.enable()
 
 
 GameID = UUID
@@ -27,13 +100,29 @@ class Player(BaseModel):
 
 
 class GameWrapper:
-    def __init__(self, onitama_game: Onitama):
+    def __init__(
+        self,
+        onitama_game: Onitama,
+        ai_color: Optional[Color] = None,
+        ai_time_limit: float = 1.0,
+    ):
         self.game: Onitama = onitama_game
+        # The colour the engine plays in a game against the AI
+        self.ai_color = ai_color
+        self.ai_time_limit = ai_time_limit
         self.players: Dict[PlayerID, Player] = {}
         self.host: Optional[PlayerID] = None
         self.available_colors: List[Color] = list(Color)
         self.current_player: Optional[PlayerID] = None
         self.started: bool = False
+        self.finished: bool = False
+        self.last_activity = time.monotonic()
+
+    @property
+    def status(self) -> str:
+        if self.finished:
+            return "finished"
+        return "active" if self.started else "lobby"
 
     def add_player(self, player: Player):
         self.players[player.id] = player
@@ -46,8 +135,23 @@ class GameWrapper:
         return random.choice(self.available_colors)
 
     def start(self):
-        self.current_player = random.choice(list(self.players.keys()))
         self.started = True
+        self.update_current_player()
+
+    @property
+    def ai_to_move(self) -> bool:
+        return (
+            self.started
+            and not self.finished
+            and self.ai_color == self.game.current_player.color
+        )
+
+    def update_current_player(self):
+        # The engine decides who moves first, so follow its turn
+        color = self.game.current_player.color
+        self.current_player = next(
+            player.id for player in self.players.values() if player.color == color
+        )
 
     @property
     def is_full(self):
@@ -59,83 +163,773 @@ class GameWrapper:
 
 
 class GameManager:
-    def __init__(self):
-        self.games: Dict[GameID, GameWrapper] = {}
+    """Live games in least recently used order.
+
+    A background sweeper drops games that have been idle for longer than the
+    time to live of their status, and creating a game beyond max_games
+    evicts the least recently used one. on_remove is called with the id of
+    every game that goes.
+    """
+
+    def __init__(
+        self,
+        max_games: int = 10_000,
+        lobby_ttl: float = 600.0,
+        active_ttl: float = 1800.0,
+        finished_ttl: float = 60.0,
+        sweep_interval: float = 10.0,
+        on_remove: Optional[Callable[[GameID], None]] = None,
+        shard: int = 0,
+        shards: int = 1,
+    ):
+        self.games: "OrderedDict[GameID, GameWrapper]" = OrderedDict()
+        self.max_games = max_games
+        self.ttls = {"lobby": lobby_ttl, "active": active_ttl, "finished": finished_ttl}
+        self.sweep_interval = sweep_interval
+        self.on_remove = on_remove
+        # Behind the router, a worker only creates games that hash to it
+        self.shard = shard
+        self.shards = shards
+        self.journal: Optional[Journal] = None
+        # Finished games are queued and added to the store in batches
+        self.store: Optional[GameStore] = None
+        self.unstored: List[GameRecord] = []
+        self.stored = 0
+        self.created = 0
+        self.moves = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def _record(self, record: dict) -> Optional[asyncio.Future]:
+        if self.journal is None:
+            return None
+        return self.journal.append(record)
+
+    def create_game(
+        self, ai_color: Optional[Color] = None, ai_time_limit: float = 1.0
+    ) -> GameID:
+        while len(self.games) >= self.max_games:
+            game_id, _ = self.games.popitem(last=False)
+            self.evicted += 1
+            self._removed(game_id)
 
-    def create_game(self) -> GameID:
         game_id = uuid4()
+        while shard_of(game_id, self.shards) != self.shard:
+            game_id = uuid4()
         game = Onitama()
-        game_wrapper = GameWrapper(game)
+        game_wrapper = GameWrapper(game, ai_color, ai_time_limit)
         self.games[game_id] = game_wrapper
+        self.created += 1
+        self._record(
+            {
+                "type": "create",
+                "game": str(game_id),
+                "seed": game.seed,
+                "deal": encode_text(game.engine),
+                "ai_color": ai_color.value if ai_color else None,
+                "ai_time_limit": ai_time_limit,
+            }
+        )
         return game_id
 
+    def create_ai_game(
+        self, ai_color: Color, ai_time_limit: float
+    ) -> Tuple[GameID, Player]:
+        """Creates and starts a game between the engine and the returned
+        player."""
+        game_id = self.create_game(ai_color, ai_time_limit)
+        self._add_player(game_id, Player(id=uuid4(), color=ai_color))
+        human_color = Color.RED if ai_color == Color.BLUE else Color.BLUE
+        player = self._add_player(game_id, Player(id=uuid4(), color=human_color))
+        self.start_game(game_id)
+        return game_id, player
+
     def join_game(self, game_id: GameID) -> Player:
-        game_wrapper = self.games.get(game_id)
-        if not game_wrapper:
-            raise HTTPException(status_code=404, detail="Game not found")
+        game_wrapper = self.get_game_wrapper(game_id)
 
         if game_wrapper.is_full:
             raise HTTPException(status_code=400, detail="Game is already full")
 
         player = Player(id=uuid4(), color=game_wrapper.assign_random_color())
-        game_wrapper.add_player(player)
+        return self._add_player(game_id, player)
+
+    def _add_player(self, game_id: GameID, player: Player) -> Player:
+        self.games[game_id].add_player(player)
+        self._record(
+            {
+                "type": "join",
+                "game": str(game_id),
+                "player": str(player.id),
+                "color": player.color.value,
+            }
+        )
 
         return player
 
-    def get_game(self, game_id: GameID) -> Onitama:
+    def start_game(self, game_id: GameID):
+        self.get_game_wrapper(game_id).start()
+        self._record({"type": "start", "game": str(game_id)})
+
+    async def play_move(self, game_id: GameID, move: int):
+        """Plays a legal engine move and returns the winning Player, if any,
+        once the move is in the journal."""
+        game_wrapper = self.get_game_wrapper(game_id)
+        game = game_wrapper.game
+        game.push(move)
+        self.moves += 1
+        winner = game.check_victory()
+        game_wrapper.update_current_player()
+        if winner is not None:
+            game_wrapper.finished = True
+            if self.store is not None:
+                self.unstored.append(GameRecord.from_game(game))
+
+        written = self._record({"type": "move", "game": str(game_id), "move": move})
+        if written is not None:
+            await written
+        return winner
+
+    def get_game_wrapper(self, game_id: GameID) -> GameWrapper:
         game_wrapper = self.games.get(game_id)
         if not game_wrapper:
             raise HTTPException(status_code=404, detail="Game not found")
 
-        return game_wrapper.game
+        self.touch(game_id)
+        return game_wrapper
+
+    def get_game(self, game_id: GameID) -> Onitama:
+        return self.get_game_wrapper(game_id).game
+
+    def touch(self, game_id: GameID):
+        game_wrapper = self.games.get(game_id)
+        if game_wrapper:
+            game_wrapper.last_activity = time.monotonic()
+            self.games.move_to_end(game_id)
 
     def remove_game(self, game_id: GameID):
         if game_id in self.games:
             del self.games[game_id]
+            self._removed(game_id)
+
+    def _removed(self, game_id: GameID):
+        self._record({"type": "remove", "game": str(game_id)})
+        if self.on_remove is not None:
+            self.on_remove(game_id)
+
+    def snapshot(self) -> dict:
+        return {
+            "games": [
+                {
+                    "game": str(game_id),
+                    "seed": game_wrapper.game.seed,
+                    "players": [
+                        [str(player.id), player.color.value]
+                        for player in game_wrapper.players.values()
+                    ],
+                    "started": game_wrapper.started,
+                    "ai_color": (
+                        game_wrapper.ai_color.value if game_wrapper.ai_color else None
+                    ),
+                    "ai_time_limit": game_wrapper.ai_time_limit,
+                    "moves": [
+                        entry & MOVE_MASK for entry in game_wrapper.game.engine.history
+                    ],
+                }
+                for game_id, game_wrapper in self.games.items()
+            ]
+        }
+
+    def restore(self, journal: Journal):
+        """Rebuilds the games of the last snapshot and replays the journal
+        written after it, then starts journaling through it."""
+        snapshot, records = journal.load()
+        for game in snapshot["games"] if snapshot else []:
+            game_id = UUID(game["game"])
+            self._apply(
+                {
+                    "type": "create",
+                    "game": game_id,
+                    "seed": game["seed"],
+                    "ai_color": game.get("ai_color"),
+                    "ai_time_limit": game.get("ai_time_limit", 1.0),
+                }
+            )
+            for player, color in game["players"]:
+                self._apply(
+                    {"type": "join", "game": game_id, "player": player, "color": color}
+                )
+            if game["started"]:
+                self._apply({"type": "start", "game": game_id})
+            for move in game["moves"]:
+                self._apply({"type": "move", "game": game_id, "move": move})
+        for record in records:
+            self._apply(record)
+
+        journal.take_snapshot = self.snapshot
+        self.journal = journal
+
+    def _apply(self, record: dict):
+        game_id = UUID(str(record["game"]))
+        kind = record["type"]
+        if kind == "create":
+            game = Onitama(seed=record["seed"])
+            if "deal" in record and encode_text(game.engine) != record["deal"]:
+                raise ValueError(f"Game {game_id} no longer deals {record['deal']}")
+            ai_color = record.get("ai_color")
+            self.games[game_id] = GameWrapper(
+                game,
+                Color(ai_color) if ai_color else None,
+                record.get("ai_time_limit", 1.0),
+            )
+            return
 
+        game_wrapper = self.games.get(game_id)
+        if game_wrapper is None:
+            return
+        if kind == "join":
+            game_wrapper.add_player(
+                Player(id=UUID(record["player"]), color=Color(record["color"]))
+            )
+        elif kind == "start":
+            game_wrapper.start()
+        elif kind == "move":
+            game_wrapper.game.push(record["move"])
+            game_wrapper.update_current_player()
+            game_wrapper.finished = game_wrapper.game.check_victory() is not None
+        elif kind == "remove":
+            del self.games[game_id]
 
-game_manager = GameManager()
+    def sweep(self, now: Optional[float] = None) -> List[GameID]:
+        now = time.monotonic() if now is None else now
+        expired = [
+            game_id
+            for game_id, game_wrapper in self.games.items()
+            if now - game_wrapper.last_activity > self.ttls[game_wrapper.status]
+        ]
+        for game_id in expired:
+            self.remove_game(game_id)
+        self.expired += len(expired)
+        return expired
+
+    async def sweep_forever(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self.sweep()
 
+    async def flush_store(self):
+        if not self.unstored:
+            return
+        records, self.unstored = self.unstored, []
+        await asyncio.to_thread(self.store.add, records)
+        self.stored += len(records)
 
-class WebSocketManager:
-    def __init__(self):
-        self.active_connections: Dict[WebSocketID, List[WebSocket]] = {}
+    async def store_forever(self, interval: float = 5.0):
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush_store()
+
+    def stats(self) -> dict:
+        statuses = {"lobby": 0, "active": 0, "finished": 0}
+        approximate_bytes = 0
+        for game_wrapper in self.games.values():
+            statuses[game_wrapper.status] += 1
+            approximate_bytes += _approximate_size(game_wrapper)
+        return {
+            "games": len(self.games),
+            "max_games": self.max_games,
+            **statuses,
+            "journal": self.journal.stats() if self.journal else None,
+            "stored": self.stored,
+            "awaiting_store": len(self.unstored),
+            "created": self.created,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "approximate_bytes": approximate_bytes,
+            "max_rss_bytes": _max_rss_bytes(),
+        }
+
+
+def _approximate_size(game_wrapper: GameWrapper) -> int:
+    # The objects a game owns that grow or dominate, not an exact deep size
+    engine = game_wrapper.game.engine
+    parts = [
+        game_wrapper,
+        game_wrapper.__dict__,
+        game_wrapper.players,
+        game_wrapper.game,
+        game_wrapper.game.__dict__,
+        game_wrapper.game.rng,
+        engine,
+        engine.__dict__,
+        engine.history,
+        engine.hash_history,
+    ]
+    return sum(sys.getsizeof(part) for part in parts) + sum(
+        sys.getsizeof(key) for key in engine.hash_history
+    )
+
+
+def _max_rss_bytes() -> Optional[int]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Linux reports kilobytes, macOS bytes
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+game_manager = GameManager(
+    shard=int(os.environ.get("ONITAMA_WORKER", 0)),
+    shards=int(os.environ.get("ONITAMA_WORKERS", 1)),
+)
+
+
+class LatencyStats:
+    """Count, mean and percentiles over the most recent samples."""
+
+    def __init__(self, window: int = 1024):
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def summary(self) -> dict:
+        ordered = sorted(self.samples)
+
+        def percentile(fraction: float) -> float:
+            if not ordered:
+                return 0.0
+            return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": percentile(0.5),
+            "p95": percentile(0.95),
+            "p99": percentile(0.99),
+            "max": ordered[-1] if ordered else 0.0,
+        }
+
+
+class Connection:
+    """One socket with its own outgoing queue and sender task.
+
+    A game state update replaces an update that is still waiting in the
+    queue, since the newer state makes the older one obsolete. Other
+    messages are queued, and a client whose queue is full is dropped.
+    """
+
+    def __init__(self, websocket: WebSocket, max_queue: int):
+        self.websocket = websocket
+        self.max_queue = max_queue
+        self.queue: Deque[Tuple[str, bool, float]] = deque()
+        self.ready = asyncio.Event()
+        self.closed = False
+        # Set when the game is over: queued messages go out, then the socket
+        # is closed
+        self.closing = False
+        # Set when the client was dropped, for the sender to close the socket
+        self.dropped = False
+        self.task: Optional[asyncio.Task] = None
+
+    def offer(self, message: str, mergeable: bool, queued_at: float) -> Optional[str]:
+        """Queues a message and returns "merged", "queued" or None when the
+        queue is full."""
+        if self.closed or self.closing:
+            return None
+        if mergeable and self.queue and self.queue[-1][1]:
+            self.queue[-1] = (message, True, self.queue[-1][2])
+            return "merged"
+        if len(self.queue) >= self.max_queue:
+            return None
+        self.queue.append((message, mergeable, queued_at))
+        self.ready.set()
+        return "queued"
 
-    async def connect(self, websocket: WebSocket, game_id: WebSocketID):
-        await websocket.accept()
-        if game_id not in self.active_connections:
-            self.active_connections[game_id] = []
-        self.active_connections[game_id].append(websocket)
 
-    async def disconnect(self, websocket: WebSocket, game_id: WebSocketID):
-        self.active_connections[game_id].remove(websocket)
+class WebSocketManager:
+    def __init__(
+        self, max_queue: int = 32, send_timeout: float = 5.0, stats_window: int = 1024
+    ):
+        self.active_connections: Dict[GameID, List[Connection]] = {}
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.broadcasts = 0
+        self.merged = 0
+        self.dropped = 0
+        # Time to encode and queue one broadcast, and from queueing a message
+        # to handing it to the socket
+        self.broadcast_latency = LatencyStats(stats_window)
+        self.delivery_latency = LatencyStats(stats_window)
+
+    async def connect(self, websocket: WebSocket, game_id: GameID):
+        await websocket.accept()
+        connection = Connection(websocket, self.max_queue)
+        connection.task = asyncio.create_task(self._send_loop(connection, game_id))
+        self.active_connections.setdefault(game_id, []).append(connection)
+
+    async def disconnect(self, websocket: WebSocket, game_id: GameID):
+        for connection in self.active_connections.get(game_id, []):
+            if connection.websocket is websocket:
+                self._remove(connection, game_id)
+                break
+
+    def _remove(self, connection: Connection, game_id: GameID):
+        connection.closed = True
+        connection.ready.set()
+        connections = self.active_connections.get(game_id)
+        if connections and connection in connections:
+            connections.remove(connection)
+            if not connections:
+                del self.active_connections[game_id]
+
+    def _drop(self, connection: Connection, game_id: GameID):
+        # The connection's own sender closes the socket, so a client that
+        # stopped reading can't hold up whoever dropped it
+        if connection.dropped:
+            return
+        self.dropped += 1
+        connection.dropped = True
+        self._remove(connection, game_id)
+
+    async def _send_loop(self, connection: Connection, game_id: GameID):
+        queue = connection.queue
+        while True:
+            await connection.ready.wait()
+            connection.ready.clear()
+            while queue and not connection.closed:
+                message, _, queued_at = queue.popleft()
+                try:
+                    await asyncio.wait_for(
+                        connection.websocket.send_text(message), self.send_timeout
+                    )
+                except asyncio.TimeoutError:
+                    self._drop(connection, game_id)
+                    break
+                except Exception:
+                    self._remove(connection, game_id)
+                    return
+                delivered = time.perf_counter() - queued_at
+                self.delivery_latency.add(delivered)
+                delivery_seconds.observe(delivered)
+            if connection.dropped:
+                try:
+                    await asyncio.wait_for(
+                        connection.websocket.close(code=1013), self.send_timeout
+                    )
+                except Exception:
+                    pass
+                return
+            if connection.closed:
+                return
+            if connection.closing:
+                connection.closed = True
+                try:
+                    await connection.websocket.close()
+                except Exception:
+                    pass
+                return
+
+    async def close_game(self, game_id: GameID):
+        """Closes every socket of the game once its queued messages are out."""
+        connections = self.active_connections.pop(game_id, [])
+        for connection in connections:
+            connection.closing = True
+            connection.ready.set()
+        await asyncio.gather(
+            *(connection.task for connection in connections), return_exceptions=True
+        )
 
-    async def broadcast_game_state(self, game_id: WebSocketID, game_state: dict):
-        if game_id in self.active_connections:
-            for websocket in self.active_connections[game_id]:
-                await websocket.send_json(game_state)
+    async def broadcast_game_state(self, game_id: GameID, game_state: dict):
+        connections = self.active_connections.get(game_id)
+        if not connections:
+            return
+        start = time.perf_counter()
+        # Encoded once, whatever the number of watchers
+        message = json.dumps(jsonable_encoder(game_state))
+        mergeable = game_state.get("type") == "game_state_updated"
+
+        for connection in list(connections):
+            outcome = connection.offer(message, mergeable, start)
+            if outcome == "merged":
+                self.merged += 1
+            elif outcome is None:
+                self._drop(connection, game_id)
+        self.broadcasts += 1
+        elapsed = time.perf_counter() - start
+        self.broadcast_latency.add(elapsed)
+        broadcast_seconds.observe(elapsed)
+
+    def stats(self) -> dict:
+        depths = [
+            len(connection.queue)
+            for connections in self.active_connections.values()
+            for connection in connections
+        ]
+        return {
+            "games": len(self.active_connections),
+            "connections": len(depths),
+            "broadcasts": self.broadcasts,
+            "merged": self.merged,
+            "dropped": self.dropped,
+            "queued": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "broadcast_seconds": self.broadcast_latency.summary(),
+            "delivery_seconds": self.delivery_latency.summary(),
+        }
 
 
 websocket_manager = WebSocketManager()
 
 
+def close_game_connections(game_id: GameID):
+    # Games are removed from synchronous code, so closing runs as its own task
+    if game_id in websocket_manager.active_connections:
+        asyncio.get_running_loop().create_task(websocket_manager.close_game(game_id))
+
+
+game_manager.on_remove = close_game_connections
+
+ai_service = AIService(
+    workers=int(os.environ.get("ONITAMA_AI_WORKERS", 0)) or None,
+    max_time=float(os.environ.get("ONITAMA_AI_MAX_TIME", 5.0)),
+    book_path=os.environ.get("ONITAMA_BOOK"),
+)
+analyzer = Analyzer(
+    ai_service,
+    time_limit=float(os.environ.get("ONITAMA_ANALYSIS_TIME", 1.0)),
+    size=int(os.environ.get("ONITAMA_ANALYSIS_CACHE", 4096)),
+)
+
+
+def _games_by_status():
+    statuses = {"lobby": 0, "active": 0, "finished": 0}
+    for game_wrapper in game_manager.games.values():
+        statuses[game_wrapper.status] += 1
+    return [({"status": status}, count) for status, count in statuses.items()]
+
+
+def _websocket_queued():
+    return [
+        (
+            {},
+            sum(
+                len(connection.queue)
+                for connections in websocket_manager.active_connections.values()
+                for connection in connections
+            ),
+        )
+    ]
+
+
+def _engine_calls():
+    return [
+        ({"function": name}, function_stats.calls)
+        for name, function_stats in profiling.stats.items()
+    ]
+
+
+def _engine_seconds():
+    return [
+        ({"function": name}, function_stats.seconds)
+        for name, function_stats in profiling.stats.items()
+    ]
+
+
+registry.gauge("onitama_games", "Live games by status", _games_by_status)
+registry.counter(
+    "onitama_games_created_total", "Games created", lambda: [({}, game_manager.created)]
+)
+registry.counter(
+    "onitama_moves_total",
+    "Moves validated and played",
+    lambda: [({}, game_manager.moves)],
+)
+registry.gauge(
+    "onitama_websocket_connections",
+    "Open websocket connections",
+    lambda: [({}, sum(map(len, websocket_manager.active_connections.values())))],
+)
+registry.gauge(
+    "onitama_websocket_queued_messages",
+    "Messages waiting in the sockets' queues",
+    _websocket_queued,
+)
+registry.counter(
+    "onitama_broadcast_merged_total",
+    "Queued game updates replaced by a newer one",
+    lambda: [({}, websocket_manager.merged)],
+)
+registry.counter(
+    "onitama_websocket_dropped_total",
+    "Sockets dropped for falling behind",
+    lambda: [({}, websocket_manager.dropped)],
+)
+registry.gauge(
+    "onitama_ai_busy_workers", "AI workers searching", lambda: [({}, ai_service.busy)]
+)
+registry.gauge(
+    "onitama_ai_queued_searches",
+    "Searches waiting for an AI worker",
+    lambda: [({}, sum(map(len, ai_service.queues.values())))],
+)
+registry.counter(
+    "onitama_ai_nodes_total",
+    "Nodes searched by the AI",
+    lambda: [({}, ai_service.nodes)],
+)
+registry.counter(
+    "onitama_ai_search_seconds_total",
+    "Time the AI spent searching",
+    lambda: [({}, ai_service.search_seconds)],
+)
+registry.gauge(
+    "onitama_engine_profiling",
+    "Whether the engine's profiling hooks are on",
+    lambda: [({}, int(profiling.is_enabled()))],
+)
+registry.counter(
+    "onitama_engine_calls_total",
+    "Calls to profiled engine functions, counted while profiling is on",
+    _engine_calls,
+)
+registry.counter(
+    "onitama_engine_seconds_total",
+    "Time in profiled engine functions, counted while profiling is on",
+    _engine_seconds,
+)
+
+
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    request_seconds.observe(
+        time.perf_counter() - start,
+        method=request.method,
+        # The route's template rather than the path, which holds game ids
+        route=route.path if route is not None else "unmatched",
+        status=str(response.status_code),
+    )
+    return response
+
+
+# The engine's turns in progress, held so they can't be garbage collected
+# and are cancelled on shutdown
+ai_tasks: Set[asyncio.Task] = set()
+# Searches per engine turn before the game is given up
+AI_ATTEMPTS = 2
+
+
+async def announce_move(game_id: GameID, winner: Optional[Player]):
+    game_wrapper = game_manager.games[game_id]
+    updated_game_state = game_wrapper.game.get_game_state()
+    updated_game_state["type"] = "game_state_updated"
+    updated_game_state["status"] = "success"
+    updated_game_state["winner"] = winner.color.value if winner is not None else None
+
+    await websocket_manager.broadcast_game_state(game_id, updated_game_state)
+
+    if winner is not None:
+        # The game stays readable until the sweeper expires it
+        await websocket_manager.close_game(game_id)
+
+
+async def ai_move(game_id: GameID):
+    game_wrapper = game_manager.games.get(game_id)
+    if game_wrapper is None or not game_wrapper.ai_to_move:
+        return
+    game = game_wrapper.game
+    move = None
+    for _ in range(AI_ATTEMPTS):
+        try:
+            move = await ai_service.choose_move(
+                game_id, game.engine, game_wrapper.ai_time_limit
+            )
+            break
+        except Exception:
+            # A crashed worker's pool has been replaced, so try again
+            continue
+
+    # The game may have expired while the engine was thinking
+    if (
+        game_manager.games.get(game_id) is not game_wrapper
+        or not game_wrapper.ai_to_move
+    ):
+        return
+    if move is None:
+        game_wrapper.finished = True
+        await websocket_manager.broadcast_game_state(
+            game_id,
+            {
+                "type": "error",
+                "status": "error",
+                "message": "The engine failed to move, so the game is over.",
+            },
+        )
+        await websocket_manager.close_game(game_id)
+        return
+    if move not in game.legal_moves():
+        # Only possible when there is no move at all, which can't happen in
+        # a game that isn't over
+        return
+    winner = await game_manager.play_move(game_id, move)
+    await announce_move(game_id, winner)
+
+
+def schedule_ai_move(game_id: GameID):
+    game_wrapper = game_manager.games.get(game_id)
+    if game_wrapper is not None and game_wrapper.ai_to_move:
+        task = asyncio.get_running_loop().create_task(ai_move(game_id))
+        ai_tasks.add(task)
+        task.add_done_callback(ai_tasks.discard)
+
+
 @app.post("/create_game")
-def create_game():
+async def create_game():
     game_id = game_manager.create_game()
     player = game_manager.join_game(game_id)
 
     return {"game_id": game_id, "player": player}
 
 
+@app.post("/create_ai_game")
+async def create_ai_game(ai_color: Optional[int] = None, time_limit: float = 1.0):
+    """Starts a game against the engine, which plays ai_color (a random colour
+    by default) and thinks for time_limit seconds per move."""
+    if ai_color is None:
+        color = random.choice([Color.RED, Color.BLUE])
+    else:
+        try:
+            color = Color(ai_color)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Unknown colour") from None
+    if not 0 < time_limit <= ai_service.max_time:
+        raise HTTPException(
+            status_code=400,
+            detail=f"The time limit must be between 0 and {ai_service.max_time} seconds",
+        )
+    game_id, player = game_manager.create_ai_game(color, time_limit)
+    schedule_ai_move(game_id)
+
+    return {"game_id": game_id, "player": player}
+
+
 @app.post("/join_game/{game_id}")
-def join_game(game_id: GameID):
+async def join_game(game_id: GameID):
     player = game_manager.join_game(game_id)
 
     return {"game_id": game_id, "player": player}
 
 
 @app.get("/game_state/{game_id}")
-def game_state(game_id: GameID):
+async def game_state(game_id: GameID):
     game = game_manager.get_game(game_id)
 
     return game.get_game_state()
@@ -143,9 +937,7 @@ def game_state(game_id: GameID):
 
 @app.post("/start_game/{game_id}")
 async def start_game(game_id: GameID, player_id: PlayerID):
-    game_wrapper = game_manager.games.get(game_id)
-    if not game_wrapper:
-        raise HTTPException(status_code=404, detail="Game not found")
+    game_wrapper = game_manager.get_game_wrapper(game_id)
 
     if not game_wrapper.is_full:
         raise HTTPException(
@@ -157,7 +949,7 @@ async def start_game(game_id: GameID, player_id: PlayerID):
             status_code=403, detail="You are not allowed to start the game."
         )
 
-    game_wrapper.start()
+    game_manager.start_game(game_id)
 
     start_message = {
         "type": "game_started",
@@ -171,22 +963,127 @@ async def start_game(game_id: GameID, player_id: PlayerID):
     return {"status": "success", "message": "The game has been started"}
 
 
+@app.get("/game_stats")
+async def game_stats():
+    return {"worker": game_manager.shard, **game_manager.stats()}
+
+
+@app.get("/websocket_stats")
+def websocket_stats():
+    return {"worker": game_manager.shard, **websocket_manager.stats()}
+
+
+@app.get("/ai_stats")
+def ai_stats():
+    return {
+        "worker": game_manager.shard,
+        **ai_service.stats(),
+        "analysis": analyzer.stats(),
+    }
+
+
+@app.get("/metrics")
+def metrics():
+    return Response(registry.render(), media_type=CONTENT_TYPE)
+
+
+def parse_position(position: str) -> Bitboard:
+    """Reads a position in the text encoding or the hex of the binary one."""
+    try:
+        return decode_text(position)
+    except ValueError:
+        try:
+            return decode_binary(bytes.fromhex(position))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid position") from None
+
+
+@app.get("/analyze")
+async def analyze(position: str):
+    """Scores every legal move of a position, best first, from the side to
+    move's point of view."""
+    board = parse_position(position)
+    if board.winner is not None:
+        raise HTTPException(status_code=400, detail="The game is already over")
+
+    return await analyzer.analyze(board)
+
+
+@app.get("/position_stats")
+async def position_stats(position: str):
+    """Counts the stored games through a position and how each reply from it
+    turned out for the side that played it."""
+    store = game_manager.store
+    if store is None:
+        raise HTTPException(status_code=404, detail="No game store is configured")
+    board = parse_position(position)
+
+    games, replies = await asyncio.to_thread(
+        lambda: (store.count_reaching(board), store.replies(board))
+    )
+    return {
+        "position": encode_text(board),
+        "games": games,
+        "replies": [
+            {
+                "move": move_to_json(reply.move),
+                "games": reply.games,
+                "wins": reply.wins,
+                "losses": reply.losses,
+            }
+            for reply in replies
+        ],
+    }
+
+
 @app.websocket("/ws/{game_id}")
 async def websocket_endpoint(websocket: WebSocket, game_id: GameID):
-    game_wrapper = game_manager.get_game(game_id)
-    game = game_wrapper.game
-    if not game:
+    game_wrapper = game_manager.games.get(game_id)
+    if not game_wrapper or game_wrapper.finished:
+        await websocket.close(code=1008)
         return
+    game_manager.touch(game_id)
+    game = game_wrapper.game
 
     await websocket_manager.connect(websocket, game_id)
 
     try:
         while True:
-            ws_msg = await websocket.receive_json()
-            move_input = ws_msg["move_input"]
-            player_id = UUID(ws_msg["player_id"])
+            try:
+                ws_msg = await websocket.receive_json()
+                received_at = time.perf_counter()
+                move_input = ws_msg["move_input"]
+                player_id = UUID(ws_msg["player_id"])
+                card_name = move_input["card_name"]
+                x, y = move_input["x"], move_input["y"]
+                nx, ny = move_input["nx"], move_input["ny"]
+            except (KeyError, TypeError, ValueError):
+                # ValueError covers text that isn't JSON and malformed ids
+                await websocket.send_json(
+                    {
+                        "type": "error",
+                        "status": "error",
+                        "message": "Malformed message.",
+                    }
+                )
+                continue
+
+            if game_wrapper.finished:
+                # The winning move may still be on its way to the journal
+                # and the sockets, with the turn already passed on
+                await websocket.send_json(
+                    {
+                        "type": "error",
+                        "status": "error",
+                        "message": "The game is over.",
+                    }
+                )
+                message_seconds.observe(
+                    time.perf_counter() - received_at, outcome="not_your_turn"
+                )
+                continue
 
-            if player_id != game_wrapper.current_player:
+            if not game_wrapper.started or player_id != game_wrapper.current_player:
                 await websocket.send_json(
                     {
                         "type": "error",
@@ -194,49 +1091,46 @@ async def websocket_endpoint(websocket: WebSocket, game_id: GameID):
                         "message": "It's not your turn.",
                     }
                 )
+                message_seconds.observe(
+                    time.perf_counter() - received_at, outcome="not_your_turn"
+                )
                 continue
 
-            valid_move, msg = game.validate_input(
-                move_input["card_name"],
-                move_input["x"],
-                move_input["y"],
-                move_input["nx"],
-                move_input["ny"],
-            )
+            valid_move, msg = game.validate_input(f"{card_name} {x} {y} {nx} {ny}")
+            if valid_move:
+                # The name is only read here, the engine works with ids
+                card = CARD_IDS[card_name]
+                sq, to_sq = square(int(x), int(y)), square(int(nx), int(ny))
+                if (card, to_sq) not in game.engine.get_valid_moves(sq):
+                    valid_move, msg = False, "Invalid move. Please try again."
 
             if not valid_move:
                 await websocket.send_json(
                     {"type": "error", "status": "error", "message": msg}
                 )
-            else:
-                winner = game.make_move(
-                    move_input["card_name"],
-                    move_input["x"],
-                    move_input["y"],
-                    move_input["nx"],
-                    move_input["ny"],
+                message_seconds.observe(
+                    time.perf_counter() - received_at, outcome="rejected"
                 )
-
-                updated_game_state = game.get_game_state()
-                updated_game_state["type"] = "game_state_updated"
-                updated_game_state["status"] = "success"
-                updated_game_state["winner"] = winner
-
-                await websocket_manager.broadcast_game_state(
-                    game_id, updated_game_state
+            else:
+                move = encode_move(card, sq, to_sq)
+                winner = await game_manager.play_move(game_id, move)
+                await announce_move(game_id, winner)
+                message_seconds.observe(
+                    time.perf_counter() - received_at, outcome="move"
                 )
-
                 if winner is not None:
                     break
+                schedule_ai_move(game_id)
 
     except WebSocketDisconnect:
-        await websocket_manager.disconnect(websocket, game_id)
+        pass
     finally:
-        # Clean up the game state and active connections when the game finishes
-        game_manager.remove_game(game_id)
-        if game_id in websocket_manager.active_connections:
-            del websocket_manager.active_connections[game_id]
+        await websocket_manager.disconnect(websocket, game_id)
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    parser = argparse.ArgumentParser(prog="python server.py")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port)
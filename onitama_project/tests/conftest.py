@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Add the project directory to the Python path, as the server scripts do
+sys.path.append(str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,93 @@
+import random
+
+import numpy as np
+import pytest
+
+from onitama_engine import batch, evaluation
+from onitama_engine.batch import (
+    MOVES_PER_SLOT,
+    NUM_ACTIONS,
+    PASS_ACTION,
+    BatchOnitama,
+    _bit_count_by_bytes,
+)
+from onitama_engine.bitboard import NUM_SQUARES, Bitboard, decode_move, is_pass
+
+SEEDS = range(8)
+
+
+@pytest.fixture(params=["native", "bytes"])
+def popcount(request, monkeypatch):
+    if request.param == "bytes":
+        monkeypatch.setattr(batch, "bit_count", _bit_count_by_bytes)
+        monkeypatch.setattr(evaluation, "bit_count", _bit_count_by_bytes)
+    elif not hasattr(np, "bitwise_count"):
+        pytest.skip("NumPy has no bitwise_count")
+    return batch.bit_count
+
+
+def action_of(board: Bitboard, move: int) -> int:
+    card, sq, to_sq = decode_move(move)
+    slot = board.hands[board.turn].index(card)
+    if is_pass(move):
+        return PASS_ACTION + slot
+    return slot * MOVES_PER_SLOT + sq * NUM_SQUARES + to_sq
+
+
+def same_state(games: BatchOnitama, boards) -> bool:
+    expected = BatchOnitama.from_bitboards(boards)
+    return (
+        np.array_equal(games.boards, expected.boards)
+        and np.array_equal(games.cards, expected.cards)
+        and np.array_equal(games.turns, expected.turns)
+        and np.array_equal(games.winners, expected.winners)
+    )
+
+
+@pytest.mark.parametrize("dtype", [np.int32, np.int64])
+def test_bit_count(popcount, dtype):
+    rng = np.random.default_rng(0)
+    masks = rng.integers(0, 1 << 25, size=(50, 3)).astype(dtype)
+    expected = [[bin(int(mask)).count("1") for mask in row] for row in masks]
+    assert popcount(masks).tolist() == expected
+
+
+def test_legal_mask_and_step_match_bitboard(popcount):
+    rng = random.Random(0)
+    boards = [Bitboard.deal(random.Random(seed)) for seed in SEEDS]
+    games = BatchOnitama.from_bitboards(boards)
+    for _ in range(60):
+        mask = games.legal_mask()
+        assert mask.shape == (len(boards), NUM_ACTIONS)
+        actions = np.full(len(boards), PASS_ACTION)
+        for game, board in enumerate(boards):
+            if board.winner is not None:
+                assert not mask[game].any()
+                continue
+            moves = board.legal_moves()
+            assert set(np.flatnonzero(mask[game])) == {
+                action_of(board, move) for move in moves
+            }
+            move = rng.choice(moves)
+            actions[game] = action_of(board, move)
+            board.push(move)
+        games.step(actions)
+        assert same_state(games, boards)
+
+
+def test_random_actions_are_legal(popcount):
+    games = BatchOnitama.from_seeds(SEEDS)
+    rng = np.random.default_rng(1)
+    while not games.done.all() and games.plies.max() < 100:
+        actions = games.random_actions(rng)
+        playing = np.flatnonzero(~games.done)
+        assert games.legal_mask()[playing, actions[playing]].all()
+        games.step(actions)
+
+
+def test_rollout(popcount):
+    games = BatchOnitama.from_seeds(range(64))
+    winners = games.rollout(np.random.default_rng(2), max_plies=30)
+    assert set(winners.tolist()) <= {batch.NO_WINNER, 0, 1}
+    assert ((winners != batch.NO_WINNER) | (games.plies == 30)).all()
+    assert (games.plies <= 30).all()
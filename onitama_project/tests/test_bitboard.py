@@ -0,0 +1,56 @@
+import random
+
+import pytest
+
+from onitama_engine.bitboard import Bitboard
+
+
+def snapshot(board: Bitboard) -> tuple:
+    return (
+        list(board.students),
+        list(board.masters),
+        [list(hand) for hand in board.hands],
+        board.neutral_card,
+        board.turn,
+        board.hash,
+        list(board.master_squares),
+        list(board.piece_counts),
+        board.winner,
+    )
+
+
+def tracked(board: Bitboard) -> tuple:
+    return list(board.master_squares), list(board.piece_counts), board.winner
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_push_keeps_hash_and_tracked_fields(seed):
+    rng = random.Random(seed)
+    board = Bitboard.deal(rng)
+    while board.winner is None and len(board.history) < 200:
+        board.push(rng.choice(board.legal_moves()))
+        assert board.hash == board.compute_hash()
+
+        copy = Bitboard(
+            board.hands[0] + board.hands[1] + [board.neutral_card], board.turn
+        )
+        copy.students = list(board.students)
+        copy.masters = list(board.masters)
+        copy.sync()
+        assert tracked(copy) == tracked(board)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_pop_restores_every_position(seed):
+    rng = random.Random(seed)
+    board = Bitboard.deal(rng)
+    states = []
+    while board.winner is None and len(board.history) < 200:
+        move = rng.choice(board.legal_moves())
+        states.append((snapshot(board), move))
+        board.push(move)
+
+    for state, move in reversed(states):
+        assert board.pop() == move
+        assert snapshot(board) == state
+    assert board.history == [] and board.hash_history == []
@@ -0,0 +1,81 @@
+import random
+
+import pytest
+
+from onitama_engine.bitboard import BLUE, RED, Bitboard
+from onitama_engine.book import (
+    OpeningBook,
+    board_deal_key,
+    build_deal,
+    canonical_deal,
+    deal_key,
+    opening_positions,
+    write,
+)
+from onitama_engine.symmetry import MIRROR, SWAP, transform_move, transform_position
+
+PLIES = 2
+SEEDS = (0, 1, 2)
+
+
+def deal_of(seed: int):
+    board = Bitboard.deal(random.Random(seed))
+    return board.hands[RED] + board.hands[BLUE] + [board.neutral_card], board.turn
+
+
+@pytest.fixture(scope="module")
+def book(tmp_path_factory):
+    records = {}
+    for seed in SEEDS:
+        cards, turn = canonical_deal(*deal_of(seed))
+        group = records.setdefault(deal_key(cards), {})
+        for record in build_deal((cards, turn, PLIES, 2, 1 << 12)):
+            group[record[0]] = record
+    path = tmp_path_factory.mktemp("book") / "book.bin"
+    write(str(path), records)
+    book = OpeningBook(str(path))
+    yield book
+    book.close()
+
+
+def test_book_covers_the_openings(book):
+    assert book.deal_count == len(SEEDS)
+    for seed in SEEDS:
+        board = Bitboard(*deal_of(seed))
+        for position in opening_positions(board, PLIES):
+            assert book.move(position) in position.legal_moves()
+
+
+@pytest.mark.parametrize("transform", [MIRROR, SWAP, MIRROR | SWAP])
+def test_symmetric_twins_share_entries(book, transform):
+    board = Bitboard(*deal_of(0))
+    for position in opening_positions(board, PLIES):
+        twin = transform_position(position, transform).to_board()
+        move = book.move(twin)
+        assert move in twin.legal_moves()
+        original = transform_move(move, transform)
+        assert original in position.legal_moves()
+        assert original == book.move(position)
+        assert book.probe(twin)[1:] == book.probe(position)[1:]
+
+
+def test_deals_are_loaded_on_first_probe(tmp_path):
+    cards, turn = canonical_deal(*deal_of(5))
+    records = {
+        deal_key(cards): {r[0]: r for r in build_deal((cards, turn, 1, 1, 1 << 10))}
+    }
+    path = tmp_path / "book.bin"
+    write(str(path), records)
+    book = OpeningBook(str(path))
+    try:
+        assert not book._deals
+        board = Bitboard(cards, turn)
+        assert book.move(board) in board.legal_moves()
+        assert list(book._deals) == [board_deal_key(board)]
+
+        # A deal missing from the book is looked up once and remembered
+        other = Bitboard(*deal_of(6))
+        assert book.probe(other) is None
+        assert book._deals[board_deal_key(other)] == {}
+    finally:
+        book.close()
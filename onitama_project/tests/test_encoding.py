@@ -0,0 +1,95 @@
+import random
+
+import pytest
+
+from onitama_engine.bitboard import Bitboard
+from onitama_engine.encoding import (
+    BINARY_SIZE,
+    decode_binary,
+    decode_text,
+    encode_binary,
+    encode_text,
+)
+
+
+def same_position(first: Bitboard, second: Bitboard) -> bool:
+    return (
+        first.students == second.students
+        and first.masters == second.masters
+        and first.hands == second.hands
+        and first.neutral_card == second.neutral_card
+        and first.turn == second.turn
+        and first.hash == second.hash
+        and first.master_squares == second.master_squares
+        and first.piece_counts == second.piece_counts
+        and first.winner == second.winner
+    )
+
+
+def positions(seed: int):
+    rng = random.Random(seed)
+    board = Bitboard.deal(rng)
+    while board.winner is None and len(board.history) < 200:
+        yield board
+        board.push(rng.choice(board.legal_moves()))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_text_round_trip(seed):
+    for board in positions(seed):
+        text = encode_text(board)
+        assert same_position(decode_text(text), board)
+        assert encode_text(decode_text(text)) == text
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_binary_round_trip(seed):
+    for board in positions(seed):
+        data = encode_binary(board)
+        assert len(data) == BINARY_SIZE
+        assert same_position(decode_binary(data), board)
+        assert encode_binary(decode_binary(data)) == data
+
+
+def test_starting_position_text():
+    board = decode_text("SSMSS/5/5/5/ssmss r Tiger,Ox Crab,Monkey Eel")
+    assert board.hash == board.compute_hash()
+    assert encode_text(board) == "SSMSS/5/5/5/ssmss r Tiger,Ox Crab,Monkey Eel"
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "",
+        "SSMSS/5/5/5/ssmss r Tiger,Ox Crab,Monkey Dog",
+        "SSMSS/5/5/5/ssmss r Tiger,Ox Crab,Tiger Eel",
+        "SSMSS/5/5/5/ssmss x Tiger,Ox Crab,Monkey Eel",
+        "SSMSS/5/5/5 r Tiger,Ox Crab,Monkey Eel",
+        "SSMSS/6/5/5/ssmss r Tiger,Ox Crab,Monkey Eel",
+        "SSMMS/5/5/5/ssmss r Tiger,Ox Crab,Monkey Eel",
+        # A missing master and too many students
+        "SSSSS/5/5/5/ssmss r Tiger,Ox Crab,Monkey Eel",
+        "SSMSS/5/5/5/sssss r Tiger,Ox Crab,Monkey Eel",
+        "SSMSS/S4/5/5/ssmss r Tiger,Ox Crab,Monkey Eel",
+    ],
+)
+def test_invalid_text(text):
+    with pytest.raises(ValueError):
+        decode_text(text)
+
+
+def test_invalid_binary():
+    with pytest.raises(ValueError):
+        decode_binary(bytes(BINARY_SIZE - 1))
+    # Every card the same
+    with pytest.raises(ValueError):
+        decode_binary(bytes(BINARY_SIZE))
+
+
+def test_binary_needs_both_masters():
+    board = decode_text("SSMSS/5/5/5/ssmss r Tiger,Ox Crab,Monkey Eel")
+    board.masters[1] = 0
+    board.sync()
+    assert board.winner == 0
+    with pytest.raises(ValueError):
+        decode_binary(encode_binary(board))
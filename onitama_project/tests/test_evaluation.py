@@ -0,0 +1,57 @@
+import random
+
+import numpy as np
+import pytest
+
+from onitama_engine.bitboard import NUM_SQUARES, Bitboard
+from onitama_engine.encoding import encode_binary
+from onitama_engine.evaluation import (
+    Evaluator,
+    batch_features,
+    evaluate_batch,
+    features,
+)
+
+WEIGHTS = {
+    "students": 90,
+    "student_table": [sq % 7 - 3 for sq in range(NUM_SQUARES)],
+    "master_table": [sq // 5 * 4 for sq in range(NUM_SQUARES)],
+    "goal_distance": -12,
+    "master_attacks": -25,
+    "mobility": 3,
+}
+
+
+def random_positions(seed: int, count: int = 40) -> list:
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        board = Bitboard.deal(rng)
+        for _ in range(rng.randrange(60)):
+            if board.winner is not None:
+                break
+            board.push(rng.choice(board.legal_moves()))
+        positions.append(board)
+    return positions
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_batch_features_match_features(seed):
+    boards = random_positions(seed)
+    encoded = np.frombuffer(
+        b"".join(encode_binary(board) for board in boards), dtype=np.uint8
+    )
+    expected = np.array([features(board) for board in boards])
+    assert np.array_equal(batch_features(encoded), expected)
+
+
+@pytest.mark.parametrize("weights", [{}, WEIGHTS])
+@pytest.mark.parametrize("seed", range(5))
+def test_evaluate_batch_matches_evaluator(seed, weights):
+    boards = random_positions(seed)
+    evaluator = Evaluator(weights)
+    encoded = np.frombuffer(
+        b"".join(encode_binary(board) for board in boards), dtype=np.uint8
+    )
+    scores = evaluate_batch(encoded, weights)
+    assert scores.tolist() == [evaluator(board) for board in boards]
@@ -0,0 +1,104 @@
+import random
+
+import pytest
+
+from onitama_engine.bitboard import Bitboard
+from onitama_engine.constants import Color
+from onitama_engine.mcts import MCTS, MCTSPlayer
+
+
+def start(seed: int = 5) -> Bitboard:
+    return Bitboard.deal(random.Random(seed))
+
+
+def subtree(tree: MCTS, node: int) -> list:
+    """The moves, visits and rewards under node, breadth first."""
+    found = []
+    queue = [node]
+    for parent in queue:
+        first = tree.first_child[parent]
+        for child in range(first, first + tree.child_counts[parent]):
+            found.append((tree.moves[child], tree.visits[child], tree.rewards[child]))
+            queue.append(child)
+    return found
+
+
+@pytest.mark.parametrize(
+    "iterations, time_limit", [(None, None), (0, None), (None, 0), (0, 0), (-5, None)]
+)
+def test_search_needs_a_budget(iterations, time_limit):
+    with pytest.raises(ValueError):
+        MCTS().search(start(), iterations, time_limit)
+    with pytest.raises(ValueError):
+        MCTSPlayer(Color.RED, time_limit=time_limit, iterations=iterations)
+
+
+def test_search_by_time_alone():
+    board = start()
+    assert MCTS().search(board, time_limit=0.05) in board.legal_moves()
+
+
+def test_fixed_iterations_are_deterministic():
+    results = []
+    for _ in range(2):
+        tree = MCTS(rng=random.Random(11))
+        move = tree.search(start(), iterations=400)
+        results.append((move, tree.root_statistics(), len(tree)))
+    assert results[0] == results[1]
+    assert sum(visits for _, visits, _ in results[0][1]) == 400
+
+
+def test_best_move_needs_an_expanded_root():
+    with pytest.raises(ValueError):
+        MCTS().best_move()
+
+
+def test_follow_keeps_the_subtree():
+    board = start()
+    tree = MCTS(rng=random.Random(3))
+    tree.search(board, iterations=2000)
+    history_length = len(board.history)
+
+    # Follow the most visited reply to the most visited move, so the kept
+    # subtree is more than one level deep
+    move = tree.best_move()
+    first = tree.first_child[0]
+    child = next(
+        node
+        for node in range(first, first + tree.child_counts[0])
+        if tree.moves[node] == move
+    )
+    first = tree.first_child[child]
+    grandchild = max(
+        range(first, first + tree.child_counts[child]),
+        key=tree.visits.__getitem__,
+    )
+    reply = tree.moves[grandchild]
+    expected_visits = tree.visits[grandchild]
+    expected = subtree(tree, grandchild)
+    assert expected
+
+    board.push(move)
+    board.push(reply)
+    tree.follow(board, history_length)
+    assert tree.root_hash == board.hash
+    assert tree.visits[0] == expected_visits
+    assert subtree(tree, 0) == expected
+    assert len(tree) == len(expected) + 1
+
+    # The kept statistics are built on rather than thrown away
+    tree.search(board, iterations=100)
+    assert tree.visits[0] == expected_visits + 100
+    assert tree.best_move() in board.legal_moves()
+
+
+def test_follow_resets_on_an_unexpanded_move():
+    board = start()
+    tree = MCTS(rng=random.Random(3))
+    tree.search(board, iterations=1)
+    history_length = len(board.history)
+    board.push(board.legal_moves()[0])
+    board.push(board.legal_moves()[0])
+    tree.follow(board, history_length)
+    assert tree.root_hash is None
+    assert len(tree) == 1
@@ -0,0 +1,43 @@
+import pytest
+
+from onitama_engine import Onitama
+from onitama_engine.bitboard import MOVE_MASK, decode_move, encode_move
+
+
+def test_make_move_rejects_unknown_card():
+    game = Onitama(seed=1)
+    with pytest.raises(ValueError, match="Dragonfly"):
+        game.make_move("Dragonfly", 2, 0, 2, 1)
+    assert not game.engine.history
+
+
+def test_make_move_rejects_card_of_other_player():
+    game = Onitama(seed=1)
+    waiting = game.engine.hands[1 - game.engine.turn][0]
+    with pytest.raises(ValueError, match=game.cards[waiting].name):
+        game.make_move(game.cards[waiting].name, 2, 0, 2, 1)
+    assert not game.engine.history
+
+
+def test_make_move_plays_legal_move():
+    game = Onitama(seed=1)
+    card, sq, to_sq = decode_move(game.legal_moves()[0])
+    game.make_move(game.cards[card].name, sq % 5, sq // 5, to_sq % 5, to_sq // 5)
+    assert game.engine.history[-1] & MOVE_MASK == encode_move(card, sq, to_sq)
+
+
+@pytest.mark.parametrize(
+    "x, y, nx, ny",
+    [
+        (2, 2, 2, 3),  # an empty square
+        (0, 0, 4, 4),  # further than any card reaches
+    ],
+)
+def test_make_move_rejects_illegal_moves(x, y, nx, ny):
+    game = Onitama(seed=1)
+    key = game.engine.hash
+    card = game.engine.hands[game.engine.turn][0]
+    with pytest.raises(ValueError):
+        game.make_move(game.cards[card].name, x, y, nx, ny)
+    assert not game.engine.history
+    assert game.engine.hash == key == game.engine.compute_hash()
@@ -0,0 +1,28 @@
+import random
+
+import pytest
+
+from onitama_engine.bitboard import Bitboard
+from onitama_engine.perft import REFERENCE_COUNTS, legacy_game, legacy_perft, perft
+
+
+@pytest.mark.parametrize("seed", sorted(REFERENCE_COUNTS))
+def test_reference_counts(seed):
+    board = Bitboard.deal(random.Random(seed))
+    for depth, expected in enumerate(REFERENCE_COUNTS[seed][:3], start=1):
+        assert perft(board, depth) == expected
+
+
+@pytest.mark.parametrize("seed", sorted(REFERENCE_COUNTS))
+def test_matches_legacy_engine(seed):
+    board = Bitboard.deal(random.Random(seed))
+    for depth in (1, 2, 3):
+        assert legacy_perft(legacy_game(board), depth) == perft(board, depth)
+
+
+def test_perft_leaves_the_board_unchanged():
+    board = Bitboard.deal(random.Random(0))
+    before = (list(board.students), list(board.masters), board.hash)
+    perft(board, 3)
+    assert (board.students, board.masters, board.hash) == before
+    assert board.history == []
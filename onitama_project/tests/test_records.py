@@ -0,0 +1,150 @@
+import io
+import json
+import random
+
+import pytest
+
+from onitama_engine.bitboard import BLUE, RED, Bitboard
+from onitama_engine.records import (
+    RECORD_HEADER,
+    GameRecord,
+    GameStore,
+    ReplyStats,
+    load_records,
+    read_records,
+    write_records,
+)
+from onitama_engine.selfplay import play_game
+
+OPTIONS = {
+    "max_plies": 200,
+    "depth": 1,
+    "time": None,
+    "table_size": 1 << 10,
+    "iterations": None,
+    "book": None,
+    "weights": None,
+}
+
+
+def selfplay(seed: int) -> dict:
+    return play_game((seed, seed, "random", "random", OPTIONS))
+
+
+def random_game(seed: int, move_seed: int) -> GameRecord:
+    """A game from seed's deal whose moves come from another generator."""
+    board = Bitboard.deal(random.Random(seed))
+    start = board.hands[RED] + board.hands[BLUE] + [board.neutral_card]
+    turn = board.turn
+    rng = random.Random(move_seed)
+    moves = []
+    while board.winner is None and len(moves) < 200:
+        moves.append(rng.choice(board.legal_moves()))
+        board.push(moves[-1])
+    return GameRecord(tuple(start), turn, tuple(moves), board.winner, seed)
+
+
+@pytest.fixture(scope="module")
+def records():
+    # Two self-play games, and three more from the first one's deal so
+    # that positions are shared between games
+    played = [GameRecord.from_selfplay(selfplay(seed)) for seed in (0, 1)]
+    return played + [random_game(0, move_seed) for move_seed in (10, 11, 12)]
+
+
+def test_header_size():
+    assert RECORD_HEADER.size == 17
+
+
+def test_record_round_trip(records):
+    for record in records + [records[0]._replace(winner=None, seed=None)]:
+        data = record.encode()
+        assert len(data) == RECORD_HEADER.size + 2 * len(record.moves)
+        assert GameRecord.decode(data) == record
+
+
+def test_record_replays_the_game(records):
+    result = selfplay(1)
+    record = records[1]
+    assert record.start().hash == Bitboard.deal(random.Random(1)).hash
+    boards = list(record.positions())
+    assert [move for _, move in boards] == result["moves"] + [None]
+    final = boards[-1][0]
+    assert len(final.history) == result["plies"]
+    assert record.winner == (
+        None if result["winner"] is None else ["red", "blue"].index(result["winner"])
+    )
+    assert final.winner == record.winner
+
+
+def test_stream_round_trip(records):
+    stream = io.BytesIO()
+    assert write_records(stream, records[:2]) == 2
+    # Appending doesn't repeat the magic
+    assert write_records(stream, records[2:]) == len(records) - 2
+    data = stream.getvalue()
+    assert list(read_records(io.BytesIO(data))) == records
+    # A record cut short by an interrupted write is left out
+    assert list(read_records(io.BytesIO(data[:-1]))) == records[:-1]
+    with pytest.raises(ValueError):
+        list(read_records(io.BytesIO(b"not a record stream")))
+
+
+def test_load_records(tmp_path, records):
+    stream_path = tmp_path / "games.bin"
+    with open(stream_path, "wb") as stream:
+        write_records(stream, records)
+    assert list(load_records(str(stream_path))) == records
+
+    lines_path = tmp_path / "games.jsonl"
+    lines_path.write_text("".join(json.dumps(selfplay(seed)) + "\n" for seed in (0, 1)))
+    assert list(load_records(str(lines_path))) == records[:2]
+
+
+def expected_replies(records, ids, board):
+    """Brute-force reply statistics: the first move each game played from
+    the position and how it ended for the side that played it."""
+    stats = {}
+    games = []
+    for game, record in zip(ids, records):
+        for position, move in record.positions():
+            if position.hash == board.hash:
+                games.append(game)
+                if move is not None:
+                    played, wins, losses = stats.get(move, (0, 0, 0))
+                    stats[move] = (
+                        played + 1,
+                        wins + (record.winner == board.turn),
+                        losses + (record.winner == 1 - board.turn),
+                    )
+                break
+    replies = [ReplyStats(move, *counts) for move, counts in stats.items()]
+    replies.sort(key=lambda reply: (-reply.games, reply.move))
+    return sorted(games), replies
+
+
+def test_game_store_queries(tmp_path, records):
+    with GameStore(str(tmp_path / "games.sqlite")) as store:
+        ids = store.add(records)
+        assert len(store) == len(records)
+        assert [store.get(game) for game in ids] == records
+        assert list(store.records(batch_size=2)) == records
+        with pytest.raises(KeyError):
+            store.get(max(ids) + 1)
+
+        for board, _ in records[2].positions():
+            games, replies = expected_replies(records, ids, board)
+            assert sorted(store.games_reaching(board)) == games
+            assert store.count_reaching(board) == len(games)
+            assert store.replies(board) == replies
+            if len(board.history) == 3:
+                break
+
+        start = records[0].start()
+        assert store.count_reaching(start) == 4
+        reversed_cards = list(reversed(records[0].cards))
+        assert sorted(store.games_with_cards(reversed_cards)) == [
+            ids[0],
+            *ids[2:],
+        ]
+        assert store.games_like(records[1].start()) == [ids[1]]
@@ -0,0 +1,174 @@
+import asyncio
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
+from uuid import UUID, uuid4
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from onitama_engine.bitboard import decode_move, square_coords
+from onitama_engine.card import CARD_NAMES
+from onitama_server import server
+from onitama_server.ai import AIService
+
+
+@pytest.fixture
+def client():
+    with TestClient(server.app) as client:
+        yield client
+
+
+@pytest.fixture
+def broken_engine(monkeypatch):
+    searches = []
+
+    async def choose_move(key, board, time_limit):
+        searches.append(key)
+        raise RuntimeError("worker crashed")
+
+    monkeypatch.setattr(server.ai_service, "choose_move", choose_move)
+    return searches
+
+
+def wait_for_ai():
+    deadline = time.monotonic() + 5
+    while server.ai_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not server.ai_tasks
+
+
+def move_message(player_id, move):
+    card, sq, to_sq = decode_move(move)
+    x, y = square_coords(sq)
+    nx, ny = square_coords(to_sq)
+    return {
+        "player_id": str(player_id),
+        "move_input": {
+            "card_name": CARD_NAMES[card],
+            "x": x,
+            "y": y,
+            "nx": nx,
+            "ny": ny,
+        },
+    }
+
+
+def human_first_ai_game(client):
+    """Creates AI games until one has the human to move."""
+    for attempt in range(20):
+        color = 1 + attempt % 2
+        response = client.post(
+            "/create_ai_game", params={"ai_color": color, "time_limit": 0.1}
+        ).json()
+        game_id = UUID(response["game_id"])
+        game_wrapper = server.game_manager.games[game_id]
+        if game_wrapper.current_player == UUID(response["player"]["id"]):
+            return game_id, game_wrapper
+    raise AssertionError("the engine always moved first")
+
+
+def test_failed_engine_ends_the_game(client, broken_engine):
+    game_id, game_wrapper = human_first_ai_game(client)
+    wait_for_ai()
+    with client.websocket_connect(f"/ws/{game_id}") as websocket:
+        move = game_wrapper.game.legal_moves()[0]
+        websocket.send_json(move_message(game_wrapper.current_player, move))
+        assert websocket.receive_json()["type"] == "game_state_updated"
+        error = websocket.receive_json()
+        assert error["type"] == "error"
+        assert "engine" in error["message"]
+        with pytest.raises(WebSocketDisconnect):
+            websocket.receive_json()
+    wait_for_ai()
+    assert broken_engine.count(game_id) == server.AI_ATTEMPTS
+    assert game_wrapper.finished
+
+
+def test_ai_service_replaces_a_broken_pool():
+    async def crash_then_work():
+        service = AIService(workers=1)
+        try:
+            with pytest.raises(BrokenProcessPool):
+                await service.run("game", os._exit, 1)
+            return await service.run("game", abs, -3)
+        finally:
+            service.shutdown()
+
+    assert asyncio.run(crash_then_work()) == 3
+
+
+def test_moves_after_the_end_are_rejected(client):
+    created = client.post("/create_game").json()
+    game_id = created["game_id"]
+    client.post(f"/join_game/{game_id}")
+    client.post(f"/start_game/{game_id}", params={"player_id": created["player"]["id"]})
+    game_wrapper = server.game_manager.games[UUID(game_id)]
+    game = game_wrapper.game
+    with client.websocket_connect(f"/ws/{game_id}") as websocket:
+        # As between a winning move and the game's sockets closing
+        game_wrapper.finished = True
+        websocket.send_json(
+            move_message(game_wrapper.current_player, game.legal_moves()[0])
+        )
+        assert websocket.receive_json() == {
+            "type": "error",
+            "status": "error",
+            "message": "The game is over.",
+        }
+    assert not game.engine.history
+
+
+class StalledSocket:
+    """A client that stopped reading: sends and closes never finish."""
+
+    def __init__(self):
+        self.close_codes = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        await asyncio.Event().wait()
+
+    async def close(self, code=1000):
+        self.close_codes.append(code)
+        await asyncio.Event().wait()
+
+
+class ReadingSocket:
+    def __init__(self):
+        self.messages = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        self.messages.append(message)
+
+    async def close(self, code=1000):
+        pass
+
+
+def test_dropping_a_stalled_client_does_not_block_broadcasts():
+    async def broadcast_past_a_stalled_client():
+        manager = server.WebSocketManager(max_queue=2, send_timeout=0.2)
+        stalled, reading = StalledSocket(), ReadingSocket()
+        game_id = uuid4()
+        await manager.connect(stalled, game_id)
+        await manager.connect(reading, game_id)
+        for number in range(5):
+            await asyncio.wait_for(
+                manager.broadcast_game_state(game_id, {"type": "chat", "n": number}),
+                0.05,
+            )
+            await asyncio.sleep(0)
+        # The stalled send times out, then the sender closes the socket
+        await asyncio.sleep(0.3)
+        return manager, stalled, reading
+
+    manager, stalled, reading = asyncio.run(broadcast_past_a_stalled_client())
+    assert manager.dropped == 1
+    assert stalled.close_codes == [1013]
+    assert len(reading.messages) == 5
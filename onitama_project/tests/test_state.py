@@ -0,0 +1,62 @@
+import pickle
+import random
+
+import pytest
+
+from onitama_engine.bitboard import Bitboard
+from onitama_engine.evaluation import Evaluator
+from onitama_engine.state import GameState
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_apply_matches_push(seed):
+    rng = random.Random(seed)
+    board = Bitboard.deal(rng)
+    state = GameState.from_board(board)
+    while board.winner is None and len(board.history) < 200:
+        assert sorted(state.legal_moves()) == sorted(board.legal_moves())
+        move = rng.choice(board.legal_moves())
+        child = state.fork().apply(move)
+        board.push(move)
+
+        assert child == GameState.from_board(board)
+        assert child.hash == board.hash == child.compute_hash()
+        assert child.winner == board.winner
+        assert child.master_squares == tuple(board.master_squares)
+        assert child.piece_counts == tuple(board.piece_counts)
+        state = child
+
+
+def test_apply_leaves_the_state_alone():
+    board = Bitboard.deal(random.Random(0))
+    state = GameState.from_board(board)
+    before = (state.students, state.masters, state.hands, state.hash)
+    for move in state.legal_moves():
+        state.apply(move)
+    assert (state.students, state.masters, state.hands, state.hash) == before
+    assert state.fork() is state
+    with pytest.raises(AttributeError):
+        state.turn = 1
+
+
+def test_to_board_and_pickle():
+    rng = random.Random(1)
+    board = Bitboard.deal(rng)
+    for _ in range(6):
+        board.push(rng.choice(board.legal_moves()))
+    state = GameState.from_board(board)
+
+    rebuilt = state.to_board()
+    assert GameState.from_board(rebuilt) == state
+    assert rebuilt.hash == board.hash
+    assert pickle.loads(pickle.dumps(state)) == state
+    assert {state: 1}[GameState.from_board(board)] == 1
+
+
+def test_evaluator_accepts_states():
+    evaluate = Evaluator()
+    rng = random.Random(2)
+    board = Bitboard.deal(rng)
+    while board.winner is None and len(board.history) < 100:
+        assert evaluate(GameState.from_board(board)) == evaluate(board)
+        board.push(rng.choice(board.legal_moves()))
@@ -0,0 +1,70 @@
+import random
+
+import pytest
+
+from onitama_engine.bitboard import RED, Bitboard
+from onitama_engine.card import CARD_IDS
+from onitama_engine.state import GameState
+from onitama_engine.symmetry import (
+    MIRROR_CARDS,
+    TRANSFORMS,
+    canonical,
+    transform_color,
+    transform_move,
+    transform_position,
+)
+
+
+def positions(seed: int):
+    rng = random.Random(seed)
+    board = Bitboard.deal(rng)
+    while board.winner is None and len(board.history) < 60:
+        yield board
+        board.push(rng.choice(board.legal_moves()))
+
+
+def test_mirror_cards():
+    pairs = {
+        ("Frog", "Rabbit"),
+        ("Goose", "Rooster"),
+        ("Horse", "Ox"),
+        ("Eel", "Cobra"),
+    }
+    for first, second in pairs:
+        assert MIRROR_CARDS[CARD_IDS[first]] == CARD_IDS[second]
+        assert MIRROR_CARDS[CARD_IDS[second]] == CARD_IDS[first]
+    paired = {name for pair in pairs for name in pair}
+    for name, card in CARD_IDS.items():
+        if name not in paired:
+            assert MIRROR_CARDS[card] == card
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_transforms_commute_with_moves(seed):
+    for board in positions(seed):
+        state = GameState.from_board(board)
+        for transform in TRANSFORMS:
+            transformed = transform_position(board, transform)
+            assert transform_position(transformed, transform) == state
+            assert transformed.winner == transform_color(board.winner, transform)
+            moves = board.legal_moves()
+            assert sorted(transform_move(move, transform) for move in moves) == sorted(
+                transformed.legal_moves()
+            )
+            for move in moves[:3]:
+                board.push(move)
+                expected = transform_position(board, transform)
+                board.pop()
+                assert transformed.apply(transform_move(move, transform)) == expected
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_canonical_form_is_shared(seed):
+    for board in positions(seed):
+        representative, transform = canonical(board)
+        assert representative.turn == RED
+        assert transform_position(board, transform) == representative
+        for other in TRANSFORMS:
+            found, _ = canonical(transform_position(board, other))
+            assert found == representative
+            assert found.hash == representative.hash
@@ -0,0 +1,125 @@
+import random
+from typing import Optional
+
+import pytest
+
+from onitama_engine.bitboard import BLUE, CARD_IDS, NUM_SQUARES, RED, Bitboard
+from onitama_engine.symmetry import MIRROR, SWAP, transform_position
+from onitama_engine.tablebase import DRAW, LOSS, WIN, Tablebase, generate, write
+
+DEAL = ["Frog", "Crab", "Tiger", "Horse", "Eel"]
+# Deep enough to reach wins in three and losses in four
+BRUTE_FORCE_DEPTH = 4
+
+
+@pytest.fixture(scope="module")
+def tablebase(tmp_path_factory):
+    layout, values = generate([CARD_IDS[name] for name in DEAL], 1)
+    path = tmp_path_factory.mktemp("tablebase") / "table.bin"
+    write(str(path), layout, values)
+    table = Tablebase(str(path))
+    yield table
+    table.close()
+
+
+def random_positions(count: int, seed: int = 0):
+    """Positions of the deal with both masters, at most one student and no
+    winner yet."""
+    rng = random.Random(seed)
+    cards = [CARD_IDS[name] for name in DEAL]
+    positions = []
+    while len(positions) < count:
+        rng.shuffle(cards)
+        board = Bitboard(cards, rng.choice([RED, BLUE]))
+        squares = rng.sample(range(NUM_SQUARES), 3)
+        board.masters = [1 << squares[0], 1 << squares[1]]
+        board.students = [0, 0]
+        if rng.random() < 0.8:
+            board.students[rng.choice([RED, BLUE])] = 1 << squares[2]
+        board.sync()
+        if board.winner is None:
+            positions.append(board)
+    return positions
+
+
+def distance_to_end(board: Bitboard, depth: int) -> Optional[int]:
+    """Plies to the end of the game with perfect play, odd for a win of the
+    side to move, or None when that is more than depth."""
+    if board.winner is not None:
+        return 0
+    if not depth:
+        return None
+    win = None
+    loss = 0
+    decided = True
+    for move in board.legal_moves():
+        board.push(move)
+        distance = distance_to_end(board, depth - 1)
+        board.pop()
+        if distance is None:
+            decided = False
+        elif distance % 2 == 0:
+            win = distance + 1 if win is None else min(win, distance + 1)
+        else:
+            loss = max(loss, distance + 1)
+    if win is not None:
+        return win
+    return loss if decided else None
+
+
+def test_values_follow_from_the_children(tablebase):
+    for board in random_positions(300):
+        wins, losses, undecided = [], [], False
+        for move in board.legal_moves():
+            board.push(move)
+            if board.winner is not None:
+                result, distance = LOSS, 0
+            else:
+                result, distance = tablebase.probe(board)
+            board.pop()
+            if result == LOSS:
+                wins.append(distance + 1)
+            elif result == WIN:
+                losses.append(distance + 1)
+            else:
+                undecided = True
+        if wins:
+            expected = (WIN, min(wins))
+        elif undecided:
+            expected = (DRAW, 0)
+        else:
+            expected = (LOSS, max(losses))
+        assert tablebase.probe(board) == expected
+
+
+def test_values_match_brute_force(tablebase):
+    results = set()
+    for board in random_positions(40, seed=1):
+        result, distance = tablebase.probe(board)
+        brute = distance_to_end(board, BRUTE_FORCE_DEPTH)
+        if result != DRAW and distance <= BRUTE_FORCE_DEPTH:
+            assert brute == distance
+            assert (result == WIN) == (distance % 2 == 1)
+        else:
+            assert brute is None
+        results.add((result, min(distance, BRUTE_FORCE_DEPTH + 1)))
+    # The sample reaches both sides of the depth and both results
+    assert {(WIN, 1), (WIN, 3), (LOSS, 2)} <= results
+    assert any(distance > BRUTE_FORCE_DEPTH for _, distance in results)
+
+
+@pytest.mark.parametrize("transform", [MIRROR, SWAP, MIRROR | SWAP])
+def test_transformed_positions_probe_the_same(tablebase, transform):
+    for board in random_positions(100, seed=2):
+        twin = transform_position(board, transform).to_board()
+        if transform & SWAP:
+            assert twin.turn != board.turn
+        assert tablebase.probe(twin) == tablebase.probe(board)
+
+
+def test_uncovered_positions(tablebase):
+    board = random_positions(1, seed=3)[0]
+    board.students = [0b11, 0]
+    board.sync()
+    assert tablebase.probe(board) is None
+    assert tablebase.probe(Bitboard.deal(random.Random(4))) is None
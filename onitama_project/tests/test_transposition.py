@@ -0,0 +1,148 @@
+import random
+
+import pytest
+
+from onitama_engine.bitboard import Bitboard
+from onitama_engine.search import (
+    WIN,
+    WIN_THRESHOLD,
+    Searcher,
+    _score_from_table,
+    _score_to_table,
+)
+from onitama_engine.transposition import (
+    EXACT,
+    LOWER_BOUND,
+    UPPER_BOUND,
+    TranspositionTable,
+)
+
+
+def same_bucket(table: TranspositionTable, key: int, count: int):
+    """Keys that all fall in key's bucket."""
+    return [key + n * (table.mask + 1) for n in range(count)]
+
+
+def test_size_is_a_power_of_two():
+    table = TranspositionTable(100)
+    assert table.size == 64
+    assert table.size & table.size - 1 == 0
+
+
+def test_empty_slots_miss_even_for_key_zero():
+    table = TranspositionTable(64)
+    assert table.probe(0) is None
+    assert table.probe(12345) is None
+    assert table.misses == 2
+
+
+def test_store_and_probe():
+    table = TranspositionTable(64)
+    table.store(77, 5, -42, LOWER_BOUND, 300)
+    assert table.probe(77) == (5, -42, LOWER_BOUND, 300)
+    assert table.hits == 1 and table.stores == 1
+
+
+def test_depth_preferred_and_always_replace_slots():
+    table = TranspositionTable(64)
+    deep, shallow, newer, deeper = same_bucket(table, 9, 4)
+
+    table.store(deep, 8, 1, EXACT, 1)
+    table.store(shallow, 2, 2, EXACT, 2)
+    # The shallow entry goes to the second slot, keeping the deep one
+    assert table.probe(deep) == (8, 1, EXACT, 1)
+    assert table.probe(shallow) == (2, 2, EXACT, 2)
+
+    # The second slot is always replaced
+    table.store(newer, 3, 3, UPPER_BOUND, 3)
+    assert table.probe(shallow) is None
+    assert table.probe(deep) is not None
+    assert table.probe(newer) == (3, 3, UPPER_BOUND, 3)
+
+    # An entry searched at least as deep takes the first slot
+    table.store(deeper, 8, 4, EXACT, 4)
+    assert table.probe(deep) is None
+    assert table.probe(deeper) == (8, 4, EXACT, 4)
+    assert table.probe(newer) is not None
+
+    # The same position updates its own slot, however shallow
+    table.store(deeper, 1, 5, LOWER_BOUND, 5)
+    assert table.probe(deeper) == (1, 5, LOWER_BOUND, 5)
+    assert table.probe(newer) is not None
+
+
+def test_entries_from_an_earlier_search_give_way():
+    table = TranspositionTable(64)
+    old, new = same_bucket(table, 3, 2)
+    table.store(old, 10, 0, EXACT, 0)
+    table.new_search()
+    table.store(new, 1, 0, EXACT, 0)
+    # The stale deep entry was replaced rather than the second slot used
+    assert table.probe(new) is not None
+    assert table.probe(old) is None
+    assert table.keys[(new & table.mask) << 1] == new
+
+
+def test_generation_never_marks_slots_empty():
+    table = TranspositionTable(64)
+    seen = set()
+    for _ in range(600):
+        table.new_search()
+        seen.add(table.generation)
+    assert seen == set(range(1, 256))
+
+
+def test_clear():
+    table = TranspositionTable(64)
+    table.store(5, 3, 1, EXACT, 1)
+    table.clear()
+    assert table.probe(5) is None
+    assert table.size == 64
+
+
+@pytest.mark.parametrize("sign", [1, -1])
+def test_mate_scores_move_with_the_ply(sign):
+    table = TranspositionTable(64)
+    for stored_ply in range(0, 8):
+        for distance in range(1, 6):
+            # A win distance plies below a node at stored_ply
+            score = sign * (WIN - stored_ply - distance)
+            table.store(stored_ply, 4, _score_to_table(score, stored_ply), EXACT, 0)
+            for read_ply in range(0, 8):
+                stored = table.probe(stored_ply)[1]
+                assert _score_from_table(stored, read_ply) == sign * (
+                    WIN - read_ply - distance
+                )
+
+
+def test_other_scores_are_stored_as_they_are():
+    for score in (0, 150, -3000, WIN_THRESHOLD, -WIN_THRESHOLD):
+        assert _score_to_table(score, 6) == score
+        assert _score_from_table(score, 6) == score
+
+
+def forced_win(plies: int) -> Bitboard:
+    """A position from a random game where the side to move wins in plies."""
+    searcher = Searcher(TranspositionTable(1 << 12))
+    for seed in range(200):
+        rng = random.Random(seed)
+        board = Bitboard.deal(rng)
+        while board.winner is None:
+            result = searcher.search(board, float("inf"), plies + 1)
+            if result.score == WIN - plies:
+                return board
+            board.push(rng.choice(board.legal_moves()))
+    raise AssertionError(f"no win in {plies} found")
+
+
+def test_mate_scores_survive_the_table():
+    board = forced_win(3)
+    fresh = Searcher(TranspositionTable(1 << 12)).search(board, float("inf"), 4)
+    assert fresh.score == WIN - 3
+
+    # The same table answers again, now from entries stored at other plies
+    searcher = Searcher(TranspositionTable(1 << 12))
+    searcher.search(board, float("inf"), 4)
+    assert searcher.search(board, float("inf"), 4).score == WIN - 3
+    board.push(fresh.move)
+    assert searcher.search(board, float("inf"), 4).score == -(WIN - 2)